@@ -1,11 +1,83 @@
 
 from django.contrib.auth.decorators import user_passes_test
+from django.core.exceptions import PermissionDenied
 from django.utils.decorators import available_attrs
 from functools import wraps
 
+from account.models import Advertiser, AccountRepAdvertiser
+
+
+# user roles are Django groups (see account/migrations/0002_add_initial_groups.py)
+ROLE_ADVERTISERS = 'advertisers'
+ROLE_ACCOUNT_REPS = 'account_reps'
+ROLE_FINANCE = 'finance'
+
+
+def get_user_roles(user):
+    """
+    Return the set of group names the user belongs to.
+
+    Groups are loaded with a single query the first time they are needed and kept on the user instance, so any
+    number of authorization checks on the same request.user cost one query. Users cached across requests by
+    account.token_cache are evicted when their groups change, which also drops this cache.
+    """
+    if not user.is_authenticated():
+        return frozenset()
+    roles = getattr(user, '_roles_cache', None)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        user._roles_cache = roles
+    return roles
+
+def user_has_role(user, *roles):
+    return not get_user_roles(user).isdisjoint(roles)
+
+def user_can_access_advertiser(user, advertiser_id):
+    """
+    Whether the user may act on behalf of the given advertiser: staff, the advertiser's own user or one of its
+    account reps.
+    """
+    if user.is_superuser or user.is_staff:
+        return True
+    if user_has_role(user, ROLE_ACCOUNT_REPS) and advertiser_id in AccountRepAdvertiser.get_advertiser_ids(user.id):
+        return True
+    if user_has_role(user, ROLE_ADVERTISERS):
+        return Advertiser.objects.filter(id=advertiser_id, user_id=user.id).exists()
+    return False
+
+def accessible_advertiser_ids(user, advertiser_ids):
+    """
+    Batch version of user_can_access_advertiser: return the subset of advertiser_ids (that exist and) the user
+    may act on behalf of, with at most one query.
+    """
+    advertiser_ids = set(advertiser_ids)
+    if not advertiser_ids:
+        return set()
+    advertisers = Advertiser.objects.filter(id__in=advertiser_ids)
+    if not (user.is_superuser or user.is_staff):
+        allowed = set()
+        if user_has_role(user, ROLE_ACCOUNT_REPS):
+            allowed |= advertiser_ids & AccountRepAdvertiser.get_advertiser_ids(user.id)
+        if user_has_role(user, ROLE_ADVERTISERS):
+            allowed |= set(advertisers.filter(user_id=user.id).values_list('id', flat=True))
+        return allowed
+    return set(advertisers.values_list('id', flat=True))
+
+def authorization_scope(user):
+    """
+    A string that is the same for two users only if the API lets them see the same objects (so responses cached
+    for one can be served to the other): staff see everything, the others what their roles and, for account
+    reps, their advertisers allow.
+    """
+    if user.is_superuser or user.is_staff:
+        return 'staff'
+    scope = 'user:%s:%s' % (user.id, ','.join(sorted(get_user_roles(user))))
+    if user_has_role(user, ROLE_ACCOUNT_REPS):
+        scope += ':%s' % ','.join(str(id) for id in sorted(AccountRepAdvertiser.get_advertiser_ids(user.id)))
+    return scope
 
 def user_has_permission(user, **kwargs):
-    for perm in perms:
+    for perm in kwargs.get('perms', []):
         if not user.has_perm(perm):
             raise PermissionDenied
     return True
@@ -23,7 +95,7 @@ def user_is_superuser(user, **kwargs):
 def user_is_advertiser(user, **kwargs):
     if kwargs.get('staff_ok') and (user.is_superuser or user.is_staff):
         return True
-    if user.groups.filter(name__in=['advertisers', 'account_reps']).count() > 0:
+    if user_has_role(user, ROLE_ADVERTISERS, ROLE_ACCOUNT_REPS):
         return True
     raise PermissionDenied
 
@@ -0,0 +1,143 @@
+"""
+Buffered AuthLog writer.
+
+LoginRequiredMiddleware logs every API authentication attempt. Saving each AuthLog inline puts an INSERT on
+the hot path of every request, so in async mode entries are queued in memory and a background thread writes
+them with bulk_create, either when BATCH_SIZE entries are waiting or every FLUSH_INTERVAL seconds.
+
+The queue is bounded: when it is full new entries are dropped and counted in `dropped` rather than blocking
+the request. Whatever is still queued is flushed when the process exits.
+
+Note that AuthLog.date_used is auto_now, so buffered entries carry the flush time (at most FLUSH_INTERVAL
+late) rather than the exact request time.
+"""
+
+import os
+import atexit
+import logging
+import threading
+from Queue import Queue, Full, Empty
+
+from django.conf import settings
+from django.db import connection
+
+from account.models import AuthLog
+
+logger = logging.getLogger('log_file')
+
+
+class AuthLogWriter(object):
+
+    def __init__(self, asynchronous=True, batch_size=500, flush_interval=2.0, queue_size=10000):
+        self.asynchronous = asynchronous
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.written = 0
+        self.dropped = 0
+        self._queue = Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # written and dropped are counted by the request threads and the worker
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def write(self, authlog):
+        """
+        Store an unsaved AuthLog instance, right away in sync mode or through the queue otherwise.
+        """
+        if not self.asynchronous:
+            authlog.save()
+            self._count(written=1)
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(authlog)
+        except Full:
+            self._count(dropped=1)
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write everything queued so far. Returns the number of entries written.
+        """
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    break
+                try:
+                    AuthLog.objects.bulk_create(batch)
+                    total += len(batch)
+                except Exception:
+                    logger.exception("AuthLogWriter: could not write %s entries" % len(batch))
+                    self._count(dropped=len(batch))
+        self._count(written=total)
+        return total
+
+    def stop(self):
+        """
+        Stop the worker thread and flush what is left in the queue.
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(self.flush_interval * 2)
+        self._thread = None
+        self.flush()
+
+    def stats(self):
+        with self._stats_lock:
+            return {'queued': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped}
+
+    def _count(self, written=0, dropped=0):
+        with self._stats_lock:
+            self.written += written
+            self.dropped += dropped
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def _ensure_worker(self):
+        # a worker thread does not survive a fork, so start one per process
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # forked: entries inherited from the parent are the parent's to write
+                self._queue = Queue(maxsize=self.queue_size)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='AuthLogWriter')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                # woken up early by write() once a full batch is waiting
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                self.flush()
+        finally:
+            connection.close()
+
+
+authlog_writer = AuthLogWriter(asynchronous=getattr(settings, 'AUTHLOG_ASYNC', True),
+                               batch_size=getattr(settings, 'AUTHLOG_BATCH_SIZE', 500),
+                               flush_interval=getattr(settings, 'AUTHLOG_FLUSH_INTERVAL', 2.0),
+                               queue_size=getattr(settings, 'AUTHLOG_QUEUE_SIZE', 10000))
+atexit.register(authlog_writer.stop)
@@ -0,0 +1,70 @@
+import time
+
+from django.conf.urls import url
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpResponse
+from django.test.client import RequestFactory
+
+from provider.oauth2.models import Client, AccessToken
+
+from account.authlog import authlog_writer
+from cedar_fe.handlers import ApiWSGIHandler
+
+
+def ping(request):
+    return HttpResponse('{}', content_type='application/json')
+
+
+# the requests are resolved against this module, so only the middleware and the authentication are timed
+urlpatterns = [
+    url(r'^api/ping/$', ping),
+]
+
+
+class Command(BaseCommand):
+    help = ("Time token authenticated API requests through the complete middleware (MIDDLEWARE_CLASSES) and "
+            "through the API one (API_MIDDLEWARE_CLASSES). Runs in a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000, help="Requests per pipeline.")
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per pipeline; the best one is reported.")
+
+    def time_requests(self, handler, authorization, count):
+        factory = RequestFactory()
+        start = time.time()
+        for i in xrange(count):
+            request = factory.get('/api/ping/', HTTP_AUTHORIZATION=authorization)
+            request.urlconf = __name__
+            response = handler.get_response(request)
+            assert response.status_code == 200, response.content
+        return time.time() - start
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        asynchronous = authlog_writer.asynchronous
+        # AuthLog rows are written in the transaction, like the user and the token, so nothing is left behind
+        authlog_writer.asynchronous = False
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user('benchmark-api-middleware', 'benchmark@example.com')
+                client = Client.objects.create(user=user, name="API middleware benchmark", client_type=1,
+                                               url="http://example.com")
+                authorization = 'OAuth %s' % AccessToken.objects.create(user=user, client=client).token
+
+                results = []
+                for name, handler in [('complete', WSGIHandler()), ('api', ApiWSGIHandler())]:
+                    handler.load_middleware()
+                    self.time_requests(handler, authorization, 100)  # warm the token cache up
+                    best = min(self.time_requests(handler, authorization, count)
+                               for i in range(options['repeat']))
+                    results.append(best)
+                    self.stdout.write("%-8s middleware: %d requests in %.2f s, %.1f us/request" % (
+                        name, count, best, best * 1e6 / count))
+                self.stdout.write("saved %.1f us/request (%.0f%%)" % (
+                    (results[0] - results[1]) * 1e6 / count, 100 * (results[0] - results[1]) / results[0]))
+                transaction.set_rollback(True)
+        finally:
+            authlog_writer.asynchronous = asynchronous
@@ -5,12 +5,61 @@ from urlparse import parse_qs
 from django.conf import settings
 from django.http import HttpResponseForbidden
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import AnonymousUser
 
 from oauth20authentication import OAuth20Authentication, OAuthError
 from account.models import AuthLog
+from account.authlog import authlog_writer
 
 
-class LoginRequiredMiddleware(object):
+class ApiAuthenticationMiddleware(object):
+    """
+    OAuth access token authentication of the API requests, every attempt is logged as an AuthLog.
+
+    This is the only authentication of the API middleware (API_MIDDLEWARE_CLASSES, see cedar_fe.handlers): there
+    is no session, so request.user is anonymous until the token is verified.
+    """
+
+    def return_api_forbidden(self, message=None):
+        response = {"denied": "You do not have permission to access this resource. " + \
+                              "You may need to login or otherwise authenticate the request."}
+        if message:
+            response.update({"detail": message})
+        return HttpResponseForbidden(json.dumps(response))
+
+    def authenticate_api(self, request):
+        # get the ip address for the authlog
+        try:
+            address = request.META['HTTP_X_FORWARDED_FOR']
+        except KeyError:
+            address = request.META['REMOTE_ADDR']
+        # log the attempt
+        authlog = AuthLog()
+        authlog.ip_address = address
+        authlog.requested_url = request.get_full_path()
+
+        # api uses OAuth20
+        try:
+            if OAuth20Authentication().is_authenticated(request):
+                user = request.user
+                authlog.user = user
+                authlog.username = user.email
+                authlog.authenticated = True
+                authlog_writer.write(authlog)
+            else:
+                authlog_writer.write(authlog)
+                return self.return_api_forbidden()
+        except OAuthError as err:
+            authlog.message = err
+            authlog_writer.write(authlog)
+            return self.return_api_forbidden(message=err)
+
+    def process_view(self, request, view, *args, **kwargs):
+        request.user = AnonymousUser()
+        return self.authenticate_api(request)
+
+
+class LoginRequiredMiddleware(ApiAuthenticationMiddleware):
     """
     Middleware that requires a user to be authenticated to view any page on
     the site that hasn't been white listed. Exemptions to this requirement
@@ -23,18 +72,11 @@ class LoginRequiredMiddleware(object):
     Accounts OAuth access_token authentication.
 
     """
-    EXEMPT_URLS = [recompile(str(settings.LOGIN_URL))]
-    if hasattr(settings, 'LOGIN_EXEMPT_URLS'):
-        EXEMPT_URLS += [recompile(str(expr)) for expr in settings.LOGIN_EXEMPT_URLS]
-
-    API_URLS = ['/api/']
+    # one regular expression matching any of the exempt urls
+    EXEMPT_URLS = recompile('|'.join('(?:%s)' % expr for expr in
+                                     [str(settings.LOGIN_URL)] + list(getattr(settings, 'LOGIN_EXEMPT_URLS', ()))))
 
-    def return_api_forbidden(self, message=None):
-        response = {"denied": "You do not have permission to access this resource. " + \
-                              "You may need to login or otherwise authenticate the request."}
-        if message:
-            response.update({"detail": message})
-        return HttpResponseForbidden(json.dumps(response))
+    API_URLS = tuple(getattr(settings, 'API_URL_PREFIXES', ('/api/',)))
 
     def return_need_auth(self, request, view, args, kwargs):
         if request.is_ajax():
@@ -46,37 +88,12 @@ class LoginRequiredMiddleware(object):
         if hasattr(request, 'user') and request.user.is_authenticated():
             pass  # user is logged in, no further checking required
 
-        elif any(url in request.path_info for url in LoginRequiredMiddleware.API_URLS):
-
-            # get the ip address for the authlog
-            try:
-                address = request.META['HTTP_X_FORWARDED_FOR']
-            except KeyError:
-                address = request.META['REMOTE_ADDR']
-            # log the attempt
-            authlog = AuthLog()
-            authlog.ip_address = address
-            authlog.requested_url = request.get_full_path()
-
-            # api uses OAuth20
-            try:
-                if OAuth20Authentication().is_authenticated(request):
-                    user = request.user
-                    authlog.user = user
-                    authlog.username = user.email
-                    authlog.authenticated = True
-                    authlog.save()
-                else:
-                    authlog.save()
-                    return self.return_api_forbidden()
-            except OAuthError as err:
-                authlog.message = err
-                authlog.save()
-                return self.return_api_forbidden(message=err)
+        elif request.path_info.startswith(LoginRequiredMiddleware.API_URLS):
+            return self.authenticate_api(request)
 
         elif hasattr(request, 'user') and not request.user.is_authenticated():
             if not (getattr(view, 'login_exempt', False) or
-                    any(m.match(request.path_info) for m in LoginRequiredMiddleware.EXEMPT_URLS)):
+                    LoginRequiredMiddleware.EXEMPT_URLS.match(request.path_info)):
                 return self.return_need_auth(request, view, args, kwargs)
         elif not hasattr(request, 'user'):
             raise Exception("The Login Required middleware requires authentication middleware to be installed.")
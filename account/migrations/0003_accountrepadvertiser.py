@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('account', '0002_add_initial_groups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountRepAdvertiser',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('advertiser', models.ForeignKey(related_name='account_reps', to='account.Advertiser')),
+                ('rep', models.ForeignKey(related_name='rep_advertisers', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='accountrepadvertiser',
+            unique_together=set([('rep', 'advertiser')]),
+        ),
+    ]
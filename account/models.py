@@ -1,7 +1,13 @@
 
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 
+from cedar_fe.cache_common import shared_cache
+from cedar_fe.db_common import on_commit
+
 
 
 class UserProfile(models.Model):
@@ -42,6 +48,57 @@ class Advertiser(models.Model):
     updated = models.DateTimeField(auto_now=True)
 
 
+class AccountRepAdvertiser(models.Model):
+    """
+    Assigns an advertiser to an account rep (a user in the account_reps group).
+
+    The unique (rep, advertiser) index lets the API filter a rep's campaigns with a semi-join on this table
+    instead of building a list of advertiser ids in Python.
+    """
+    rep = models.ForeignKey(User, related_name='rep_advertisers')
+    advertiser = models.ForeignKey(Advertiser, related_name='account_reps')
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('rep', 'advertiser')
+
+    @classmethod
+    def advertiser_ids_subquery(cls, rep):
+        """
+        Queryset of the advertiser ids assigned to rep, meant to be used as `advertiser_id__in=...`
+        so it is evaluated by the db as a subquery.
+        """
+        return cls.objects.filter(rep_id=rep.id).values('advertiser_id')
+
+    CACHE_KEY = 'rep_advertiser_ids:%s'
+    CACHE_TIMEOUT = 60 * 60
+
+    @classmethod
+    def get_advertiser_ids(cls, rep_id):
+        """
+        Cached set of the advertiser ids assigned to a rep, for single-object checks. The entry is kept in
+        ACCOUNT_REP_CACHE, shared by all the processes, and dropped whenever one of the rep's assignments is saved
+        or deleted (bulk_create and queryset.update() bypass this, so don't use them on this model).
+        """
+        cache = shared_cache(getattr(settings, 'ACCOUNT_REP_CACHE', 'shared'), 'ACCOUNT_REP_CACHE')
+        key = cls.CACHE_KEY % rep_id
+        advertiser_ids = cache.get(key)
+        if advertiser_ids is None:
+            advertiser_ids = frozenset(cls.objects.filter(rep_id=rep_id).values_list('advertiser_id', flat=True))
+            cache.set(key, advertiser_ids, cls.CACHE_TIMEOUT)
+        return advertiser_ids
+
+
+@receiver([post_save, post_delete], sender=AccountRepAdvertiser, dispatch_uid='rep_advertisers_cache')
+def invalidate_rep_advertiser_ids(sender, instance, **kwargs):
+    cache = shared_cache(getattr(settings, 'ACCOUNT_REP_CACHE', 'shared'), 'ACCOUNT_REP_CACHE')
+    key = AccountRepAdvertiser.CACHE_KEY % instance.rep_id
+    cache.delete(key)
+    # and again once committed: a check racing this transaction can have cached the old set meanwhile
+    on_commit(lambda: cache.delete(key))
+
+
 class AuthLog(models.Model):
     """
     Keep track of user authentication.
@@ -15,6 +15,8 @@ from tastypie.authentication import Authentication
 import provider.oauth2
 from provider.oauth2.models import AccessToken
 
+from account.token_cache import token_cache
+
 import logging
 logger = logging.getLogger('log_file')
 
@@ -92,9 +94,17 @@ class OAuth20Authentication(Authentication):
         return True
 
 def verify_access_token(key):
+    # Verified tokens are cached (with their user) so most requests don't hit the db at all
+    token = token_cache.get(key)
+    if token is not None:
+        if token.expires < timezone.now():
+            token_cache.invalidate(key)
+            raise OAuthError('AccessToken has expired.')
+        return token
+
     # Check if key is in AccessToken key
     try:
-        token = AccessToken.objects.get(token=key)
+        token = AccessToken.objects.select_related('user').get(token=key)
 
         # Check if token has expired
         if token.expires < timezone.now():
@@ -102,5 +112,6 @@ def verify_access_token(key):
     except AccessToken.DoesNotExist, e:
         raise OAuthError("AccessToken not found at all.")
 
+    token_cache.set(token)
     logging.info('Valid access')
     return token
\ No newline at end of file
@@ -1,3 +1,201 @@
+
+import datetime
+import threading
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db import connection
 from django.test import TestCase
+from django.test.client import ClientHandler
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from provider.oauth2.models import Client, AccessToken
+
+from account.oauth20authentication import verify_access_token, OAuthError
+from account.token_cache import token_cache, AccessTokenCache
+from account.authlog import AuthLogWriter
+from account.models import AuthLog, Advertiser, AccountRepAdvertiser
+from account import auth
+from cedar_fe.handlers import MiddlewareStackMixin, PrefixDispatchWSGIHandler
+
+
+class AccessTokenCacheTest(TestCase):
+
+    def setUp(self):
+        super(AccessTokenCacheTest, self).setUp()
+        token_cache.clear()
+        token_cache.reset_stats()
+        self.user = User.objects.create_user('tokenuser', 'tokenuser@example.com', 'tokenpass')
+        self.client_app = Client.objects.create(user=self.user, name="Token cache tester", client_type=1,
+                                                url="http://example.com")
+        self.token = AccessToken.objects.create(user=self.user, client=self.client_app)
+
+    def test_second_verification_hits_cache(self):
+        with self.assertNumQueries(1):
+            token = verify_access_token(self.token.token)
+            self.assertEqual(token.user.id, self.user.id)
+        with self.assertNumQueries(0):
+            token = verify_access_token(self.token.token)
+            self.assertEqual(token.user.id, self.user.id)
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_revoked_token_is_evicted(self):
+        verify_access_token(self.token.token)
+        self.token.expires = timezone.now() - datetime.timedelta(days=1)
+        self.token.save()
+        self.assertRaises(OAuthError, verify_access_token, self.token.token)
+
+    def test_deleted_token_is_evicted(self):
+        verify_access_token(self.token.token)
+        key = self.token.token
+        self.token.delete()
+        self.assertRaises(OAuthError, verify_access_token, key)
+
+    def test_user_change_evicts_tokens(self):
+        verify_access_token(self.token.token)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(token_cache.stats()['size'], 0)
+        self.assertTrue(verify_access_token(self.token.token).user.is_staff)
+
+    def test_entry_does_not_outlive_token(self):
+        self.token.expires = timezone.now() + datetime.timedelta(seconds=-1)
+        cache = AccessTokenCache(max_size=10, ttl=60)
+        cache.set(self.token)
+        self.assertEqual(cache.get(self.token.token), None)
+
+    def test_lru_bound(self):
+        cache = AccessTokenCache(max_size=2, ttl=60)
+        tokens = [AccessToken.objects.create(user=self.user, client=self.client_app) for i in range(3)]
+        for token in tokens:
+            cache.set(token)
+        self.assertEqual(cache.get(tokens[0].token), None)
+        self.assertEqual(cache.get(tokens[2].token), tokens[2])
+        self.assertEqual(cache.stats()['size'], 2)
+
+    def test_group_change_evicts_tokens(self):
+        self.assertFalse(auth.user_has_role(verify_access_token(self.token.token).user, auth.ROLE_ADVERTISERS))
+        Group.objects.get(name=auth.ROLE_ADVERTISERS).user_set.add(self.user)
+        self.assertEqual(token_cache.stats()['size'], 0)
+        self.assertTrue(auth.user_has_role(verify_access_token(self.token.token).user, auth.ROLE_ADVERTISERS))
+
+
+class UserRolesTest(TestCase):
+
+    def setUp(self):
+        super(UserRolesTest, self).setUp()
+        # the shared cache outlives the test database
+        caches[settings.ACCOUNT_REP_CACHE].clear()
+        self.user = User.objects.create_user('roleuser', 'roleuser@example.com', 'rolepass')
+
+    def test_roles_are_loaded_once(self):
+        Group.objects.get(name=auth.ROLE_ADVERTISERS).user_set.add(self.user)
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(1):
+            self.assertTrue(auth.user_is_advertiser(user))
+            self.assertTrue(auth.user_has_model_access(user, model=Advertiser))
+            self.assertFalse(auth.user_has_role(user, auth.ROLE_ACCOUNT_REPS, auth.ROLE_FINANCE))
+
+    def test_roles_follow_group_changes(self):
+        self.assertRaises(PermissionDenied, auth.user_is_advertiser, self.user)
+        self.user.groups.add(Group.objects.get(name=auth.ROLE_ACCOUNT_REPS))
+        self.assertTrue(auth.user_is_advertiser(self.user))
+        self.user.groups.clear()
+        self.assertRaises(PermissionDenied, auth.user_is_advertiser, self.user)
+
+    def test_rep_advertiser_ids_follow_assignments(self):
+        owner = User.objects.create_user('repowner', 'repowner@example.com', 'rolepass')
+        advertiser = Advertiser.objects.create(user=owner, name='Rep Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.user.groups.add(Group.objects.get(name=auth.ROLE_ACCOUNT_REPS))
+        self.assertFalse(auth.user_can_access_advertiser(self.user, advertiser.id))
+
+        assignment = AccountRepAdvertiser.objects.create(rep=self.user, advertiser=advertiser)
+        self.assertEqual(AccountRepAdvertiser.get_advertiser_ids(self.user.id), frozenset([advertiser.id]))
+        with self.assertNumQueries(0):
+            self.assertTrue(auth.user_can_access_advertiser(self.user, advertiser.id))
+
+        assignment.delete()
+        self.assertFalse(auth.user_can_access_advertiser(self.user, advertiser.id))
+
+
+class AuthLogWriterTest(TestCase):
+
+    def create_authlog(self, index=1):
+        return AuthLog(ip_address='127.0.0.1', requested_url='/api/v1/campaign/?page=%s' % index)
+
+    def test_sync_mode_saves_right_away(self):
+        writer = AuthLogWriter(asynchronous=False)
+        with self.assertNumQueries(1):
+            writer.write(self.create_authlog())
+        self.assertEqual(AuthLog.objects.count(), 1)
+
+    def test_flush_writes_in_batches(self):
+        writer = AuthLogWriter(batch_size=10)
+        for i in range(25):
+            writer._queue.put_nowait(self.create_authlog(i))
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 25)
+        self.assertEqual(AuthLog.objects.count(), 25)
+        self.assertEqual(writer.stats(), {'queued': 0, 'written': 25, 'dropped': 0})
+
+    def test_full_queue_drops_entries(self):
+        writer = AuthLogWriter(queue_size=2)
+        writer._ensure_worker = lambda: None  # keep the entries queued, no background thread
+        for i in range(5):
+            writer.write(self.create_authlog(i))
+        self.assertEqual(writer.stats(), {'queued': 2, 'written': 0, 'dropped': 3})
+
+    def test_counts_from_many_threads(self):
+        writer = AuthLogWriter(queue_size=1)
+        writer._ensure_worker = lambda: None
+        authlog = self.create_authlog()
+
+        def write():
+            for i in range(500):
+                writer.write(authlog)
+        threads = [threading.Thread(target=write) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(writer.stats(), {'queued': 1, 'written': 0, 'dropped': 8 * 500 - 1})
+
+    def test_middleware_logs_api_requests(self):
+        self.client.get('/api/v1/campaign/', HTTP_AUTHORIZATION='OAuth invalid')
+        self.assertEqual(AuthLog.objects.filter(authenticated=False).count(), 1)
+
+
+class ApiClientHandler(MiddlewareStackMixin, ClientHandler):
+    middleware_setting = 'API_MIDDLEWARE_CLASSES'
+
+
+class ApiMiddlewareTest(TestCase):
+
+    def setUp(self):
+        super(ApiMiddlewareTest, self).setUp()
+        self.user = User.objects.create_user('apiuser', 'apiuser@example.com', 'apipass')
+        Group.objects.get(name='advertisers').user_set.add(self.user)
+        client_app = Client.objects.create(user=self.user, name="API middleware tester", client_type=1,
+                                           url="http://example.com")
+        self.token = AccessToken.objects.create(user=self.user, client=client_app)
+        self.client.handler = ApiClientHandler()
+
+    def test_api_requests_skip_sessions(self):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get('/api/v1/campaign/', HTTP_AUTHORIZATION='OAuth %s' % self.token.token)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.cookies.keys(), [])
+        self.assertFalse([q for q in context.captured_queries if 'django_session' in q['sql']])
+        self.assertEqual(AuthLog.objects.get().user_id, self.user.id)
+
+        resp = self.client.get('/api/v1/campaign/')
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(AuthLog.objects.filter(authenticated=False).count(), 1)
 
-# Create your tests here.
+    def test_dispatch(self):
+        handler = PrefixDispatchWSGIHandler()
+        handler.api_handler = lambda environ, start_response: ['api']
+        self.assertEqual(handler({'PATH_INFO': '/api/v1/campaign/'}, None), ['api'])
+        self.assertEqual(handler({'PATH_INFO': '/api/bidder/payloads/'}, None), ['api'])
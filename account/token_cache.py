@@ -0,0 +1,127 @@
+"""
+Process-local cache of verified OAuth access tokens.
+
+Every API request is authenticated through verify_access_token(); without a cache that is one
+AccessToken query plus one User query per request. Entries are kept in a bounded LRU and live until
+the earliest of the cache TTL and the token's own expiry. Saving or deleting an AccessToken (the
+provider "revokes" a token by moving its expiry into the past and saving it) evicts it, and saving
+a User or changing its groups evicts every token of that user so permission and role changes are picked up
+(the user's roles are cached on the user instance, see account.auth.get_user_roles).
+
+The cache is per process: invalidations made in another process are only seen after the TTL runs out,
+so keep OAUTH_TOKEN_CACHE_TTL short.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from provider.oauth2.models import AccessToken
+
+
+class AccessTokenCache(object):
+    """
+    Bounded LRU + TTL cache mapping a token key to its AccessToken (with the user already loaded).
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (token, expires_at)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key):
+        """
+        Return the cached token for key or None. Stale entries are dropped and count as misses.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] <= time.time():
+                self.misses += 1
+                return None
+            # re-insert to mark it as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token):
+        """
+        Cache a verified token. The entry never outlives token.expires.
+        """
+        if not self.enabled:
+            return
+        expires_at = min(time.time() + self.ttl, time.time() + token.get_expire_delta())
+        with self._lock:
+            self._entries.pop(token.token, None)
+            self._entries[token.token] = (token, expires_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (token, _) in self._entries.items() if token.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+token_cache = AccessTokenCache(max_size=getattr(settings, 'OAUTH_TOKEN_CACHE_SIZE', 1024),
+                               ttl=getattr(settings, 'OAUTH_TOKEN_CACHE_TTL', 60))
+
+
+@receiver([post_save, post_delete], sender=AccessToken, dispatch_uid='token_cache_access_token')
+def invalidate_access_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.token)
+
+
+@receiver([post_save, post_delete], sender=User, dispatch_uid='token_cache_user')
+def invalidate_user_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.id)
+
+
+@receiver(m2m_changed, sender=User.groups.through, dispatch_uid='token_cache_user_groups')
+def invalidate_group_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        # user.groups.add(...) etc.
+        instance._roles_cache = None
+        token_cache.invalidate_user(instance.id)
+    elif pk_set is None:
+        # group.user_set.clear(): we don't know who was in it
+        token_cache.clear()
+    else:
+        for user_id in pk_set:
+            token_cache.invalidate_user(user_id)
+
+
+@receiver([post_save, post_delete], sender=Group, dispatch_uid='token_cache_group')
+def invalidate_group(sender, instance, **kwargs):
+    # a renamed or deleted group changes the roles of all its members
+    token_cache.clear()
@@ -3,13 +3,19 @@ from tastypie.resources import ModelResource, ALL
 from tastypie import fields
 from tastypie.authentication import Authentication
 from tastypie.exceptions import BadRequest, ImmediateHttpResponse
-from django.core.exceptions import PermissionDenied
-
-from cedar_fe.api_common import ApiAuthorization
+from tastypie.http import HttpForbidden
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.db.models import Max, Count
+
+from cedar_fe.api_common import (ApiAuthorization, ApiSerializer, BulkResourceMixin, CachedDetailMixin,
+                                 ConditionalGetMixin, KeysetPaginator, SparseFieldsMixin, StreamingListMixin,
+                                 ValuesListMixin, UNAUTHORIZED_MESSAGE)
 from account import auth
-from account.models import Advertiser
-from campaign.models import Campaign, NativeAd
+from account.models import Advertiser, AccountRepAdvertiser
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, NativeAdImageAsset, OutboxEntry, EffectiveBid
 from campaign.constants import *
+from campaign.openrtb import load_payload
 
 
 def auth_filter_native_ads_list(object_list, user):
@@ -17,20 +23,54 @@ def auth_filter_native_ads_list(object_list, user):
         return object_list
 
     # Account Reps have access to a subset of Advertisers
-    if user.groups.filter(name='account_reps').count() > 0:
-        # TODO: get list of this account rep's advertisers
-        advertisers_ids = []
-        return object_list.filter(campaign__advertiser_id__in=advertisers_ids)
+    if auth.user_has_role(user, auth.ROLE_ACCOUNT_REPS):
+        return object_list.filter(campaign__advertiser_id__in=AccountRepAdvertiser.advertiser_ids_subquery(user))
 
-    if user.groups.filter(name='advertisers').count() > 0:
+    if auth.user_has_role(user, auth.ROLE_ADVERTISERS):
         return object_list.filter(campaign__advertiser__user_id=user.id)
 
     raise PermissionDenied()
 
-class NativeAdResource(ModelResource):
+def asset_errors(asset_model, items):
+    """
+    Validate a list of assets sent to the API without saving them; returns a list of error messages.
+    """
+    if not isinstance(items, list):
+        return ['Must be a list.']
+    errors = []
+    for item in items:
+        try:
+            asset = asset_model()
+            for k in asset_model.ASSET_FIELDS:
+                setattr(asset, k, asset_model._meta.get_field(k).to_python(item[k]))
+            asset.validate()
+        except KeyError as e:
+            errors.append('Missing %s.' % e)
+        except ValidationError as e:
+            errors.extend(e.messages)
+        except Exception as e:
+            errors.append(str(e) or 'Invalid asset.')
+    return errors
+
+class NativeAdResource(CachedDetailMixin, ConditionalGetMixin, StreamingListMixin, ValuesListMixin, SparseFieldsMixin,
+                       BulkResourceMixin, ModelResource):
+    bulk_fields = ['campaign_id', 'name', 'status', 'url', 'title']
+    bulk_create_only_fields = ['campaign_id']
+    field_prefetches = {'dataassets': ['data_assets'], 'imageassets': ['image_assets']}
+    field_columns = {'openrtb': ['openrtb_payload']}
+
     class Meta:
-        queryset = NativeAd.objects.all()
+        # assets are serialized with every ad (see dehydrate), load them for the whole page at once
+        queryset = NativeAd.objects.prefetch_related('data_assets', 'image_assets')
         resource_name = 'nativead'
+        # JSON, and MessagePack for the bidder (see ApiSerializer)
+        serializer = ApiSerializer()
+        list_allowed_methods = ['get', 'post', 'patch']
+        # compiled from the ad and its assets, see the openrtb fields below
+        excludes = ['openrtb_payload', 'openrtb_hash', 'openrtb_version']
+        # pages by cursor on id or (updated, id), see KeysetPaginator
+        paginator_class = KeysetPaginator
+        ordering = ['id', 'updated']
         authentication = Authentication()
         
         authorization = ApiAuthorization(Campaign, # if user can access Campaign, it can also access Ads
@@ -50,6 +90,10 @@ class NativeAdResource(ModelResource):
     campaign_id = fields.IntegerField(attribute='campaign_id', blank=False, null=False)
     dataassets = fields.DictField(attribute='dataassets', blank=True, null=True)
     imageassets = fields.DictField(attribute='imageassets', blank=True, null=True)
+    # the pre-rendered OpenRTB native response object (see campaign.openrtb)
+    openrtb = fields.DictField(attribute='openrtb', readonly=True, null=True)
+    openrtb_hash = fields.CharField(attribute='openrtb_hash', readonly=True)
+    openrtb_version = fields.IntegerField(attribute='openrtb_version', readonly=True)
 
 
     def hydrate_campaign_id(self, bundle):
@@ -66,6 +110,8 @@ class NativeAdResource(ModelResource):
                 bundle.data['campaign_id'] = campaign.id
             except:
                 raise BadRequest('Invalid campaign_id.')
+            if not auth.user_can_access_advertiser(bundle.request.user, campaign.advertiser_id):
+                raise ImmediateHttpResponse(HttpForbidden(UNAUTHORIZED_MESSAGE))
         elif bundle.request.method.lower() == 'post':
             raise BadRequest('Missing campaign_id.')
         return bundle
@@ -74,29 +120,65 @@ class NativeAdResource(ModelResource):
         request_method = bundle.request.method.lower();
         if request_method == 'put':
             raise BadRequest("Invalid primary key provided.")
-        data_assets = bundle.data['dataassets']
-        image_assets = bundle.data['imageassets']
+        data_assets = bundle.data.get('dataassets') or []
+        image_assets = bundle.data.get('imageassets') or []
 
-        saved_bundle = super(NativeAdResource, self).obj_create(bundle, **kwargs)
+        with transaction.atomic():
+            saved_bundle = super(NativeAdResource, self).obj_create(bundle, **kwargs)
 
-        saved_bundle.obj.set_data_assets(data_assets)
-        saved_bundle.obj.set_image_assets(image_assets)
-        saved_bundle.obj.save()
+            saved_bundle.obj.set_data_assets(data_assets)
+            saved_bundle.obj.set_image_assets(image_assets)
 
         return saved_bundle
 
     def obj_update(self, bundle, **kwargs):
-        data_assets = bundle.data['dataassets']
-        image_assets = bundle.data['imageassets']
+        # assets left out of the request are kept as they are; only the changed ones are written
+        data_assets = bundle.data.get('dataassets')
+        image_assets = bundle.data.get('imageassets')
 
-        saved_bundle = super(NativeAdResource, self).obj_update(bundle, **kwargs)
+        with transaction.atomic():
+            saved_bundle = super(NativeAdResource, self).obj_update(bundle, **kwargs)
 
-        saved_bundle.obj.set_data_assets(data_assets)
-        saved_bundle.obj.set_image_assets(image_assets)
-        saved_bundle.obj.save()
+            if data_assets is not None:
+                saved_bundle.obj.set_data_assets(data_assets)
+            if image_assets is not None:
+                saved_bundle.obj.set_image_assets(image_assets)
 
         return saved_bundle
 
+    def bulk_validate(self, request, objs):
+        errors = {}
+        campaign_ids = set(obj.campaign_id for obj, data in objs if obj.pk is None)
+        campaigns = dict((c[0], c[1:]) for c in
+                         Campaign.objects.filter(id__in=campaign_ids).values_list('id', 'campaign_type', 'advertiser_id'))
+        allowed_advertisers = auth.accessible_advertiser_ids(request.user, [c[1] for c in campaigns.values()])
+        for position, (obj, data) in enumerate(objs):
+            obj_errors = {}
+            if obj.pk is None:
+                campaign_type, advertiser_id = campaigns.get(obj.campaign_id, (None, None))
+                if advertiser_id not in allowed_advertisers:
+                    obj_errors['campaign_id'] = ['Invalid campaign_id.']
+                elif 'nativeads' not in CAMPAIGN_TYPES[campaign_type]['available_ad_types']:
+                    obj_errors['campaign_id'] = ['The provided campaign does not support nativeads']
+            for key, asset_model in (('dataassets', NativeAdDataAsset), ('imageassets', NativeAdImageAsset)):
+                if data.get(key) is not None:
+                    messages = asset_errors(asset_model, data[key])
+                    if messages:
+                        obj_errors[key] = messages
+            if obj_errors:
+                errors[position] = obj_errors
+        return errors
+
+    def bulk_save_related(self, request, objs):
+        OutboxEntry.record(obj for obj, data in objs)
+        for key, asset_model in (('dataassets', NativeAdDataAsset), ('imageassets', NativeAdImageAsset)):
+            assets_by_ad = dict((obj, data[key]) for obj, data in objs if data.get(key) is not None)
+            if assets_by_ad:
+                NativeAd.sync_assets(asset_model, assets_by_ad)
+        # sync_assets() compiles the payloads of the others
+        NativeAd.compile_payloads((obj.id for obj, data in objs
+                                   if data.get('dataassets') is None and data.get('imageassets') is None), record=False)
+
     def dispatch(self, request_type, request, **kwargs):
 
         return super(NativeAdResource, self).dispatch(request_type, request, **kwargs)
@@ -105,31 +187,63 @@ class NativeAdResource(ModelResource):
     def dehydrate(self, bundle):
         
         ad = bundle.obj
-        bundle.data['dataassets'] = [ds.to_dict() for ds in ad.data_assets.all()]
-        bundle.data['imageassets'] = [imgs.to_dict() for imgs in ad.image_assets.all()]
+        # unless left out with ?fields=
+        if 'dataassets' in bundle.data:
+            bundle.data['dataassets'] = [ds.to_dict() for ds in ad.data_assets.all()]
+        if 'imageassets' in bundle.data:
+            bundle.data['imageassets'] = [imgs.to_dict() for imgs in ad.image_assets.all()]
 
         return super(NativeAdResource, self).dehydrate(bundle)
 
+    def values_dehydrate(self, request, objects):
+        # same as dehydrate(), with the assets of the whole page loaded at once and grouped by ad
+        ad_ids = [row['id'] for row, data in objects]
+        for key, asset_model in (('dataassets', NativeAdDataAsset), ('imageassets', NativeAdImageAsset)):
+            if not objects or key not in objects[0][1]:
+                continue
+            assets = {}
+            for asset in asset_model.objects.filter(ad_id__in=ad_ids).order_by('id').values('ad_id',
+                                                                                             *asset_model.ASSET_FIELDS):
+                assets.setdefault(asset.pop('ad_id'), []).append(asset)
+            for row, data in objects:
+                data[key] = assets.get(row['id'], [])
+        for row, data in objects:
+            if 'openrtb' in data:
+                data['openrtb'] = self.fields['openrtb'].convert(load_payload(row['openrtb_payload']))
+
 
 def auth_filter_campaign_list(object_list, user):
     if user.is_superuser or user.is_staff:
         return object_list
 
     # Account Reps have access to a subset of Advertisers
-    if user.groups.filter(name='account_reps').count() > 0:
-        # TODO: get list of this account rep's advertisers
-        advertisers_ids = []
-        return object_list.filter(advertiser_id__in=advertisers_ids)
+    if auth.user_has_role(user, auth.ROLE_ACCOUNT_REPS):
+        return object_list.filter(advertiser_id__in=AccountRepAdvertiser.advertiser_ids_subquery(user))
 
-    if user.groups.filter(name='advertisers').count() > 0:
+    if auth.user_has_role(user, auth.ROLE_ADVERTISERS):
         return object_list.filter(advertiser__user_id=user.id)
 
     raise PermissionDenied()
 
-class CampaignResource(ModelResource):
+class CampaignResource(CachedDetailMixin, ConditionalGetMixin, StreamingListMixin, ValuesListMixin, SparseFieldsMixin,
+                       BulkResourceMixin, ModelResource):
+    bulk_fields = ['advertiser_id', 'name', 'campaign_type', 'status', 'daily_cap', 'monthly_cap', 'total_cap',
+                   'start_date', 'end_date', 'bid_type', 'bid', 'min_bid', 'daily_frequency_cap', 'minutes_frequency']
+    bulk_create_only_fields = ['advertiser_id']
+    # lists have the ads only with ?expand=ads (see SparseFieldsMixin)
+    expandable_fields = {'ads': ALL_AD_TYPES}
+    field_columns = dict((ad_type, ['campaign_type']) for ad_type in ALL_AD_TYPES)
+    field_prefetches = {'nativeads': ['nativeads__data_assets', 'nativeads__image_assets']}
+
     class Meta:
-        queryset = Campaign.objects.all()
+        # nativeads are dehydrated in full (with their assets), load them for the whole page at once
+        queryset = Campaign.objects.prefetch_related('nativeads__data_assets', 'nativeads__image_assets')
         resource_name = 'campaign'
+        serializer = ApiSerializer()
+        list_allowed_methods = ['get', 'post', 'patch']
+        # pages by cursor on id or (updated, id), see KeysetPaginator
+        paginator_class = KeysetPaginator
+        ordering = ['id', 'updated']
         authentication = Authentication()
         
         authorization = ApiAuthorization(Campaign,
@@ -165,16 +279,44 @@ class CampaignResource(ModelResource):
         return super(CampaignResource, self).dispatch(request_type, request, **kwargs)
 
     def dehydrate(self, bundle):
+        if any(ad_type in bundle.data for ad_type in ALL_AD_TYPES):
+            self.group_ads(bundle.data, bundle.obj.campaign_type)
+        return super(CampaignResource, self).dehydrate(bundle)
+
+    def values_dehydrate(self, request, objects):
+        for row, data in objects:
+            if any(ad_type in data for ad_type in ALL_AD_TYPES):
+                self.group_ads(data, row['campaign_type'])
+
+    @staticmethod
+    def group_ads(data, campaign_type):
         # remove the ads list that are not related to this type of campaign
-        campaign_type = bundle.data['campaign_type']
-        bundle.data['ads'] = {}
+        data['ads'] = {}
         for ad_type in ALL_AD_TYPES:
-            if ad_type in bundle.data:
+            if ad_type in data:
                 if ad_type in CAMPAIGN_TYPES[campaign_type]['available_ad_types']:
-                    bundle.data['ads'][ad_type] = bundle.data[ad_type]
-            del bundle.data[ad_type]
-
-        return super(CampaignResource, self).dehydrate(bundle)
+                    data['ads'][ad_type] = data[ad_type]
+                del data[ad_type]
+
+    def nested_validator_aggregates(self, request, for_list):
+        fields = self.selected_fields(request, for_list)
+        if fields is not None and 'nativeads' not in fields:
+            return {}
+        # the ads change their `updated` when their assets are written through the API
+        return {'max_ads_updated': Max('nativeads__updated'), 'ads': Count('nativeads', distinct=True)}
+
+    def bulk_validate(self, request, objs):
+        allowed_advertisers = auth.accessible_advertiser_ids(request.user,
+                                                             [obj.advertiser_id for obj, data in objs if obj.pk is None])
+        return dict((position, {'advertiser_id': ['Invalid advertiser_id.']})
+                    for position, (obj, data) in enumerate(objs)
+                    if obj.pk is None and obj.advertiser_id not in allowed_advertisers)
+
+    def bulk_save_related(self, request, objs):
+        OutboxEntry.record(obj for obj, data in objs)
+        EffectiveBid.create_defaults(obj for obj, data in objs if data.get('id') is None)
+        EffectiveBid.refresh(obj.id for obj, data in objs
+                             if data.get('id') is not None and ('bid' in data or 'min_bid' in data))
 
     def hydrate_advertiser_id(self, bundle):
         if 'advertiser_id' in bundle.data:
@@ -187,6 +329,8 @@ class CampaignResource(ModelResource):
                 bundle.data['advertiser_id'] = Advertiser.objects.get(pk=bundle.data['advertiser_id']).id
             except:
                 raise BadRequest('Invalid advertiser_id.')
+            if not auth.user_can_access_advertiser(bundle.request.user, bundle.data['advertiser_id']):
+                raise ImmediateHttpResponse(HttpForbidden(UNAUTHORIZED_MESSAGE))
         elif bundle.request.method.lower() == 'post':
             raise BadRequest('Missing advertiser_id.')
         return bundle
@@ -198,3 +342,42 @@ class CampaignResource(ModelResource):
             raise BadRequest("Invalid primary key provided.")
 
         return super(CampaignResource, self).obj_create(bundle, **kwargs)
+
+
+def auth_filter_effective_bids_list(object_list, user):
+    if user.is_superuser or user.is_staff:
+        return object_list
+
+    # Account Reps have access to a subset of Advertisers
+    if auth.user_has_role(user, auth.ROLE_ACCOUNT_REPS):
+        return object_list.filter(campaign__advertiser_id__in=AccountRepAdvertiser.advertiser_ids_subquery(user))
+
+    if auth.user_has_role(user, auth.ROLE_ADVERTISERS):
+        return object_list.filter(campaign__advertiser__user_id=user.id)
+
+    raise PermissionDenied()
+
+class EffectiveBidResource(ModelResource):
+    """
+    Read only: the rows are computed from the campaigns, their categories and devices (see EffectiveBid).
+    """
+
+    class Meta:
+        queryset = EffectiveBid.objects.all()
+        resource_name = 'effectivebid'
+        serializer = ApiSerializer()
+        allowed_methods = ['get']
+        excludes = ['campaign']
+        authentication = Authentication()
+
+        authorization = ApiAuthorization(Campaign, # if user can access Campaign, it can also access its bids
+                                        gen_kwargs_func=None,
+                                        filter_list_func=auth_filter_effective_bids_list,
+                                        auth_get_func=auth.user_has_model_access)
+        filtering = {
+            'campaign_id': ALL,
+            'category_id': ALL,
+            'device_id': ALL
+        }
+
+    campaign_id = fields.IntegerField(attribute='campaign_id', readonly=True)
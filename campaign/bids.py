@@ -0,0 +1,97 @@
+"""
+In-memory copy of the EffectiveBid table, for looking up the bids of many campaigns at once:
+
+    bid_table.lookup(campaign_ids, category_id, device_id)   # micros, -1 = not targeted
+
+A campaign's bid for a (category, device) is its row for that category and device, else the row for the
+category and ANY device, else for ANY category and that device, else for ANY category and device. A campaign
+targeting some categories (devices) has no ANY category (device) rows, so it gets no bid for the others.
+
+The rows are kept as two parallel NumPy arrays sorted by a packed (campaign_id, category_id, device_id) key;
+category and device ids must fit in 16 bits. bid_table is loaded on first use and updated, in this process,
+whenever EffectiveBid rows are rewritten.
+"""
+
+import threading
+
+import numpy as np
+from django.dispatch import receiver
+
+from campaign.models import EffectiveBid, effective_bids_changed
+from campaign.constants import to_micros
+
+NOT_TARGETED = -1
+
+
+def pack(campaign_ids, category_ids, device_ids):
+    return (np.asarray(campaign_ids, dtype=np.int64) << 32 | np.asarray(category_ids, dtype=np.int64) << 16 |
+            np.asarray(device_ids, dtype=np.int64))
+
+
+class BidTable(object):
+
+    def __init__(self):
+        self.loaded = False
+        # (keys, bids), replaced together so readers never see keys and bids that don't match
+        self.table = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self._lock = threading.Lock()
+
+    def _rows(self, queryset):
+        rows = list(queryset.values_list('campaign_id', 'category_id', 'device_id', 'bid'))
+        if any(category_id >= 1 << 16 or device_id >= 1 << 16 for c, category_id, device_id, b in rows):
+            raise ValueError("Category and device ids must be lower than %s." % (1 << 16))
+        keys = pack([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+        return keys, np.array([to_micros(r[3]) for r in rows], dtype=np.int64)
+
+    def _set(self, keys, bids):
+        order = np.argsort(keys, kind='mergesort')
+        self.table = (keys[order], bids[order])
+
+    def load(self):
+        with self._lock:
+            self._set(*self._rows(EffectiveBid.objects.all()))
+            self.loaded = True
+
+    def update(self, campaign_ids):
+        """
+        Reload the rows of the given campaigns.
+        """
+        with self._lock:
+            old_keys, old_bids = self.table
+            keep = ~np.in1d(old_keys >> 32, np.asarray(list(campaign_ids), dtype=np.int64))
+            keys, bids = self._rows(EffectiveBid.objects.filter(campaign__in=list(campaign_ids)))
+            self._set(np.concatenate([old_keys[keep], keys]), np.concatenate([old_bids[keep], bids]))
+
+    def lookup(self, campaign_ids, category_id=EffectiveBid.ANY, device_id=EffectiveBid.ANY):
+        """
+        Bids (micros) of the campaigns for a category and device, NOT_TARGETED for the campaigns that don't
+        target them.
+        """
+        if not self.loaded:
+            self.load()
+        keys, bids = self.table
+        campaign_ids = np.asarray(campaign_ids, dtype=np.int64)
+        result = np.full(len(campaign_ids), NOT_TARGETED, dtype=np.int64)
+        missing = np.ones(len(campaign_ids), dtype=bool)
+        if not len(keys):
+            return result
+        any_ = EffectiveBid.ANY
+        for category, device in ((category_id, device_id), (category_id, any_), (any_, device_id), (any_, any_)):
+            wanted = pack(campaign_ids, category, device)
+            positions = np.searchsorted(keys, wanted)
+            positions[positions == len(keys)] = 0
+            found = missing & (keys[positions] == wanted)
+            result[found] = bids[positions[found]]
+            missing &= ~found
+            if not missing.any():
+                break
+        return result
+
+
+bid_table = BidTable()
+
+
+@receiver(effective_bids_changed, dispatch_uid='bid_table')
+def update_bid_table(sender, campaign_ids, **kwargs):
+    if bid_table.loaded:
+        bid_table.update(campaign_ids)
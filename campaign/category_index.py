@@ -0,0 +1,169 @@
+"""
+In-memory inverted index from IAB category codes to the eligible campaigns targeting them.
+
+A campaign targeting a category (CampaignCategories) also targets all its subcategories, so the campaigns of a
+code are those targeting its category or any of its ancestors (see config.categories). For every category the
+index keeps them as a sorted NumPy array of campaign ids, restricted to the eligible campaigns
+(campaign.eligibility):
+
+    category_index.campaigns('IAB1-1')               # sorted ids
+    category_index.match_any(['IAB1-1', 'IAB2'])      # union
+    category_index.match_all(['IAB1-1', 'IAB2'])      # intersection
+
+Saving or deleting a CampaignCategories row updates the index of this process right away (only the subtrees
+of the categories involved are recomputed). Eligibility or category hierarchy changes need a build().
+Both make their changes on the side and publish them at once, so a lookup running meanwhile sees either the
+previous index or the new one.
+"""
+
+import threading
+
+import numpy as np
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from campaign.models import CampaignCategories
+from campaign.eligibility import CampaignTable, evaluate
+from config.categories import category_tree
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class CategoryIndex(object):
+
+    def __init__(self):
+        self.built = False
+        self._eligible = frozenset()
+        # campaign_id -> ids of the categories it targets directly, and the reverse
+        self._campaign_categories = {}
+        self._category_campaigns = {}
+        # what the readers see, replaced as a whole so they never get a half-updated index: the CategoryTree and
+        # category_id -> sorted ids of the eligible campaigns targeting it, inheritance included
+        self._state = (None, {})
+        self._lock = threading.Lock()
+
+    @property
+    def tree(self):
+        return self._state[0]
+
+    def build(self, eligible_ids=None, tree=None, targeting=None):
+        """
+        (Re)build the whole index.
+
+        @param eligible_ids: default: the campaigns eligible now (campaign.eligibility)
+        @param tree: CategoryTree, default: the current one
+        @param targeting: (campaign_id, category_id) pairs, default: the CampaignCategories rows
+        """
+        if eligible_ids is None:
+            eligible_ids, reasons = evaluate(CampaignTable.load(), timezone.localtime(timezone.now()).date())
+        if targeting is None:
+            targeting = CampaignCategories.objects.values_list('campaign_id', 'category_id')
+        with self._lock:
+            tree = tree or category_tree()
+            eligible = frozenset(int(id) for id in eligible_ids)
+            campaign_categories, category_campaigns = {}, {}
+            for campaign_id, category_id in targeting:
+                campaign_categories.setdefault(campaign_id, set()).add(category_id)
+                category_campaigns.setdefault(category_id, set()).add(campaign_id)
+            campaigns = {}
+            for category_id in tree.codes:
+                campaign_ids = set()
+                for ancestor_id in tree.ancestors(category_id):
+                    campaign_ids.update(category_campaigns.get(ancestor_id, ()))
+                campaign_ids &= eligible
+                campaigns[category_id] = np.array(sorted(campaign_ids), dtype=np.int64) if campaign_ids else EMPTY
+            self._eligible, self._campaign_categories, self._category_campaigns = (eligible, campaign_categories,
+                                                                                   category_campaigns)
+            self._state = (tree, campaigns)
+            self.built = True
+
+    def update_campaign(self, campaign_id, category_ids=None, eligible=None):
+        """
+        Take into account the targeting (default: the stored one) and the eligibility of one campaign; only the
+        subtrees of the categories involved are updated.
+        """
+        if category_ids is None:
+            category_ids = CampaignCategories.objects.filter(campaign_id=campaign_id).values_list('category_id',
+                                                                                                   flat=True)
+        category_ids = set(category_ids)
+        with self._lock:
+            previous = self._campaign_categories.get(campaign_id, set())
+            for category_id in previous - category_ids:
+                self._category_campaigns[category_id].discard(campaign_id)
+            for category_id in category_ids - previous:
+                self._category_campaigns.setdefault(category_id, set()).add(campaign_id)
+            self._campaign_categories[campaign_id] = category_ids
+            changed = previous ^ category_ids
+            if eligible is not None and eligible != (campaign_id in self._eligible):
+                self._eligible = self._eligible | {campaign_id} if eligible else self._eligible - {campaign_id}
+                changed = previous | category_ids
+
+            is_eligible = campaign_id in self._eligible
+            tree, campaigns = self._state
+            # the arrays are shared with the previous state, only the dict is copied
+            campaigns = dict(campaigns)
+            for category_id in set(id for changed_id in changed for id in tree.subtree(changed_id)):
+                targeted = is_eligible and any(a in category_ids for a in tree.ancestors(category_id))
+                campaign_ids = campaigns.get(category_id, EMPTY)
+                position = np.searchsorted(campaign_ids, campaign_id)
+                present = position < len(campaign_ids) and campaign_ids[position] == campaign_id
+                if targeted and not present:
+                    campaigns[category_id] = np.insert(campaign_ids, position, campaign_id)
+                elif present and not targeted:
+                    campaigns[category_id] = np.delete(campaign_ids, position)
+            self._state = (tree, campaigns)
+
+    def campaigns(self, code):
+        """
+        Sorted ids of the eligible campaigns targeting the category `code`.
+        """
+        return self._campaigns(self._state, code)
+
+    @staticmethod
+    def _campaigns(state, code):
+        tree, campaigns = state
+        return campaigns.get(tree.ids_by_code.get(code), EMPTY) if tree is not None else EMPTY
+
+    def match_any(self, codes):
+        """
+        Sorted ids of the eligible campaigns targeting at least one of the `codes`.
+        """
+        state = self._state
+        arrays = [a for a in (self._campaigns(state, code) for code in codes) if len(a)]
+        if len(arrays) < 2:
+            return arrays[0] if arrays else EMPTY
+        # like np.unique(), without its extra copies
+        merged = np.concatenate(arrays)
+        merged.sort()
+        keep = np.empty(len(merged), dtype=bool)
+        keep[0] = True
+        np.not_equal(merged[1:], merged[:-1], out=keep[1:])
+        return merged[keep]
+
+    def match_all(self, codes):
+        """
+        Sorted ids of the eligible campaigns targeting all the `codes`.
+        """
+        state = self._state
+        arrays = sorted((self._campaigns(state, code) for code in codes), key=len)
+        if not arrays:
+            return EMPTY
+        result = arrays[0]
+        for campaign_ids in arrays[1:]:
+            if not len(result):
+                break
+            # both sorted and unique: look the (fewer) result ids up instead of np.intersect1d's sort
+            positions = np.searchsorted(campaign_ids, result)
+            positions[positions == len(campaign_ids)] = 0
+            result = result[campaign_ids[positions] == result]
+        return result
+
+
+category_index = CategoryIndex()
+
+
+@receiver([post_save, post_delete], sender=CampaignCategories, dispatch_uid='category_index')
+def update_category_index(sender, instance, **kwargs):
+    if category_index.built:
+        category_index.update_campaign(instance.campaign_id)
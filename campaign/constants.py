@@ -1,4 +1,6 @@
 
+from decimal import Decimal
+
 #####
 # Campaign constants
 #####
@@ -33,3 +35,18 @@ BID_TYPES = {
 	BID_CPM: 'CPM',
 	BID_CPC: 'CPC'
 }
+
+#####
+# Money constants
+#####
+
+# money amounts are sent to the bidder as integer micro-dollars
+MICROS_PER_UNIT = 1000000
+
+def to_micros(amount):
+	"""
+	Convert a Decimal (or anything Decimal() accepts) money amount to integer micros; None stays None.
+	"""
+	if amount is None:
+		return None
+	return int(Decimal(amount) * MICROS_PER_UNIT)
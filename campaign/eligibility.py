@@ -0,0 +1,155 @@
+"""
+Campaign eligibility for the whole campaign set at once.
+
+A campaign with status ACTIVE is servable only if its advertiser is active, today is within its start/end dates,
+it has at least one active ad and it hasn't reached any of its caps (see the comment on Campaign.STATUS_PAUSED).
+CampaignTable loads these attributes for all the campaigns into NumPy columns (two queries), and evaluate()
+checks all the rules for all the campaigns in one vectorized pass:
+
+    table = CampaignTable.load()
+    eligible_ids, reasons = evaluate(table, today)
+
+`reasons[i]` is the REASON_* code of table.ids[i]: REASON_ELIGIBLE, or the first rule (in REASONS order) the
+campaign fails. Money amounts are integer micros (see constants.to_micros) and dates are proleptic ordinals.
+"""
+
+from datetime import date
+
+import numpy as np
+from django.db.models import Count
+
+from campaign.models import Campaign, NativeAd
+from campaign.constants import to_micros
+from account.models import Advertiser
+
+REASON_ELIGIBLE = 0
+REASON_STATUS = 1
+REASON_ADVERTISER_STATUS = 2
+REASON_NOT_STARTED = 3
+REASON_ENDED = 4
+REASON_NO_ACTIVE_ADS = 5
+REASON_DAILY_CAP = 6
+REASON_MONTHLY_CAP = 7
+REASON_TOTAL_CAP = 8
+
+# in the order the rules are checked
+REASONS = [
+    (REASON_ELIGIBLE, 'Eligible'),
+    (REASON_STATUS, 'Campaign is not active'),
+    (REASON_ADVERTISER_STATUS, 'Advertiser is not active'),
+    (REASON_NOT_STARTED, 'Campaign has not started'),
+    (REASON_ENDED, 'Campaign has ended'),
+    (REASON_NO_ACTIVE_ADS, 'Campaign has no active ads'),
+    (REASON_DAILY_CAP, 'Daily cap reached'),
+    (REASON_MONTHLY_CAP, 'Monthly cap reached'),
+    (REASON_TOTAL_CAP, 'Total cap reached'),
+]
+
+# stand-ins for the missing start/end dates
+NO_START = date.min.toordinal()
+NO_END = date.max.toordinal()
+
+
+class CampaignTable(object):
+    """
+    The eligibility attributes of a set of campaigns, one NumPy array per attribute, sorted by campaign id.
+    """
+
+    COLUMNS = (
+        ('ids', np.int64),
+        ('status', np.int8),
+        ('advertiser_status', np.int8),
+        ('start', np.int32),
+        ('end', np.int32),
+        ('active_ads', np.int32),
+        ('daily_cap', np.int64),
+        ('monthly_cap', np.int64),
+        ('total_cap', np.int64),
+    )
+
+    def __init__(self, **columns):
+        for name, dtype in self.COLUMNS:
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+        if (np.diff(self.ids) < 0).any():
+            order = np.argsort(self.ids, kind='mergesort')
+            for name, dtype in self.COLUMNS:
+                setattr(self, name, getattr(self, name)[order])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, queryset=None):
+        """
+        Load the campaigns of `queryset` (default: all of them) with one query, and their active ads with another.
+        """
+        if queryset is None:
+            queryset = Campaign.objects.all()
+        rows = queryset.order_by('id').values_list('id', 'status', 'advertiser__status', 'start_date', 'end_date',
+                                                   'daily_cap', 'monthly_cap', 'total_cap')
+        columns = dict((name, []) for name, dtype in cls.COLUMNS)
+        for id, status, advertiser_status, start_date, end_date, daily_cap, monthly_cap, total_cap in rows:
+            columns['ids'].append(id)
+            columns['status'].append(status)
+            columns['advertiser_status'].append(advertiser_status)
+            columns['start'].append(start_date.toordinal() if start_date else NO_START)
+            columns['end'].append(end_date.toordinal() if end_date else NO_END)
+            columns['daily_cap'].append(to_micros(daily_cap))
+            columns['monthly_cap'].append(to_micros(monthly_cap))
+            columns['total_cap'].append(to_micros(total_cap))
+        columns['active_ads'] = np.zeros(len(columns['ids']), dtype=np.int32)
+        table = cls(**columns)
+
+        active_ads = (NativeAd.objects.filter(status=NativeAd.STATUS_ACTIVE, campaign__in=queryset.values('id'))
+                      .order_by().values('campaign_id').annotate(count=Count('id')).values_list('campaign_id', 'count'))
+        active_ads = list(active_ads)
+        table.active_ads = table.column([c for c, n in active_ads], [n for c, n in active_ads], dtype=np.int32)
+        return table
+
+    def align(self, ids, values):
+        """
+        Map per-campaign `values` (in any order) to positions in this table: returns (positions, values) of the
+        ids that are in the table.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        values = np.asarray(values)
+        positions = np.searchsorted(self.ids, ids)
+        positions[positions == len(self.ids)] = 0
+        found = (self.ids[positions] == ids) if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        return positions[found], values[found]
+
+    def column(self, ids, values, dtype=np.int64):
+        """
+        A column of this table from per-campaign `values`; campaigns without a value get 0.
+        """
+        result = np.zeros(len(self.ids), dtype=dtype)
+        positions, values = self.align(ids, values)
+        result[positions] = values
+        return result
+
+
+def evaluate(table, today, daily_spend=None, monthly_spend=None, total_spend=None):
+    """
+    Check all the campaigns of `table` on the date `today`. The spends are optional columns of the table (micros,
+    see CampaignTable.column()); a 0 cap is unlimited.
+
+    Returns (eligible_ids, reasons).
+    """
+    today = today.toordinal()
+
+    def cap_reached(cap, spend):
+        if spend is None:
+            return np.zeros(len(table), dtype=bool)
+        return (cap > 0) & (spend >= cap)
+
+    reasons = np.select([
+        table.status != Campaign.STATUS_ACTIVE,
+        table.advertiser_status != Advertiser.STATUS_ACTIVE,
+        table.start > today,
+        table.end < today,
+        table.active_ads == 0,
+        cap_reached(table.daily_cap, daily_spend),
+        cap_reached(table.monthly_cap, monthly_spend),
+        cap_reached(table.total_cap, total_spend),
+    ], [code for code, name in REASONS[1:]], default=REASON_ELIGIBLE).astype(np.int8)
+    return table.ids[reasons == REASON_ELIGIBLE], reasons
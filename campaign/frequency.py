@@ -0,0 +1,154 @@
+"""
+Per-user frequency caps: Campaign.daily_frequency_cap (impressions per user and day, 0 = unlimited) and
+Campaign.minutes_frequency (at least that many minutes between two impressions for the same user).
+
+FrequencyStore keeps one 16 byte slot per (user, campaign) pair in three flat arrays sized once from a memory
+budget - an open addressing hash table:
+
+    keys     64 bit hash of (user_id, campaign_id), 0 = free slot
+    last     minute (since the epoch) of the last impression
+    daily    day number << 16 | impressions on that day
+
+A slot whose day has passed and whose minute window is over carries no information anymore, so it counts as
+free: it is overwritten by the next pair that needs a slot - entries expire without any cleanup pass. Lookups
+probe at most `max_probe` slots, so allowed() and record() are O(1); when the table is so full that none of them
+is free the least recently seen pair is evicted (and counted in `evicted`), which at worst lets that user see
+the campaign again early.
+
+Days start at local midnight, using the UTC offset of TIME_ZONE when the store was created (so a DST change
+moves the boundary by an hour until the store is recreated).
+"""
+
+import time
+from array import array
+
+from django.utils import timezone
+
+from campaign.models import Campaign
+
+# bytes per (user, campaign) pair
+SLOT_SIZE = 16
+KEY_BITS = 8 * array('L').itemsize
+KEY_MASK = (1 << KEY_BITS) - 1
+# Fibonacci hashing: the top bits of key * GOLDEN spread the (poorly mixed) tuple hashes over the table
+GOLDEN = 0x9E3779B97F4A7C15 & KEY_MASK
+
+
+class FrequencyStore(object):
+
+    def __init__(self, memory=64 * 1024 * 1024, max_probe=16, utc_offset=None, caps=None):
+        capacity = 1
+        while capacity * 2 * SLOT_SIZE <= memory:
+            capacity *= 2
+        self.capacity = capacity
+        self.max_probe = min(max_probe, capacity)
+        if utc_offset is None:
+            utc_offset = int(timezone.localtime(timezone.now()).utcoffset().total_seconds())
+        self.utc_offset = utc_offset
+        self.set_caps(caps or {})
+        self.evicted = 0
+
+        self._mask = capacity - 1
+        self._shift = KEY_BITS - capacity.bit_length() + 1
+        self._keys = array('L', [0]) * capacity
+        self._last = array('I', [0]) * capacity
+        self._daily = array('I', [0]) * capacity
+
+    def set_caps(self, caps):
+        """
+        @param caps: dict campaign_id -> (daily_frequency_cap, minutes_frequency)
+        """
+        self.caps = caps
+        # a slot can be reused once its day is over and its minute window too - the longest of all campaigns,
+        # since the slot doesn't know which campaign it belongs to
+        self.window = max([minutes for daily_cap, minutes in caps.values()] + [1])
+
+    def load_caps(self):
+        """
+        Load the frequency caps of the active campaigns.
+        """
+        self.set_caps(dict((id, (daily_cap, minutes)) for id, daily_cap, minutes in Campaign.objects.filter(
+            status=Campaign.STATUS_ACTIVE).values_list('id', 'daily_frequency_cap', 'minutes_frequency')))
+
+    @property
+    def memory(self):
+        return self.capacity * SLOT_SIZE
+
+    def _now(self, now):
+        seconds = time.time() if now is None else now
+        return int(seconds) // 60, (int(seconds) + self.utc_offset) // 86400
+
+    def _find(self, key):
+        """
+        The slot of `key`, or -1.
+        """
+        keys = self._keys
+        slot = (key * GOLDEN & KEY_MASK) >> self._shift
+        for i in xrange(self.max_probe):
+            stored = keys[slot]
+            if stored == key:
+                return slot
+            if stored == 0:
+                return -1
+            slot = (slot + 1) & self._mask
+        return -1
+
+    def allowed(self, user_id, campaign_id, now=None):
+        """
+        May `user_id` see `campaign_id` at `now` (epoch seconds, default: now)?
+        """
+        daily_cap, minutes = self.caps.get(campaign_id, (0, 0))
+        if not daily_cap and not minutes:
+            return True
+        slot = self._find(hash((user_id, campaign_id)) & KEY_MASK or 1)
+        if slot < 0:
+            return True
+        minute, day = self._now(now)
+        if minutes and minute - self._last[slot] < minutes:
+            return False
+        daily = self._daily[slot]
+        return not daily_cap or daily >> 16 != day or daily & 0xffff < daily_cap
+
+    def record(self, user_id, campaign_id, now=None):
+        """
+        Count an impression of `campaign_id` for `user_id` at `now` (epoch seconds, default: now).
+        """
+        minute, day = self._now(now)
+        key = hash((user_id, campaign_id)) & KEY_MASK or 1
+        keys, last, daily = self._keys, self._last, self._daily
+
+        # the slot of the pair, else the first free or expired one, else the least recently seen one
+        slot = (key * GOLDEN & KEY_MASK) >> self._shift
+        target = oldest = -1
+        for i in xrange(self.max_probe):
+            stored = keys[slot]
+            if stored == key:
+                target = slot
+                break
+            if stored == 0:
+                if target < 0:
+                    target = slot
+                break
+            if target < 0 and daily[slot] >> 16 != day and minute - last[slot] >= self.window:
+                target = slot
+            if oldest < 0 or last[slot] < last[oldest]:
+                oldest = slot
+            slot = (slot + 1) & self._mask
+        else:
+            if target < 0:
+                target = oldest
+                self.evicted += 1
+
+        if keys[target] != key:
+            keys[target] = key
+            daily[target] = 0
+        last[target] = minute
+        stored = daily[target]
+        if stored >> 16 != day:
+            daily[target] = day << 16 | 1
+        elif stored & 0xffff < 0xffff:
+            daily[target] = stored + 1
+
+    def stats(self):
+        used = self.capacity - self._keys.count(0)
+        return {'capacity': self.capacity, 'used': used, 'memory': self.memory, 'evicted': self.evicted}
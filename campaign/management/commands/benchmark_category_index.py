@@ -0,0 +1,64 @@
+
+import time
+import random
+
+from django.core.management.base import BaseCommand
+
+from campaign.category_index import CategoryIndex
+from config.categories import CategoryTree
+
+
+def iab_like_tree(top_level=26, children=15):
+    """
+    A CategoryTree shaped like the IAB taxonomy: IAB1..IABn, each with IABi-1..IABi-m subcategories.
+    """
+    categories, links = [], []
+    for i in range(1, top_level + 1):
+        parent_id = i * 1000
+        categories.append((parent_id, 'IAB%s' % i))
+        links.append((parent_id, parent_id, 0))
+        for j in range(1, children + 1):
+            categories.append((parent_id + j, 'IAB%s-%s' % (i, j)))
+            links += [(parent_id + j, parent_id + j, 0), (parent_id, parent_id + j, 1)]
+    return CategoryTree(categories, links)
+
+
+class Command(BaseCommand):
+    help = "Build a category index of made-up campaigns and time its lookups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaigns', type=int, default=50000)
+        parser.add_argument('--categories-per-campaign', type=int, default=3)
+        parser.add_argument('--lookups', type=int, default=100000)
+
+    def timeit(self, label, func, args_list):
+        start = time.time()
+        for args in args_list:
+            func(args)
+        elapsed = time.time() - start
+        self.stdout.write("%-28s %8.2f us/call" % (label, elapsed * 1e6 / len(args_list)))
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        tree = iab_like_tree()
+        category_ids = sorted(tree.codes)
+        codes = sorted(tree.ids_by_code)
+        campaign_ids = range(1, options['campaigns'] + 1)
+        targeting = [(campaign_id, category_id) for campaign_id in campaign_ids
+                     for category_id in rnd.sample(category_ids, options['categories_per_campaign'])]
+        eligible_ids = [campaign_id for campaign_id in campaign_ids if rnd.random() < .8]
+
+        index = CategoryIndex()
+        start = time.time()
+        index.build(eligible_ids=eligible_ids, tree=tree, targeting=targeting)
+        self.stdout.write("build: %d campaigns, %d categories in %.2f s" % (
+            len(campaign_ids), len(category_ids), time.time() - start))
+        sizes = [len(index.campaigns(code)) for code in codes]
+        self.stdout.write("campaigns per code: avg %d, max %d" % (sum(sizes) / len(sizes), max(sizes)))
+
+        n = options['lookups']
+        self.timeit("campaigns(code)", index.campaigns, [rnd.choice(codes) for i in range(n)])
+        self.timeit("match_any(3 codes)", index.match_any, [rnd.sample(codes, 3) for i in range(n // 10)])
+        self.timeit("match_all(2 codes)", index.match_all, [rnd.sample(codes, 2) for i in range(n // 10)])
+        self.timeit("update_campaign()", lambda args: index.update_campaign(*args),
+                    [(rnd.choice(campaign_ids), rnd.sample(category_ids, 3)) for i in range(n // 100)])
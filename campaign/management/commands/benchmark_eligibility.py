@@ -0,0 +1,56 @@
+
+import time
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from campaign.models import Campaign
+from campaign.eligibility import CampaignTable, evaluate, REASONS, NO_START, NO_END
+from account.models import Advertiser
+
+
+def random_table(size, today, seed=0):
+    """
+    A CampaignTable of `size` made-up campaigns, roughly mixed like the production ones.
+    """
+    rnd = np.random.RandomState(seed)
+    today = today.toordinal()
+    return CampaignTable(
+        ids=np.arange(1, size + 1),
+        status=rnd.choice([Campaign.STATUS_ACTIVE, Campaign.STATUS_PAUSED, Campaign.STATUS_PENDING], size,
+                          p=[.8, .15, .05]),
+        advertiser_status=rnd.choice([Advertiser.STATUS_ACTIVE, Advertiser.STATUS_PAUSED], size, p=[.95, .05]),
+        start=np.where(rnd.rand(size) < .5, NO_START, today + rnd.randint(-60, 10, size)),
+        end=np.where(rnd.rand(size) < .5, NO_END, today + rnd.randint(-10, 60, size)),
+        active_ads=rnd.randint(0, 5, size),
+        daily_cap=rnd.randint(0, 100, size) * 1000000,
+        monthly_cap=rnd.randint(0, 3000, size) * 1000000,
+        total_cap=np.zeros(size, dtype=np.int64))
+
+
+class Command(BaseCommand):
+    help = "Time the campaign eligibility engine on made-up campaign sets of growing size."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,500000,1000000',
+                            help="Comma separated numbers of campaigns.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per size; the best one is reported.")
+
+    def handle(self, *args, **options):
+        today = date.today()
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            table = random_table(size, today)
+            rnd = np.random.RandomState(1)
+            daily_spend = rnd.randint(0, 100, size) * 1000000
+            monthly_spend = rnd.randint(0, 3000, size) * 1000000
+            best = None
+            for i in range(options['repeat']):
+                start = time.time()
+                eligible_ids, reasons = evaluate(table, today, daily_spend=daily_spend, monthly_spend=monthly_spend)
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            counts = np.bincount(reasons, minlength=len(REASONS))
+            self.stdout.write("%8d campaigns: %8.2f ms (%5.0f ns/campaign), %d eligible" % (
+                size, best * 1000, best * 1e9 / size, len(eligible_ids)))
+            self.stdout.write("    " + ", ".join("%s: %d" % (name, counts[code]) for code, name in REASONS))
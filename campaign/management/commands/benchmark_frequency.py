@@ -0,0 +1,53 @@
+
+import time
+import random
+import resource
+
+from django.core.management.base import BaseCommand
+
+from campaign.frequency import FrequencyStore
+
+
+def max_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Command(BaseCommand):
+    help = "Fill a frequency cap store with made-up (user, campaign) pairs and time record() and allowed()."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pairs', type=int, default=20000000, help="Number of distinct (user, campaign) pairs.")
+        parser.add_argument('--campaigns', type=int, default=5000, help="Number of campaigns.")
+        parser.add_argument('--memory-mb', type=int, default=512, help="Memory budget of the store.")
+        parser.add_argument('--checks', type=int, default=1000000, help="Number of allowed() calls to time.")
+
+    def handle(self, *args, **options):
+        pairs, campaigns = options['pairs'], options['campaigns']
+        caps = dict((campaign_id, (3, 60)) for campaign_id in range(campaigns))
+        rss = max_rss()
+        store = FrequencyStore(memory=options['memory_mb'] * 1024 * 1024, caps=caps, utc_offset=0)
+        self.stdout.write("store: %s slots, %.0f MB (process grew by %.0f MB)" % (
+            store.capacity, store.memory / 2. ** 20, (max_rss() - rss) / 2. ** 20))
+
+        now = time.time()
+        start = time.time()
+        for i in xrange(pairs):
+            # users with their campaigns next to each other, like a real impression stream wouldn't: the
+            # worst case for the probing
+            store.record(i // campaigns * 7919 + 1, i % campaigns, now)
+        elapsed = time.time() - start
+        self.stdout.write("record: %d pairs in %.1f s, %.2f us/call" % (pairs, elapsed, elapsed * 1e6 / pairs))
+
+        rnd = random.Random(0)
+        samples = [rnd.randrange(pairs) for i in xrange(options['checks'])]
+        start = time.time()
+        allowed = 0
+        for i in samples:
+            allowed += store.allowed(i // campaigns * 7919 + 1, i % campaigns, now + 3600)
+        elapsed = time.time() - start
+        self.stdout.write("allowed: %d calls in %.1f s, %.2f us/call, %d allowed" % (
+            len(samples), elapsed, elapsed * 1e6 / len(samples), allowed))
+        stats = store.stats()
+        self.stdout.write("used %(used)s of %(capacity)s slots, %(evicted)s evicted" % stats)
+        self.stdout.write("process max RSS %.0f MB" % (max_rss() / 2. ** 20))
@@ -0,0 +1,80 @@
+import json
+import time
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tastypie.serializers import Serializer
+
+from cedar_fe.api_common import ApiSerializer, msgpack
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, NativeAdImageAsset
+from campaign.constants import CAMPAIGN_NATIVE, BID_CPM
+
+
+def random_page(campaigns, ads, seed=0):
+    """
+    A /api/v1/campaign/?expand=ads page of made-up campaigns, as the resource hands it to the serializer.
+    """
+    rnd = random.Random(seed)
+    now = timezone.now()
+    money = lambda: Decimal(rnd.randrange(0, 100000000)) / 1000000
+    objects = []
+    for i in xrange(1, campaigns + 1):
+        nativeads = [{
+            'id': i * ads + j, 'campaign_id': i, 'name': u'Ad %s of campaign %s' % (j, i), 'title': u'Title %s' % j,
+            'url': u'http://example.com/landing/%s/%s' % (i, j), 'status': NativeAd.STATUS_ACTIVE,
+            'created': now, 'updated': now, 'resource_uri': u'/api/v1/nativead/%s/' % (i * ads + j),
+            'dataassets': [{'asset_type': NativeAdDataAsset.TYPE_2, 'value': u'A description of the ad %s' % j},
+                           {'asset_type': NativeAdDataAsset.TYPE_12, 'value': u'Buy now'}],
+            'imageassets': [{'asset_type': NativeAdImageAsset.TYPE_3, 'filename': u'main%s.png' % j,
+                             'original_width': 1200, 'original_height': 627}],
+        } for j in xrange(ads)]
+        objects.append({
+            'id': i, 'advertiser_id': rnd.randrange(1, 100), 'name': u'Campaign %s' % i,
+            'campaign_type': CAMPAIGN_NATIVE, 'status': Campaign.STATUS_ACTIVE, 'bid_type': BID_CPM,
+            'bid': money(), 'min_bid': money(), 'daily_cap': money(), 'monthly_cap': money(), 'total_cap': money(),
+            'start_date': now.date(), 'end_date': None, 'daily_frequency_cap': 3, 'minutes_frequency': 60,
+            'created': now, 'updated': now, 'resource_uri': u'/api/v1/campaign/%s/' % i,
+            'ads': {'nativeads': nativeads},
+        })
+    return {'meta': {'limit': campaigns, 'next': None, 'previous': None}, 'objects': objects}
+
+
+class Command(BaseCommand):
+    help = ("Compare the payload size and the encode and decode times of a campaign list page with tastypie's "
+            "JSON serializer and the API's JSON and MessagePack ones.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaigns', type=int, default=1000, help="Campaigns on the page.")
+        parser.add_argument('--ads', type=int, default=3, help="Native ads per campaign.")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per format; the best one is reported.")
+
+    def best_time(self, function, repeat):
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            result = function()
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def handle(self, *args, **options):
+        data = random_page(options['campaigns'], options['ads'])
+        formats = [('tastypie json', Serializer().to_json, json.loads),
+                   ('api json', ApiSerializer().to_json, json.loads)]
+        if msgpack is not None:
+            formats.append(('api msgpack', ApiSerializer().to_msgpack,
+                            lambda content: msgpack.unpackb(content, encoding='utf-8')))
+        else:
+            self.stdout.write("msgpack isn't installed, MessagePack is left out")
+
+        baseline = None
+        for name, encode, decode in formats:
+            encode_time, content = self.best_time(lambda: encode(data, {}), options['repeat'])
+            decode_time, decoded = self.best_time(lambda: decode(content), options['repeat'])
+            size = len(content.encode('utf-8') if isinstance(content, unicode) else content)
+            baseline = baseline or (size, encode_time, decode_time)
+            self.stdout.write("%-14s %8.0f KB (%3.0f%%)  encode %7.1f ms (%3.0f%%)  decode %7.1f ms (%3.0f%%)" % (
+                name, size / 1024., 100. * size / baseline[0], encode_time * 1000, 100 * encode_time / baseline[1],
+                decode_time * 1000, 100 * decode_time / baseline[2]))
@@ -0,0 +1,16 @@
+
+from django.core.management.base import BaseCommand
+
+from campaign.outbox import compact_outbox
+
+
+class Command(BaseCommand):
+    help = "Delete the campaign outbox entries superseded by a later entry of the same object."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=int, default=None,
+                            help="Only compact the entries with a sequence number lower than this one.")
+
+    def handle(self, *args, **options):
+        deleted = compact_outbox(before=options['before'])
+        self.stdout.write("Deleted %s superseded outbox entries" % deleted)
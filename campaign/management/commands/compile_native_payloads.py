@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from campaign.models import NativeAd
+
+
+class Command(BaseCommand):
+    help = ("Compile the OpenRTB payloads of the native ads again, e.g. after a change of openrtb.PAYLOAD_VERSION "
+            "or of NATIVE_IMAGE_BASE_URL.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        ad_ids = list(NativeAd.objects.order_by('id').values_list('id', flat=True))
+        batch_size = options['batch_size']
+        written = sum(NativeAd.compile_payloads(ad_ids[start:start + batch_size])
+                      for start in range(0, len(ad_ids), batch_size))
+        self.stdout.write("Compiled %s ads, %s payloads changed" % (len(ad_ids), written))
@@ -0,0 +1,38 @@
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from campaign.snapshot import build_snapshot, encode_snapshot, decode_snapshot, from_epoch, SnapshotError
+
+
+class Command(BaseCommand):
+    help = "Write a bidder snapshot of all servable campaigns, or a delta since a previous snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Path of the snapshot file to write.")
+        parser.add_argument('--since', type=float, default=None,
+                            help="Write a delta with the changes after this epoch timestamp.")
+        parser.add_argument('--base', default=None,
+                            help="Write a delta with the changes since this previous snapshot file was generated.")
+
+    def handle(self, *args, **options):
+        since = options['since']
+        if options['base']:
+            try:
+                with open(options['base'], 'rb') as f:
+                    since = decode_snapshot(f.read())['generated']
+            except (IOError, SnapshotError) as e:
+                raise CommandError("Can't read base snapshot: %s" % e)
+
+        payload = build_snapshot(since=from_epoch(since))
+        data = encode_snapshot(payload)
+
+        # write to a temp file first so readers never see a partial snapshot
+        tmp_path = '%s.tmp' % options['output']
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, options['output'])
+
+        self.stdout.write("Wrote %s campaigns (%s removed) to %s, generated=%r" % (
+            len(payload['campaigns']), len(payload['removed']), options['output'], payload['generated']))
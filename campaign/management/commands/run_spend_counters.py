@@ -0,0 +1,38 @@
+
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from campaign.spend import SpendCounters
+
+
+class Command(BaseCommand):
+    help = ("Count campaign spend and enforce the caps. Reads spend events from stdin (or a file), one "
+            "\"<campaign_id> <amount in micros>\" per line.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', nargs='?', default=None, help="File to read the events from (default: stdin).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Number of events applied together.")
+
+    def handle(self, *args, **options):
+        counters = SpendCounters(flush_interval=getattr(settings, 'SPEND_FLUSH_INTERVAL', 10.0))
+        stream = open(options['input']) if options['input'] else sys.stdin
+        batch = []
+        try:
+            for line_number, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    campaign_id, amount = line.split()
+                    batch.append((int(campaign_id), int(amount)))
+                except ValueError:
+                    raise CommandError("Invalid spend event on line %s: %r" % (line_number, line))
+                if len(batch) >= options['batch_size']:
+                    counters.apply(batch)
+                    batch = []
+            if batch:
+                counters.apply(batch)
+        finally:
+            counters.flush()
+        self.stdout.write("Applied %(applied)s spend events, %(paused)s campaigns paused" % counters.stats())
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0002_sync_models'),
+        ('campaign', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignCategories',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('max_bid', models.DecimalField(null=True, max_digits=14, decimal_places=6)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CampaignDevices',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('max_bid', models.DecimalField(null=True, max_digits=14, decimal_places=6)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='campaign',
+            name='bid_type',
+            field=models.IntegerField(choices=[(1, b'CPM'), (2, b'CPC')]),
+        ),
+        migrations.AlterField(
+            model_name='campaign',
+            name='campaign_type',
+            field=models.IntegerField(choices=[(1, b'Pending'), (2, b'Active'), (3, b'Paused'), (4, b'Deleted')]),
+        ),
+        migrations.AlterField(
+            model_name='campaign',
+            name='status',
+            field=models.IntegerField(default=1),
+        ),
+        migrations.AlterField(
+            model_name='nativead',
+            name='campaign',
+            field=models.ForeignKey(related_name='nativeads', to='campaign.Campaign'),
+        ),
+        migrations.AlterField(
+            model_name='nativead',
+            name='status',
+            field=models.IntegerField(default=1, choices=[(1, b'Pending'), (2, b'Active'), (3, b'Paused'), (4, b'Deleted')]),
+        ),
+        migrations.AlterField(
+            model_name='nativeaddataasset',
+            name='asset_type',
+            field=models.IntegerField(choices=[(1, b'Sponsored'), (2, b'Description'), (3, b'Rating'), (4, b'Likes'), (5, b'Downloads'), (6, b'Price'), (7, b'SalePrice'), (8, b'Phone'), (9, b'Address'), (10, b'Description2'), (11, b'DisplayURL'), (12, b'CTAText')]),
+        ),
+        migrations.AlterField(
+            model_name='nativeadimageasset',
+            name='asset_type',
+            field=models.IntegerField(choices=[(1, b'Icon'), (2, b'Logo'), (3, b'Main')]),
+        ),
+        migrations.AddField(
+            model_name='campaigndevices',
+            name='campaign',
+            field=models.ForeignKey(related_name='campaign_devices', to='campaign.Campaign'),
+        ),
+        migrations.AddField(
+            model_name='campaigndevices',
+            name='device',
+            field=models.ForeignKey(to='config.Device'),
+        ),
+        migrations.AddField(
+            model_name='campaigncategories',
+            name='campaign',
+            field=models.ForeignKey(related_name='campaign_categories', to='campaign.Campaign'),
+        ),
+        migrations.AddField(
+            model_name='campaigncategories',
+            name='category',
+            field=models.ForeignKey(to='config.Category'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_type', models.CharField(max_length=32)),
+                ('object_id', models.IntegerField()),
+                ('campaign_id', models.IntegerField()),
+                ('action', models.IntegerField(choices=[(1, b'Save'), (2, b'Delete')])),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='outboxentry',
+            index_together=set([('object_type', 'object_id')]),
+        ),
+    ]
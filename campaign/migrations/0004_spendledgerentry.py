@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0003_outboxentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendLedgerEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('day', models.DateField()),
+                ('amount', models.BigIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('campaign', models.ForeignKey(related_name='spend_entries', to='campaign.Campaign')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='spendledgerentry',
+            index_together=set([('campaign', 'day')]),
+        ),
+    ]
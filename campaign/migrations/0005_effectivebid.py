@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+ANY = 0
+
+
+def compute(bid, min_bid, categories, devices):
+    # EffectiveBid.compute() as of this migration
+    rows = []
+    for category_id, category_bid in categories or [(ANY, None)]:
+        for device_id, device_bid in devices or [(ANY, None)]:
+            overrides = [b for b in (category_bid, device_bid) if b is not None]
+            rows.append((category_id, device_id, max(min(overrides) if overrides else bid, min_bid)))
+    return rows
+
+
+def build_effective_bids(apps, schema_editor):
+    Campaign = apps.get_model('campaign', 'Campaign')
+    CampaignCategories = apps.get_model('campaign', 'CampaignCategories')
+    CampaignDevices = apps.get_model('campaign', 'CampaignDevices')
+    EffectiveBid = apps.get_model('campaign', 'EffectiveBid')
+    categories, devices = {}, {}
+    for campaign_id, category_id, max_bid in CampaignCategories.objects.values_list('campaign_id', 'category_id',
+                                                                                    'max_bid'):
+        categories.setdefault(campaign_id, []).append((category_id, max_bid))
+    for campaign_id, device_id, max_bid in CampaignDevices.objects.values_list('campaign_id', 'device_id', 'max_bid'):
+        devices.setdefault(campaign_id, []).append((device_id, max_bid))
+    rows = [EffectiveBid(campaign_id=campaign_id, category_id=category_id, device_id=device_id, bid=bid)
+            for campaign_id, bid, min_bid in Campaign.objects.values_list('id', 'bid', 'min_bid')
+            for category_id, device_id, bid in compute(bid, min_bid, categories.get(campaign_id),
+                                                       devices.get(campaign_id))]
+    EffectiveBid.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0004_spendledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EffectiveBid',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('category_id', models.IntegerField(default=0)),
+                ('device_id', models.IntegerField(default=0)),
+                ('bid', models.DecimalField(max_digits=14, decimal_places=6)),
+                ('campaign', models.ForeignKey(related_name='effective_bids', to='campaign.Campaign')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='effectivebid',
+            unique_together=set([('campaign', 'category_id', 'device_id')]),
+        ),
+        migrations.RunPython(build_effective_bids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0005_effectivebid'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='campaign',
+            index_together=set([('updated', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='nativead',
+            index_together=set([('updated', 'id')]),
+        ),
+    ]
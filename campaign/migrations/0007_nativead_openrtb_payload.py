@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def compile_payloads(apps, schema_editor):
+    from campaign.openrtb import native_payload, PAYLOAD_VERSION
+    NativeAd = apps.get_model('campaign', 'NativeAd')
+    NativeAdDataAsset = apps.get_model('campaign', 'NativeAdDataAsset')
+    NativeAdImageAsset = apps.get_model('campaign', 'NativeAdImageAsset')
+    data_assets, image_assets = {}, {}
+    for ad_id, asset_type, value in NativeAdDataAsset.objects.order_by('id').values_list('ad_id', 'asset_type',
+                                                                                          'value'):
+        data_assets.setdefault(ad_id, []).append((asset_type, value))
+    for asset in NativeAdImageAsset.objects.order_by('id').values_list('ad_id', 'asset_type', 'filename',
+                                                                      'original_width', 'original_height'):
+        image_assets.setdefault(asset[0], []).append(asset[1:])
+    for ad_id, title, url in NativeAd.objects.values_list('id', 'title', 'url'):
+        payload, digest = native_payload(title, url, data_assets.get(ad_id, []), image_assets.get(ad_id, []))
+        NativeAd.objects.filter(id=ad_id).update(openrtb_payload=payload, openrtb_hash=digest,
+                                                 openrtb_version=PAYLOAD_VERSION)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaign', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nativead',
+            name='openrtb_hash',
+            field=models.CharField(default=b'', max_length=40, blank=True),
+        ),
+        migrations.AddField(
+            model_name='nativead',
+            name='openrtb_payload',
+            field=models.TextField(default=b'', blank=True),
+        ),
+        migrations.AddField(
+            model_name='nativead',
+            name='openrtb_version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(compile_payloads, migrations.RunPython.noop),
+    ]
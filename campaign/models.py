@@ -1,11 +1,19 @@
 
-from django.db import models
+import threading
+
+from django.db import models, transaction, connections, router
+from django.db.models.signals import pre_delete, post_save, post_delete
+from django.dispatch import receiver, Signal
 from django.forms.models import model_to_dict
+from django.utils import timezone
 from datetime import timedelta, datetime, date
 
 from campaign.constants import *
 from account.models import Advertiser
-from config.models import Category
+from config.models import Category, Device
+from cedar_fe.db_common import bulk_update, bulk_create_with_ids, on_commit
+from cedar_fe.response_cache import response_cache
+from campaign.openrtb import native_payload, load_payload, PAYLOAD_VERSION
 
 
 
@@ -72,6 +80,10 @@ class Campaign(models.Model):
     # schedule - like adon(hours per selected days) or like lyfe(same hours for all selected days)?
     # keywords - per ad or per campaign?
 
+    class Meta:
+        # API list pages by (updated, id), see cedar_fe.api_common.KeysetPaginator
+        index_together = [('updated', 'id')]
+
     def set_status(self, new_status, save=True):
         """
         This method should always be used when changing a campaign status because extra checks will be required
@@ -86,6 +98,51 @@ class Campaign(models.Model):
         if save:
             self.save()
 
+    @classmethod
+    def bulk_set_status(cls, campaigns, new_status):
+        """
+        set_status() on many campaigns, saved with a single UPDATE (and outbox write) instead of one save each.
+
+        @param campaigns: list of Campaign instances
+        @param new_status: integer
+        """
+        campaigns = list(campaigns)
+        if not campaigns:
+            return
+        now = timezone.now()
+        for campaign in campaigns:
+            campaign.set_status(new_status, save=False)
+            campaign.updated = now
+        with transaction.atomic():
+            bulk_update(cls, campaigns, ['status', 'updated'])
+            OutboxEntry.record(campaigns)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Campaign, cls).from_db(db, field_names, values)
+        # to know in save() whether the effective bids must be recomputed
+        instance._stored_bids = (instance.__dict__.get('bid'), instance.__dict__.get('min_bid'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # the outbox entry and the effective bids are written in the same transaction as the change
+        with transaction.atomic():
+            creating = self.pk is None
+            super(Campaign, self).save(*args, **kwargs)
+            OutboxEntry.record([self])
+            if creating:
+                EffectiveBid.create_defaults([self])
+            elif (self.bid, self.min_bid) != getattr(self, '_stored_bids', None):
+                EffectiveBid.refresh([self.id])
+        self._stored_bids = (self.bid, self.min_bid)
+
+    def outbox_campaign_id(self):
+        return self.id
+
+    def cached_responses(self):
+        # (resource_name, id) of the cached API responses with this object, see cedar_fe.response_cache
+        return [('campaign', self.id)]
+
 class CampaignCategories(models.Model):
     # TBD
     
@@ -98,7 +155,7 @@ class CampaignCategories(models.Model):
 class CampaignDevices(models.Model):
     # TBD
     
-    campaign = models.ForeignKey(Campaign, related_name='campaign_categories')
+    campaign = models.ForeignKey(Campaign, related_name='campaign_devices')
     device = models.ForeignKey(Device) #?
     # overwrites the campaign level bid; if left null, the campaign's bid will be used
     max_bid = models.DecimalField(max_digits=14, decimal_places=6, null=True)
@@ -139,10 +196,21 @@ class AbstractAd(models.Model):
         # make sure the campaign can have this type of ads
         if related_name not in CAMPAIGN_TYPES[self.campaign.campaign_type]['available_ad_types']:
             raise Exception("Cannot add %s for a %s campaign type" % (related_name, CAMPAIGN_TYPES[self.campaign.campaign_type]['name']))
-        super(AbstractAd, self).save(*args, **kwargs)
+        with transaction.atomic():
+            super(AbstractAd, self).save(*args, **kwargs)
+            OutboxEntry.record([self])
+
+    def outbox_campaign_id(self):
+        return self.campaign_id
+
+    def cached_responses(self):
+        # campaigns are serialized with their ads
+        return [(self._meta.model_name, self.id), ('campaign', self.campaign_id)]
 
     class Meta:
         abstract = True
+        # API list pages by (updated, id), see cedar_fe.api_common.KeysetPaginator
+        index_together = [('updated', 'id')]
 
 ############################################################################################################
 # Native Ads related models
@@ -153,23 +221,126 @@ class NativeAd(AbstractAd):
     """
     title = models.CharField(max_length=128)
 
+    # the OpenRTB native response object of the ad and its assets (see campaign.openrtb), compiled on every write:
+    # its JSON, its sha1 and the openrtb.PAYLOAD_VERSION it was compiled with
+    openrtb_payload = models.TextField(blank=True, default='')
+    openrtb_hash = models.CharField(max_length=40, blank=True, default='')
+    openrtb_version = models.IntegerField(default=0)
+
+    PAYLOAD_FIELDS = ['openrtb_payload', 'openrtb_hash', 'openrtb_version']
+
+    @property
+    def openrtb(self):
+        return load_payload(self.openrtb_payload)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            # written by compile_payloads() only: the ones of this instance may be older than the stored ones
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in self.PAYLOAD_FIELDS]
+        with transaction.atomic():
+            super(NativeAd, self).save(*args, **kwargs)
+            NativeAd.compile_payloads([self.id], instances=[self], record=False)
+
+    @classmethod
+    def compile_payloads(cls, ad_ids, instances=(), record=True):
+        """
+        Compile the OpenRTB payloads of the given ads with three queries, and write the ones that changed with one
+        UPDATE, which also bumps their `updated`. The payloads of the ads in `instances` are updated too. Returns
+        the number of payloads written.
+
+        @param record: record the ads whose payload changed in the outbox (which drops their cached responses);
+                       False when the caller records them itself
+        """
+        ad_ids = set(ad_ids) - _deleting_ads.__dict__.get('ids', set())
+        if not ad_ids:
+            return 0
+        data_assets, image_assets = {}, {}
+        for ad_id, asset_type, value in NativeAdDataAsset.objects.filter(ad__in=ad_ids).order_by('id').values_list(
+                'ad_id', 'asset_type', 'value'):
+            data_assets.setdefault(ad_id, []).append((asset_type, value))
+        for asset in NativeAdImageAsset.objects.filter(ad__in=ad_ids).order_by('id').values_list(
+                'ad_id', 'asset_type', 'filename', 'original_width', 'original_height'):
+            image_assets.setdefault(asset[0], []).append(asset[1:])
+
+        changed, compiled = [], {}
+        now = timezone.now()
+        for ad in cls.objects.filter(id__in=ad_ids).only('campaign', 'title', 'url', 'openrtb_hash',
+                                                         'openrtb_version'):
+            payload, digest = native_payload(ad.title, ad.url, data_assets.get(ad.id, []), image_assets.get(ad.id, []))
+            compiled[ad.id] = (payload, digest, PAYLOAD_VERSION)
+            if (digest, PAYLOAD_VERSION) != (ad.openrtb_hash, ad.openrtb_version):
+                # the payload is part of the API representation of the ad (its ETag and Last-Modified); not the
+                # deferred instance, whose model name isn't the ad's
+                changed.append(cls(id=ad.id, campaign_id=ad.campaign_id, openrtb_payload=payload, openrtb_hash=digest,
+                                   openrtb_version=PAYLOAD_VERSION, updated=now))
+        if changed:
+            with transaction.atomic():
+                bulk_update(cls, changed, cls.PAYLOAD_FIELDS + ['updated'])
+                if record:
+                    OutboxEntry.record(changed)
+        changed_ids = set(ad.id for ad in changed)
+        for ad in instances:
+            if ad.id in compiled:
+                ad.openrtb_payload, ad.openrtb_hash, ad.openrtb_version = compiled[ad.id]
+            if ad.id in changed_ids:
+                ad.updated = now
+        return len(changed)
+
     def set_data_assets(self, data_assets_list):
-        das = []
-        for item in data_assets_list:
-            da = NativeAdDataAsset()
-            for k in ['asset_type', 'value']:
-                setattr(da, k, item[k])
-            das.append(da)
-        self.data_assets = das
-    
+        return self.sync_assets(NativeAdDataAsset, {self: data_assets_list})
+
     def set_image_assets(self, image_assets_list):
-        ias = []
-        for item in image_assets_list:
-            ia = NativeAdImageAsset()
-            for k in ['asset_type', 'filename', 'original_width', 'original_height']:
-                setattr(ia, k, item[k])
-            ias.append(ia)
-        self.image_assets = ias
+        return self.sync_assets(NativeAdImageAsset, {self: image_assets_list})
+
+    @staticmethod
+    def sync_assets(asset_model, assets_by_ad):
+        """
+        Make the stored assets of each ad match its list of items (dicts as returned by the asset's to_dict()).
+
+        Incoming items are matched with the stored rows of the same asset_type (in order), so only the rows that
+        actually changed are written: new ones with one bulk INSERT, changed ones with one bulk UPDATE and
+        extra ones with one DELETE, for all the ads at once and in a single transaction.
+        Returns a (created, updated, deleted) tuple of counts.
+        """
+        fields = asset_model.ASSET_FIELDS
+        related_name = asset_model._meta.get_field('ad').related_query_name()
+        with transaction.atomic():
+            ads = dict((ad.id, ad) for ad in assets_by_ad)
+            stored = {}
+            for asset in asset_model.objects.filter(ad__in=list(ads)).order_by('id'):
+                asset.ad = ads[asset.ad_id]
+                stored.setdefault((asset.ad_id, asset.asset_type), []).append(asset)
+
+            to_create, to_update = [], []
+            for ad, items in assets_by_ad.items():
+                for item in items:
+                    values = dict((k, asset_model._meta.get_field(k).to_python(item[k])) for k in fields)
+                    same_type = stored.get((ad.id, values['asset_type']))
+                    asset = same_type.pop(0) if same_type else asset_model(ad=ad)
+                    if asset.pk and all(getattr(asset, k) == v for k, v in values.items()):
+                        continue
+                    for k, v in values.items():
+                        setattr(asset, k, v)
+                    asset.validate()
+                    (to_update if asset.pk else to_create).append(asset)
+            to_delete = [asset for assets in stored.values() for asset in assets]
+
+            if to_create:
+                bulk_create_with_ids(asset_model, to_create)
+            if to_update:
+                bulk_update(asset_model, to_update, fields)
+            if to_delete:
+                # assets have no dependent rows: delete them without loading them again one by one
+                asset_model.objects.filter(pk__in=[asset.pk for asset in to_delete])._raw_delete(asset_model.objects.db)
+            OutboxEntry.record(to_create + to_update)
+            OutboxEntry.record(to_delete, action=OutboxEntry.ACTION_DELETE)
+            NativeAd.compile_payloads(ad.id for ad in assets_by_ad)
+
+        # drop whatever was prefetched for these ads
+        for ad in assets_by_ad:
+            getattr(ad, '_prefetched_objects_cache', {}).pop(related_name, None)
+        return len(to_create), len(to_update), len(to_delete)
 
 
 class NativeAdDataAsset(models.Model):
@@ -210,13 +381,16 @@ class NativeAdDataAsset(models.Model):
     }
     
     ad = models.ForeignKey(NativeAd, related_name="data_assets")
-    asset_type = models.IntegerField(choices=[(k, v) for k,v['name'] in DATA_TYPES.items()])
+    asset_type = models.IntegerField(choices=[(k, v['name']) for k,v in DATA_TYPES.items()])
     value = models.CharField(max_length=256)
     
+    # fields set from / returned to the API
+    ASSET_FIELDS = ['asset_type', 'value']
+
     def to_dict(self):
-        return model_to_dict(self, fields=['asset_type', 'value'])
-    
-    def save(self, *args, **kwargs):
+        return model_to_dict(self, fields=self.ASSET_FIELDS)
+
+    def validate(self):
         assert self.asset_type in self.DATA_TYPES
         # try to convert the value to the OpenRTB required type
         # (even though it will still be saved as str, we need to make sure it complies to OpenRTB requirements)
@@ -226,7 +400,18 @@ class NativeAdDataAsset(models.Model):
             raise Exception("Invalid value type for data type %s (%s). Should be %s" % (self.asset_type,
                                                                         self.DATA_TYPES[self.asset_type]['name'],
                                                                         self.DATA_TYPES[self.asset_type]['data_type']))
-        super(NativeAdDataAsset, self).save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.validate()
+        with transaction.atomic():
+            super(NativeAdDataAsset, self).save(*args, **kwargs)
+            OutboxEntry.record([self])
+
+    def outbox_campaign_id(self):
+        return self.ad.campaign_id
+
+    def cached_responses(self):
+        return [('nativead', self.ad_id), ('campaign', self.ad.campaign_id)]
 
 
 class NativeAdImageAsset(models.Model):
@@ -252,16 +437,241 @@ class NativeAdImageAsset(models.Model):
     original_width = models.IntegerField()
     original_height = models.IntegerField()
     
+    # fields set from / returned to the API
+    ASSET_FIELDS = ['asset_type', 'filename', 'original_width', 'original_height']
+
     def to_dict(self):
-        return model_to_dict(self, fields=['asset_type', 'filename', 'original_width', 'original_height'])
+        return model_to_dict(self, fields=self.ASSET_FIELDS)
 
-    def save(self, *args, **kwargs):
+    def validate(self):
         assert self.asset_type in self.IMAGE_TYPES
-        super(NativeAdImageAsset, self).save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.validate()
+        with transaction.atomic():
+            super(NativeAdImageAsset, self).save(*args, **kwargs)
+            OutboxEntry.record([self])
+
+    def outbox_campaign_id(self):
+        return self.ad.campaign_id
+
+    def cached_responses(self):
+        return [('nativead', self.ad_id), ('campaign', self.ad.campaign_id)]
 
 
 
 ############################################################################################################
 
 
+class OutboxEntry(models.Model):
+    """
+    Change feed of the serving configuration: one entry is written, in the same transaction, for every saved or
+    deleted Campaign, NativeAd and native ad asset, and for the campaign of a changed category or device bid.
+    Consumers page through it by `id`, which is the sequence number (see campaign.outbox).
+
+    Writers hold a lock on the outbox until they commit (on PostgreSQL), so entries become visible in sequence
+    order and a consumer never skips an entry that commits late. Changes made with QuerySet.update() or
+    bulk_create() must be recorded explicitly with record().
+    """
+
+    ACTION_SAVE = 1
+    ACTION_DELETE = 2
+
+    ACTIONS = {
+        ACTION_SAVE: 'Save',
+        ACTION_DELETE: 'Delete'
+    }
+
+    # pg_advisory_xact_lock key taken by the outbox writers
+    LOCK_ID = 0x6f7574626f78
+
+    # model_name of the changed object: campaign, nativead, nativeaddataasset, nativeadimageasset
+    object_type = models.CharField(max_length=32)
+    object_id = models.IntegerField()
+    # the campaign to reload; not a foreign key since entries outlive deleted campaigns
+    campaign_id = models.IntegerField()
+    action = models.IntegerField(choices=[(k, v) for k,v in ACTIONS.items()])
+
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [('object_type', 'object_id')]
+
+    @classmethod
+    def record(cls, objs, action=ACTION_SAVE):
+        """
+        Write one entry per object (campaigns, ads or assets, they must have outbox_campaign_id()), and drop the
+        cached API responses with these objects, now and after the commit.
+        """
+        objs = list(objs)
+        using = router.db_for_write(cls)
+        cached = set(key for obj in objs for key in obj.cached_responses())
+        if cached and response_cache.enabled:
+            response_cache.invalidate(cached)
+            # and again once committed: a read racing this transaction can have cached the old rows meanwhile
+            on_commit(lambda: response_cache.invalidate(cached), using=using)
+        entries = [cls(object_type=obj._meta.model_name, object_id=obj.pk, campaign_id=obj.outbox_campaign_id(),
+                       action=action) for obj in objs]
+        if not entries:
+            return
+        connection = connections[using]
+        with transaction.atomic(using=using):
+            if connection.vendor == 'postgresql':
+                connection.cursor().execute("SELECT pg_advisory_xact_lock(%s)", [cls.LOCK_ID])
+            cls.objects.using(using).bulk_create(entries)
+
+
+@receiver(pre_delete, sender=Campaign, dispatch_uid='outbox_campaign')
+@receiver(pre_delete, sender=NativeAd, dispatch_uid='outbox_nativead')
+@receiver(pre_delete, sender=NativeAdDataAsset, dispatch_uid='outbox_nativeaddataasset')
+@receiver(pre_delete, sender=NativeAdImageAsset, dispatch_uid='outbox_nativeadimageasset')
+def record_delete(sender, instance, **kwargs):
+    # pre_delete runs in the delete's transaction, while the parent rows are still there
+    OutboxEntry.record([instance], action=OutboxEntry.ACTION_DELETE)
+
+
+class SpendLedgerEntry(models.Model):
+    """
+    Campaign spend, in integer micros, as flushed by the spend counters (see campaign.spend): every flush adds
+    one entry per campaign with the spend since the previous flush. A campaign's daily, monthly or total spend
+    is the sum of its entries over the period.
+    """
+
+    campaign = models.ForeignKey(Campaign, related_name='spend_entries')
+    # the (local) day the spend happened on
+    day = models.DateField()
+    amount = models.BigIntegerField()
+
+    created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        index_together = [('campaign', 'day')]
+
+
+# sent with the ids of the campaigns whose EffectiveBid rows were rewritten
+effective_bids_changed = Signal(providing_args=['campaign_ids'])
+
+
+class EffectiveBid(models.Model):
+    """
+    The final bid of a campaign for each (category, device) combination it targets, so the bid rules are applied
+    when the targeting changes instead of on every decision (see also campaign.bids for the in-memory copy).
+
+    Campaign.bid is the default; the max_bid of the CampaignCategories / CampaignDevices row overrides it when
+    not null (the lower one if both are set); the result is never lower than Campaign.min_bid. A campaign that
+    doesn't target any category (device) has rows with category_id (device_id) ANY.
+
+    The rows of a campaign are rewritten whenever its bids, categories or devices are saved or deleted; bulk
+    writes that bypass save() must call refresh() / create_defaults().
+    """
+
+    ANY = 0
+
+    campaign = models.ForeignKey(Campaign, related_name='effective_bids')
+    # not foreign keys: they can be ANY
+    category_id = models.IntegerField(default=ANY)
+    device_id = models.IntegerField(default=ANY)
+    bid = models.DecimalField(max_digits=14, decimal_places=6)
+
+    class Meta:
+        unique_together = [('campaign', 'category_id', 'device_id')]
+
+    @staticmethod
+    def compute(bid, min_bid, categories, devices):
+        """
+        @param categories / devices: (id, max_bid) pairs of the campaign
+        @return: list of (category_id, device_id, bid)
+        """
+        rows = []
+        for category_id, category_bid in categories or [(EffectiveBid.ANY, None)]:
+            for device_id, device_bid in devices or [(EffectiveBid.ANY, None)]:
+                overrides = [b for b in (category_bid, device_bid) if b is not None]
+                rows.append((category_id, device_id, max(min(overrides) if overrides else bid, min_bid)))
+        return rows
+
+    @classmethod
+    def create_defaults(cls, campaigns):
+        """
+        Rows of new campaigns, that can't have categories or devices yet (one INSERT, no reads).
+        """
+        campaigns = list(campaigns)
+        cls.objects.bulk_create([cls(campaign_id=campaign.id, bid=bid, category_id=category_id, device_id=device_id)
+                                 for campaign in campaigns
+                                 for category_id, device_id, bid in cls.compute(campaign.bid, campaign.min_bid, [], [])])
+        effective_bids_changed.send(sender=cls, campaign_ids=[campaign.id for campaign in campaigns])
+
+    @classmethod
+    def refresh(cls, campaign_ids):
+        """
+        Recompute the rows of the given campaigns.
+        """
+        campaign_ids = list(campaign_ids)
+        if not campaign_ids:
+            return
+        categories, devices = {}, {}
+        for campaign_id, category_id, max_bid in CampaignCategories.objects.filter(
+                campaign__in=campaign_ids).values_list('campaign_id', 'category_id', 'max_bid'):
+            categories.setdefault(campaign_id, []).append((category_id, max_bid))
+        for campaign_id, device_id, max_bid in CampaignDevices.objects.filter(
+                campaign__in=campaign_ids).values_list('campaign_id', 'device_id', 'max_bid'):
+            devices.setdefault(campaign_id, []).append((device_id, max_bid))
+        rows = [cls(campaign_id=campaign_id, category_id=category_id, device_id=device_id, bid=bid)
+                for campaign_id, bid, min_bid in Campaign.objects.filter(id__in=campaign_ids).values_list(
+                    'id', 'bid', 'min_bid')
+                for category_id, device_id, bid in cls.compute(bid, min_bid, categories.get(campaign_id),
+                                                               devices.get(campaign_id))]
+        with transaction.atomic():
+            cls.objects.filter(campaign__in=campaign_ids)._raw_delete(cls.objects.db)
+            cls.objects.bulk_create(rows)
+        effective_bids_changed.send(sender=cls, campaign_ids=campaign_ids)
+
+
+# ids of the campaigns being deleted in this thread: their categories and devices go with them
+_deleting_campaigns = threading.local()
+
+
+@receiver([pre_delete, post_delete], sender=Campaign, dispatch_uid='effective_bids_campaign')
+def track_deleted_campaign(sender, instance, signal, **kwargs):
+    deleting = _deleting_campaigns.__dict__.setdefault('ids', set())
+    if signal is pre_delete:
+        deleting.add(instance.id)
+    else:
+        deleting.discard(instance.id)
+
+
+@receiver([post_save, post_delete], sender=CampaignCategories, dispatch_uid='effective_bids_categories')
+@receiver([post_save, post_delete], sender=CampaignDevices, dispatch_uid='effective_bids_devices')
+def refresh_effective_bids(sender, instance, **kwargs):
+    if instance.campaign_id not in _deleting_campaigns.__dict__.get('ids', ()):
+        EffectiveBid.refresh([instance.campaign_id])
+
+
+@receiver([post_save, post_delete], sender=CampaignCategories, dispatch_uid='touch_campaign_categories')
+@receiver([post_save, post_delete], sender=CampaignDevices, dispatch_uid='touch_campaign_devices')
+def touch_campaign(sender, instance, **kwargs):
+    # the max bids are part of the campaign for the bidder (snapshot deltas, outbox) and its cached responses
+    if instance.campaign_id not in _deleting_campaigns.__dict__.get('ids', ()):
+        campaign = instance.campaign
+        campaign.updated = timezone.now()
+        with transaction.atomic():
+            Campaign.objects.filter(id=campaign.id).update(updated=campaign.updated)
+            OutboxEntry.record([campaign])
+
+
+# ids of the ads being deleted in this thread: their assets go with them
+_deleting_ads = threading.local()
+
+
+@receiver([pre_delete, post_delete], sender=NativeAd, dispatch_uid='openrtb_payload_ad')
+def track_deleted_ad(sender, instance, signal, **kwargs):
+    deleting = _deleting_ads.__dict__.setdefault('ids', set())
+    if signal is pre_delete:
+        deleting.add(instance.id)
+    else:
+        deleting.discard(instance.id)
+
+
+@receiver([post_save, post_delete], sender=NativeAdDataAsset, dispatch_uid='openrtb_payload_data_asset')
+@receiver([post_save, post_delete], sender=NativeAdImageAsset, dispatch_uid='openrtb_payload_image_asset')
+def compile_ad_payload(sender, instance, **kwargs):
+    NativeAd.compile_payloads([instance.ad_id])
@@ -0,0 +1,63 @@
+"""
+OpenRTB native response payloads.
+
+A native ad and its assets map to the `native` object of an OpenRTB Native 1.2 response:
+
+    {"ver": "1.2", "link": {"url": ...},
+     "assets": [{"id": 1, "title": {"text": ...}},
+                {"id": 2, "img": {"type": 3, "url": ..., "w": 1200, "h": 627}},
+                {"id": 3, "data": {"type": 2, "value": ...}}]}
+
+It is compiled when the ad or its assets are written (see NativeAd.compile_payloads) and stored as JSON on the
+ad with its sha1 and the PAYLOAD_VERSION of the code that compiled it, so serving an ad is reading one column.
+Asset ids are positions (title, then images, then data assets, each in their stored order); the bidder gives
+them the ids of the matching assets of the bid request, by type.
+"""
+
+import json
+import hashlib
+
+from django.conf import settings
+from django.core import checks
+
+NATIVE_VERSION = '1.2'
+# bump when the payload layout changes, so the stored payloads get recompiled (compile_native_payloads command)
+PAYLOAD_VERSION = 1
+
+
+def native_payload(title, url, data_assets, image_assets, image_base_url=None):
+    """
+    @param data_assets: (asset_type, value) pairs
+    @param image_assets: (asset_type, filename, width, height) tuples
+    @return: (payload JSON, its sha1 hex digest)
+    """
+    if image_base_url is None:
+        image_base_url = getattr(settings, 'NATIVE_IMAGE_BASE_URL', '')
+    assets = [{'title': {'text': title}}]
+    assets.extend({'img': {'type': asset_type, 'url': image_base_url + filename, 'w': width, 'h': height}}
+                  for asset_type, filename, width, height in image_assets)
+    assets.extend({'data': {'type': asset_type, 'value': value}} for asset_type, value in data_assets)
+    for position, asset in enumerate(assets):
+        asset['id'] = position + 1
+    payload = json.dumps({'ver': NATIVE_VERSION, 'link': {'url': url}, 'assets': assets},
+                         sort_keys=True, separators=(',', ':'))
+    return payload, hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def load_payload(payload):
+    """
+    The native object of a stored payload, None if it was never compiled.
+    """
+    return json.loads(payload) if payload else None
+
+
+@checks.register()
+def check_image_base_url(app_configs, **kwargs):
+    # the img.url of a native response must be a URL, not just the asset's filename
+    if not getattr(settings, 'NATIVE_IMAGE_BASE_URL', '').startswith(('http://', 'https://')):
+        return [checks.Warning("NATIVE_IMAGE_BASE_URL is not an http(s) URL, the image assets of the OpenRTB native "
+                               "payloads won't have valid URLs.",
+                               hint="Set it to the URL the image asset files are served from, then run the "
+                                    "compile_native_payloads command.",
+                               id='campaign.W001')]
+    return []
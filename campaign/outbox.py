@@ -0,0 +1,55 @@
+"""
+Reading the campaign change outbox (see campaign.models.OutboxEntry).
+
+A consumer keeps the `id` of the last entry it has processed as its cursor and asks for the entries after it:
+
+    entries, cursor = read_changes(cursor)
+
+An entry only says that an object changed (or was deleted); the consumer reloads the campaign it belongs to.
+Entries superseded by a later entry of the same object are dropped by compact_outbox(), so a consumer whose
+cursor is older than the compaction can see only the latest entry of an object - which is all it needs.
+"""
+
+from django.db import transaction
+from django.db.models import Max
+
+from campaign.models import OutboxEntry
+from campaign.snapshot import epoch
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+def serialize_entry(entry):
+    return {
+        'seq': entry.id,
+        'object_type': entry.object_type,
+        'object_id': entry.object_id,
+        'campaign_id': entry.campaign_id,
+        'action': entry.action,
+        'created': epoch(entry.created),
+    }
+
+
+def read_changes(after=0, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return the (at most `limit`) entries after the sequence number `after`, and the cursor to pass next time.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    entries = list(OutboxEntry.objects.filter(id__gt=after).order_by('id')[:limit])
+    return entries, entries[-1].id if entries else after
+
+
+def compact_outbox(before=None):
+    """
+    Delete the entries followed by a later entry of the same object, optionally only those with id < `before`.
+    Returns the number of deleted entries.
+    """
+    latest = OutboxEntry.objects.values('object_type', 'object_id').annotate(last_id=Max('id')).values('last_id')
+    superseded = OutboxEntry.objects.exclude(id__in=latest)
+    if before is not None:
+        superseded = superseded.filter(id__lt=before)
+    with transaction.atomic():
+        count = superseded.count()
+        superseded.delete()
+    return count
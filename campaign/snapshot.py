@@ -0,0 +1,173 @@
+"""
+Bidder snapshots: one compact file with everything the bidder needs about the servable campaigns.
+
+File layout (all integers big-endian):
+
+    magic      8 bytes   "CDRSNAP\0"
+    version    uint16    SNAPSHOT_VERSION
+    kind       uint8     KIND_FULL or KIND_DELTA
+    length     uint32    size of the compressed payload
+    checksum   32 bytes  sha256 of the compressed payload
+    payload              zlib compressed JSON
+
+The payload is {"version", "kind", "generated", "since", "campaigns": [...], "removed": [ids]}. Money amounts
+are integer micros, dates are "YYYY-MM-DD" and timestamps are epoch seconds. Ads and assets are stored as
+compact lists, see serialize_campaign().
+
+A full snapshot has all the servable campaigns. A delta snapshot built with `since` (usually the "generated"
+value of the previous snapshot) has the servable campaigns that changed after it - including changes of their
+ads and ad assets (see campaign.models.OutboxEntry), category and device bids, advertiser or of the current date
+crossing their start/end dates - and in "removed" the ids of the changed
+campaigns that are no longer servable. Hard deleted rows can't be seen by a delta; the bidder should reload a
+full snapshot regularly.
+"""
+
+import json
+import zlib
+import struct
+import hashlib
+import calendar
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q, Prefetch
+from django.utils import timezone
+
+from account.models import Advertiser
+from campaign.models import Campaign, NativeAd, CampaignCategories, CampaignDevices, OutboxEntry
+from campaign.constants import to_micros
+
+SNAPSHOT_MAGIC = b'CDRSNAP\x00'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct('>8sHBI32s')
+
+KIND_FULL = 0
+KIND_DELTA = 1
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def servable_campaigns(today):
+    """
+    Campaigns that can be sent to the bidder on the given date: active, of an active advertiser, started and not
+    ended, with at least one active ad. (Caps are checked against spend by the bidder.)
+    """
+    return Campaign.objects.filter(
+        Q(start_date__isnull=True) | Q(start_date__lte=today),
+        Q(end_date__isnull=True) | Q(end_date__gte=today),
+        status=Campaign.STATUS_ACTIVE,
+        advertiser__status=Advertiser.STATUS_ACTIVE,
+        id__in=NativeAd.objects.filter(status=NativeAd.STATUS_ACTIVE).values('campaign_id'))
+
+
+def changed_campaigns(since, today):
+    """
+    Ids of the campaigns whose servable state or data may have changed after `since`.
+
+    A write is stamped when it happens but only seen once committed, so the rows stamped up to
+    SNAPSHOT_DELTA_MARGIN seconds before `since` are taken too: a campaign can be sent again, but a transaction
+    that committed after the previous snapshot was generated is not missed (unless it ran for longer than that).
+    """
+    since_date = timezone.localtime(since).date() if timezone.is_aware(since) else since.date()
+    since = since - timedelta(seconds=getattr(settings, 'SNAPSHOT_DELTA_MARGIN', 60))
+    return Campaign.objects.filter(
+        Q(updated__gt=since) |
+        Q(advertiser__updated__gt=since) |
+        Q(id__in=NativeAd.objects.filter(updated__gt=since).values('campaign_id')) |
+        # ad assets only show in the outbox
+        Q(id__in=OutboxEntry.objects.filter(created__gt=since).values('campaign_id')) |
+        Q(start_date__gt=since_date, start_date__lte=today) |
+        Q(end_date__gte=since_date - timedelta(days=1), end_date__lt=today)).values_list('id', flat=True)
+
+
+def epoch(value):
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6 if value else None
+
+
+def serialize_campaign(campaign):
+    return {
+        'id': campaign.id,
+        'advertiser_id': campaign.advertiser_id,
+        'campaign_type': campaign.campaign_type,
+        'bid_type': campaign.bid_type,
+        'bid': to_micros(campaign.bid),
+        'min_bid': to_micros(campaign.min_bid),
+        'daily_cap': to_micros(campaign.daily_cap),
+        'monthly_cap': to_micros(campaign.monthly_cap),
+        'total_cap': to_micros(campaign.total_cap),
+        'daily_frequency_cap': campaign.daily_frequency_cap,
+        'minutes_frequency': campaign.minutes_frequency,
+        'start_date': campaign.start_date.isoformat() if campaign.start_date else None,
+        'end_date': campaign.end_date.isoformat() if campaign.end_date else None,
+        'updated': epoch(campaign.updated),
+        # [category_id, max_bid] / [device_id, max_bid]
+        'category_bids': [[cc.category_id, to_micros(cc.max_bid)] for cc in campaign.campaign_categories.all()],
+        'device_bids': [[cd.device_id, to_micros(cd.max_bid)] for cd in campaign.campaign_devices.all()],
+        # [id, title, url, updated, [[asset_type, value], ...], [[asset_type, filename, width, height], ...]]
+        'ads': [[ad.id, ad.title, ad.url, epoch(ad.updated),
+                 [[da.asset_type, da.value] for da in ad.data_assets.all()],
+                 [[ia.asset_type, ia.filename, ia.original_width, ia.original_height] for ia in ad.image_assets.all()]]
+                for ad in campaign.nativeads.all()],
+    }
+
+
+def build_snapshot(since=None, now=None):
+    """
+    Build the payload of a full snapshot, or of a delta snapshot if `since` (a datetime) is given.
+    """
+    now = now or timezone.now()
+    today = timezone.localtime(now).date()
+    campaigns = servable_campaigns(today)
+    removed = []
+    if since is not None:
+        changed_ids = set(changed_campaigns(since, today))
+        campaigns = campaigns.filter(id__in=changed_ids)
+    campaigns = campaigns.order_by('id').prefetch_related(
+        Prefetch('nativeads', queryset=NativeAd.objects.filter(status=NativeAd.STATUS_ACTIVE).order_by('id')),
+        'nativeads__data_assets', 'nativeads__image_assets',
+        Prefetch('campaign_categories', queryset=CampaignCategories.objects.order_by('category_id')),
+        Prefetch('campaign_devices', queryset=CampaignDevices.objects.order_by('device_id')))
+    serialized = [serialize_campaign(c) for c in campaigns]
+    if since is not None:
+        removed = sorted(changed_ids - set(c['id'] for c in serialized))
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'kind': KIND_FULL if since is None else KIND_DELTA,
+        'generated': epoch(now),
+        'since': epoch(since),
+        'campaigns': serialized,
+        'removed': removed,
+    }
+
+
+def encode_snapshot(payload):
+    body = zlib.compress(json.dumps(payload, separators=(',', ':')), 6)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, payload['version'], payload['kind'], len(body),
+                                  hashlib.sha256(body).digest())
+    return header + body
+
+
+def decode_snapshot(data):
+    """
+    Check and decode a snapshot file's content; raises SnapshotError if it is not a valid snapshot.
+    """
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise SnapshotError('Snapshot is truncated.')
+    magic, version, kind, length, checksum = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError('Not a snapshot file.')
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError('Unsupported snapshot version %s.' % version)
+    body = data[SNAPSHOT_HEADER.size:]
+    if len(body) != length:
+        raise SnapshotError('Snapshot is truncated.')
+    if hashlib.sha256(body).digest() != checksum:
+        raise SnapshotError('Snapshot checksum mismatch.')
+    return json.loads(zlib.decompress(body))
+
+
+def from_epoch(value):
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
@@ -0,0 +1,204 @@
+"""
+Campaign spend accounting against the daily, monthly and total caps.
+
+The bidder reports spend events: (campaign_id, amount in integer micros). SpendCounters keeps, in memory, the
+spend of every campaign for the current day, the current month and in total, so applying an event is a few dict
+updates - no Decimal arithmetic and no query. Events are applied in batches with apply(); after each batch the
+campaigns that crossed one of their caps are paused together (Campaign.bulk_set_status), and every
+flush_interval seconds the spend not written yet goes to the SpendLedgerEntry table with one bulk INSERT.
+
+When the day (or month) changes the daily (monthly) counters restart from zero, and the campaigns that were
+paused for their daily (monthly) cap are made active again - unless one of their other caps is still reached,
+or somebody changed their status in the meantime. That bookkeeping is only in memory: campaigns paused by a
+previous run of the counters have to be resumed by hand.
+
+There must be a single SpendCounters instance (one process) for all the spend, see the run_spend_counters
+command. It is not thread safe.
+"""
+
+import time
+import logging
+
+from django.db.models import Sum, Case, When, F, BigIntegerField
+from django.utils import timezone
+
+from campaign.models import Campaign, SpendLedgerEntry
+from campaign.constants import to_micros
+
+logger = logging.getLogger('log_file')
+
+PERIOD_DAILY = 'daily'
+PERIOD_MONTHLY = 'monthly'
+PERIOD_TOTAL = 'total'
+
+
+class SpendCounters(object):
+
+    def __init__(self, flush_interval=10.0):
+        self.flush_interval = flush_interval
+        self.day = None
+        self.daily = {}
+        self.monthly = {}
+        self.total = {}
+        # campaign_id -> (daily_cap, monthly_cap, total_cap) in micros, 0 = unlimited
+        self.caps = {}
+        # campaign_id -> the period of the cap that paused it
+        self.paused = {}
+        self.applied = 0
+        self._pending = {}
+        self._capped = {}
+        self._last_flush = time.time()
+
+    def load(self, today=None):
+        """
+        Start from the spend stored in the ledger and pause the campaigns that are already over a cap.
+        """
+        today = today or timezone.localtime(timezone.now()).date()
+        self.day = today
+        self.daily, self.monthly, self.total = {}, {}, {}
+        self._pending, self._capped = {}, {}
+
+        def period_sum(**filters):
+            return Sum(Case(When(then=F('amount'), **filters), default=0, output_field=BigIntegerField()))
+
+        rows = SpendLedgerEntry.objects.values('campaign_id').annotate(
+            daily=period_sum(day=today), monthly=period_sum(day__gte=today.replace(day=1)), total=Sum('amount'))
+        for row in rows:
+            self.daily[row['campaign_id']] = row['daily']
+            self.monthly[row['campaign_id']] = row['monthly']
+            self.total[row['campaign_id']] = row['total']
+        self.load_caps()
+
+        for campaign_id in self.caps:
+            period = self.reached_cap(campaign_id)
+            if period:
+                self._capped[campaign_id] = period
+        self.pause_capped()
+
+    def load_caps(self):
+        """
+        Reload the caps of the active campaigns (and of the ones these counters paused). A paused campaign whose
+        status somebody changed is forgotten: if it is active again its spend is checked against its caps again.
+        """
+        campaigns = Campaign.objects.filter(status=Campaign.STATUS_ACTIVE) | Campaign.objects.filter(id__in=self.paused)
+        statuses = {}
+        self.caps = {}
+        for id, status, daily_cap, monthly_cap, total_cap in campaigns.values_list(
+                'id', 'status', 'daily_cap', 'monthly_cap', 'total_cap'):
+            statuses[id] = status
+            self.caps[id] = (to_micros(daily_cap), to_micros(monthly_cap), to_micros(total_cap))
+        for campaign_id in list(self.paused):
+            if statuses.get(campaign_id) != Campaign.STATUS_PAUSED:
+                del self.paused[campaign_id]
+                if statuses.get(campaign_id) == Campaign.STATUS_ACTIVE:
+                    period = self.reached_cap(campaign_id)
+                    if period:
+                        self._capped[campaign_id] = period
+
+    def reached_cap(self, campaign_id):
+        """
+        The period of the first cap the campaign has reached, or None.
+        """
+        daily_cap, monthly_cap, total_cap = self.caps.get(campaign_id, (0, 0, 0))
+        if daily_cap and self.daily.get(campaign_id, 0) >= daily_cap:
+            return PERIOD_DAILY
+        if monthly_cap and self.monthly.get(campaign_id, 0) >= monthly_cap:
+            return PERIOD_MONTHLY
+        if total_cap and self.total.get(campaign_id, 0) >= total_cap:
+            return PERIOD_TOTAL
+        return None
+
+    def add(self, campaign_id, amount):
+        """
+        Count one spend event. The campaign is paused by the next pause_capped() if it reached a cap.
+        """
+        self.daily[campaign_id] = self.daily.get(campaign_id, 0) + amount
+        self.monthly[campaign_id] = self.monthly.get(campaign_id, 0) + amount
+        self.total[campaign_id] = self.total.get(campaign_id, 0) + amount
+        self._pending[campaign_id] = self._pending.get(campaign_id, 0) + amount
+        self.applied += 1
+        if campaign_id in self.paused or campaign_id in self._capped:
+            return
+        period = self.reached_cap(campaign_id)
+        if period:
+            self._capped[campaign_id] = period
+
+    def apply(self, events, now=None):
+        """
+        Count a batch of (campaign_id, micros) spend events that happened at `now`, pause the campaigns that
+        reached a cap and flush the ledger if it is due.
+        """
+        now = now or timezone.now()
+        day = timezone.localtime(now).date()
+        if self.day is None:
+            self.load(day)
+        elif day != self.day:
+            self.rollover(day)
+        for campaign_id, amount in events:
+            self.add(campaign_id, amount)
+        self.pause_capped()
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def pause_capped(self):
+        """
+        Pause, with one UPDATE, the campaigns that reached a cap since the last call. Returns their ids.
+        """
+        if not self._capped:
+            return []
+        capped, self._capped = self._capped, {}
+        campaigns = list(Campaign.objects.filter(id__in=list(capped), status=Campaign.STATUS_ACTIVE))
+        Campaign.bulk_set_status(campaigns, Campaign.STATUS_PAUSED)
+        for campaign in campaigns:
+            self.paused[campaign.id] = capped[campaign.id]
+        if campaigns:
+            logger.info("SpendCounters: paused campaigns %s" % ", ".join(
+                "%s (%s cap)" % (c.id, capped[c.id]) for c in campaigns))
+        return [campaign.id for campaign in campaigns]
+
+    def flush(self):
+        """
+        Write the spend counted since the last flush to the ledger. Returns the number of entries written.
+        """
+        self._last_flush = time.time()
+        pending, self._pending = self._pending, {}
+        entries = [SpendLedgerEntry(campaign_id=campaign_id, day=self.day, amount=amount)
+                   for campaign_id, amount in pending.items() if amount]
+        try:
+            SpendLedgerEntry.objects.bulk_create(entries)
+        except Exception:
+            # keep the spend for the next flush
+            for campaign_id, amount in pending.items():
+                self._pending[campaign_id] = self._pending.get(campaign_id, 0) + amount
+            logger.exception("SpendCounters: could not write %s ledger entries" % len(entries))
+            return 0
+        self.load_caps()
+        return len(entries)
+
+    def rollover(self, day):
+        """
+        Move to a new day: flush the previous day's spend, restart the daily (and monthly) counters and resume
+        the campaigns paused for those caps.
+        """
+        self.flush()
+        new_month = (day.year, day.month) != (self.day.year, self.day.month)
+        self.day = day
+        self.daily = {}
+        periods = [PERIOD_DAILY]
+        if new_month:
+            self.monthly = {}
+            periods.append(PERIOD_MONTHLY)
+
+        resumable = [campaign_id for campaign_id, period in self.paused.items()
+                     if period in periods and not self.reached_cap(campaign_id)]
+        # only the ones still paused: a user may have changed their status meanwhile
+        campaigns = list(Campaign.objects.filter(id__in=resumable, status=Campaign.STATUS_PAUSED))
+        Campaign.bulk_set_status(campaigns, Campaign.STATUS_ACTIVE)
+        for campaign_id in resumable:
+            del self.paused[campaign_id]
+        if campaigns:
+            logger.info("SpendCounters: resumed campaigns %s" % ", ".join(str(c.id) for c in campaigns))
+
+    def stats(self):
+        return {'day': self.day, 'campaigns': len(self.total), 'applied': self.applied,
+                'pending': len(self._pending), 'paused': len(self.paused)}
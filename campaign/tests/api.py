@@ -1,18 +1,32 @@
 
+import json
 import datetime
+from decimal import Decimal
+from unittest import skipUnless
 from django.contrib.auth.models import User, Group
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from tastypie import fields
+from tastypie.bundle import Bundle
+from tastypie.exceptions import BadRequest
+from tastypie.serializers import Serializer
 
-from cedar_fe.api_common import ApiResourceTestCaseMixin
-from campaign.models import Campaign, NativeAd
+from cedar_fe.api_common import ApiResourceTestCaseMixin, ApiSerializer, msgpack
+from cedar_fe.response_cache import response_cache
+from campaign.api import CampaignResource, NativeAdResource
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, NativeAdImageAsset
 from campaign.constants import *
-from account.models import Advertiser
+from account.models import Advertiser, AccountRepAdvertiser
 
 
 class CampaignResourceTest(ApiResourceTestCaseMixin, TestCase):
     
     def setUp(self):
         super(CampaignResourceTest, self).setUp()
+        # the shared cache outlives the test database
+        response_cache.cache.clear()
 
         # Create a staff user.
         self.staff_username = 'apisuperuser'
@@ -41,6 +55,22 @@ class CampaignResourceTest(ApiResourceTestCaseMixin, TestCase):
         campaign = Campaign(advertiser=advertiser, name='Random Campaign %s' % index, campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
         campaign.save()
         return campaign
+
+    def create_native_ad(self, campaign, index=1):
+        ad = NativeAd(campaign=campaign, name='Random Ad %s' % index, title='Ad Title %s' % index,
+                      url='http://example.com/%s' % index)
+        ad.save()
+        NativeAdDataAsset(ad=ad, asset_type=NativeAdDataAsset.TYPE_2, value='Description %s' % index).save()
+        NativeAdDataAsset(ad=ad, asset_type=NativeAdDataAsset.TYPE_12, value='Buy now').save()
+        NativeAdImageAsset(ad=ad, asset_type=NativeAdImageAsset.TYPE_3, filename='main%s.png' % index,
+                           original_width=1200, original_height=627).save()
+        return ad
+
+    def create_campaigns_with_ads(self, advertiser, campaigns=1, ads=1):
+        for i in range(campaigns):
+            campaign = self.create_campaign(advertiser, index=i)
+            for j in range(ads):
+                self.create_native_ad(campaign, index=j)
  
 
     def test_get_list_unauthenticated(self):
@@ -67,6 +97,349 @@ class CampaignResourceTest(ApiResourceTestCaseMixin, TestCase):
         self.assertEqual(len(self.deserialize(resp)['objects']), 0)
 
 
+    def test_get_list_account_rep(self):
+        rep_user = User.objects.create_user('apirep', 'apirep@example.com', 'apitestpass')
+        Group.objects.get(name='account_reps').user_set.add(rep_user)
+        campaign1 = self.create_campaign(self.advertiser1)
+        self.create_campaign(self.advertiser2, index=2)
+        AccountRepAdvertiser.objects.create(rep=rep_user, advertiser=self.advertiser1)
+
+        # the rep only gets the campaigns of the advertisers assigned to the rep
+        resp = self.api_client.get('/api/v1/campaign/', format='json', authentication=self.create_oauth2(user=rep_user))
+        self.assertValidJSONResponse(resp)
+        self.assertEqual([c['id'] for c in self.deserialize(resp)['objects']], [campaign1.id])
+
+        # and can't create campaigns for the other advertisers
+        post_data = {
+            'name': 'Campaign POST',
+            'campaign_type': CAMPAIGN_NATIVE,
+            'bid_type': BID_CPM,
+            'advertiser_id': self.advertiser2.id
+        }
+        self.assertHttpForbidden(self.api_client.post('/api/v1/campaign/', format='json', data=post_data,
+                                                      authentication=self.create_oauth2(user=rep_user)))
+
+
+    def test_get_list_query_count(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=1, ads=1)
+        # the first request also loads the token and the user's roles, which are cached afterwards
+        resp = self.api_client.get('/api/v1/campaign/?expand=ads', format='json', authentication=authentication)
+        self.assertEqual(len(self.deserialize(resp)['objects'][0]['ads']['nativeads'][0]['dataassets']), 2)
+
+        # authlog, validators (see ConditionalGetMixin), campaigns, nativeads, data assets, image assets - whatever the page size
+        with self.assertNumQueries(6):
+            self.api_client.get('/api/v1/campaign/?expand=ads', format='json', authentication=authentication)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=5, ads=4)
+        with self.assertNumQueries(6):
+            resp = self.api_client.get('/api/v1/campaign/?expand=ads', format='json', authentication=authentication)
+        self.assertEqual(len(self.deserialize(resp)['objects']), 6)
+        # authlog, validators, campaigns: no ads unless expanded
+        with self.assertNumQueries(3):
+            resp = self.api_client.get('/api/v1/campaign/', format='json', authentication=authentication)
+        self.assertNotIn('ads', self.deserialize(resp)['objects'][0])
+
+        # authlog, validators, nativeads, data assets, image assets
+        with self.assertNumQueries(5):
+            resp = self.api_client.get('/api/v1/nativead/', format='json', authentication=authentication)
+        self.assertEqual(len(self.deserialize(resp)['objects']), 20)
+
+
+    def test_get_list_cursor(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        campaigns = [self.create_campaign(self.advertiser1, index=i) for i in range(5)]
+        ids = [c.id for c in campaigns]
+
+        def get(uri):
+            resp = self.api_client.get(uri, format='json', authentication=authentication)
+            self.assertValidJSONResponse(resp)
+            data = self.deserialize(resp)
+            return [c['id'] for c in data['objects']], data['meta']
+
+        page, meta = get('/api/v1/campaign/?limit=2')
+        self.assertEqual(page, ids[:2])
+        self.assertEqual((meta['previous'], 'total_count' in meta), (None, False))
+        page, meta = get(meta['next'])
+        self.assertEqual(page, ids[2:4])
+        page, last_meta = get(meta['next'])
+        self.assertEqual((page, last_meta['next']), (ids[4:], None))
+        page, meta = get(last_meta['previous'])
+        self.assertEqual(page, ids[2:4])
+        page, meta = get(meta['previous'])
+        self.assertEqual((page, meta['previous']), (ids[:2], None))
+
+        # by (updated, id), newest first; the count only when asked for
+        campaigns[1].save()
+        page, meta = get('/api/v1/campaign/?limit=3&order_by=-updated&count=1')
+        self.assertEqual((page, meta['total_count']), ([ids[1], ids[4], ids[3]], 5))
+        page, meta = get(meta['next'])
+        self.assertEqual((page, meta['next']), ([ids[2], ids[0]], None))
+
+        # cursors only work with their order_by
+        uri = last_meta['previous'] + '&order_by=updated'
+        self.assertHttpBadRequest(self.api_client.get(uri, format='json', authentication=authentication))
+        self.assertHttpBadRequest(self.api_client.get('/api/v1/campaign/?cursor=abc', format='json',
+                                                      authentication=authentication))
+        # offset pagination still works
+        page, meta = get('/api/v1/campaign/?limit=2&offset=2')
+        self.assertEqual((page, meta['total_count']), (ids[2:4], 5))
+
+
+    def test_get_list_fields(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=2, ads=2)
+        campaign = Campaign.objects.order_by('id')[0]
+        self.api_client.get('/api/v1/campaign/', format='json', authentication=authentication)
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.api_client.get('/api/v1/campaign/?fields=name,status', format='json',
+                                       authentication=authentication)
+        self.assertValidJSONResponse(resp)
+        # authlog, validators, campaigns - only the columns asked for
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('daily_cap', queries[2]['sql'])
+        self.assertEqual(self.deserialize(resp)['objects'][0], {
+            'id': campaign.id, 'name': campaign.name, 'status': campaign.status,
+            'resource_uri': '/api/v1/campaign/%s/' % campaign.id})
+
+        # ads with their assets, still one query per level
+        with self.assertNumQueries(6):
+            resp = self.api_client.get('/api/v1/campaign/?fields=name&expand=ads&order_by=updated', format='json',
+                                       authentication=authentication)
+        obj = self.deserialize(resp)['objects'][0]
+        self.assertEqual(sorted(obj), ['ads', 'id', 'name', 'resource_uri'])
+        self.assertEqual(len(obj['ads']['nativeads']), 2)
+        self.assertEqual(len(obj['ads']['nativeads'][0]['dataassets']), 2)
+
+        # ads without their assets
+        with self.assertNumQueries(3):
+            resp = self.api_client.get('/api/v1/nativead/?fields=title', format='json', authentication=authentication)
+        self.assertEqual(sorted(self.deserialize(resp)['objects'][0]), ['id', 'resource_uri', 'title'])
+
+        # detail responses are complete unless fields are asked for
+        resp = self.api_client.get('/api/v1/campaign/%s/' % campaign.id, format='json', authentication=authentication)
+        self.assertEqual(len(self.deserialize(resp)['ads']['nativeads']), 2)
+        resp = self.api_client.get('/api/v1/campaign/%s/?fields=name' % campaign.id, format='json',
+                                   authentication=authentication)
+        self.assertEqual(sorted(self.deserialize(resp)), ['id', 'name', 'resource_uri'])
+
+        self.assertHttpBadRequest(self.api_client.get('/api/v1/campaign/?fields=name,password', format='json',
+                                                      authentication=authentication))
+        self.assertHttpBadRequest(self.api_client.get('/api/v1/campaign/?expand=advertiser', format='json',
+                                                      authentication=authentication))
+
+
+    def test_values_lists(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=3, ads=2)
+        campaign = Campaign.objects.order_by('id')[0]
+        campaign.start_date = datetime.date(2016, 1, 1)
+        campaign.daily_cap = '12.5'
+        campaign.save()
+        # without ads, and an ad without assets
+        self.create_campaign(self.advertiser1, index=4)
+        NativeAd.objects.create(campaign=campaign, name='Bare Ad', title='Bare', url='http://example.com/bare')
+
+        def get(uri):
+            resp = self.api_client.get(uri, format='json', authentication=authentication)
+            self.assertValidJSONResponse(resp)
+            # (the JSON keys aren't sorted, see ApiSerializer)
+            return self.deserialize(resp)
+
+        # the same data from values() rows as from model instances
+        for uri in ['/api/v1/campaign/', '/api/v1/campaign/?expand=ads', '/api/v1/campaign/?fields=name,ads',
+                    '/api/v1/campaign/?limit=2&order_by=-updated&expand=ads', '/api/v1/campaign/?limit=2&offset=1',
+                    '/api/v1/nativead/', '/api/v1/nativead/?fields=title,imageassets,openrtb',
+                    '/api/v1/nativead/?campaign_id=%s&limit=1&order_by=updated' % campaign.id]:
+            with self.settings(API_VALUES_LISTS=False):
+                expected = get(uri)
+            self.assertEqual(get(uri), expected, uri)
+
+    def test_values_lists_fallback(self):
+        class UriAdsCampaignResource(CampaignResource):
+            # not serialized from values() rows: URIs rather than full ads
+            nativeads = fields.ToManyField(NativeAdResource, 'nativeads', null=True, blank=True)
+
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=2, ads=2)
+        resource = UriAdsCampaignResource()
+
+        def get(data):
+            request = RequestFactory().get('/api/v1/campaign/', data)
+            request.user = self.staff_user
+            return resource.get_list(request)
+
+        resp = get({'expand': 'ads'})
+        self.assertHttpOK(resp)
+        ads = [o['ads']['nativeads'] for o in self.deserialize(resp)['objects']]
+        self.assertEqual([len(uris) for uris in ads], [2, 2])
+        self.assertTrue(ads[0][0].startswith('/api/v1/nativead/'))
+        with self.settings(API_VALUES_LISTS=False):
+            self.assertEqual(self.deserialize(get({'expand': 'ads'})), self.deserialize(resp))
+        self.assertRaises(BadRequest, get, {'expand': 'ads', 'stream': 'jsonl'})
+
+    def test_stream(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=5, ads=2)
+        self.create_campaigns_with_ads(self.advertiser2, campaigns=1, ads=1)
+
+        def get(uri):
+            resp = self.api_client.get(uri, format='json', authentication=authentication)
+            self.assertHttpOK(resp)
+            return resp
+
+        expected = self.deserialize(get('/api/v1/campaign/?limit=0&expand=ads'))['objects']
+        self.assertEqual(len(expected), 5)
+        with self.settings(API_STREAM_CHUNK_SIZE=2):
+            # authlog, validators, then campaigns, nativeads, data assets, image assets per chunk of 2 campaigns
+            with self.assertNumQueries(2 + 3 * 4):
+                resp = get('/api/v1/campaign/?stream=jsonl&expand=ads')
+                lines = ''.join(resp.streaming_content).splitlines()
+            self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+            self.assertEqual([json.loads(line) for line in lines], expected)
+
+            resp = get('/api/v1/campaign/?stream=json&expand=ads&order_by=-id')
+            self.assertEqual(json.loads(''.join(resp.streaming_content)), expected[::-1])
+            resp = get('/api/v1/nativead/?stream=json&fields=title&order_by=updated')
+            self.assertEqual(len(json.loads(''.join(resp.streaming_content))), 10)
+            resp = get('/api/v1/campaign/?stream=json&name=nothing')
+            self.assertEqual(''.join(resp.streaming_content), '[]')
+
+        self.assertHttpBadRequest(self.api_client.get('/api/v1/campaign/?stream=xml', format='json',
+                                                      authentication=authentication))
+        self.assertHttpBadRequest(self.api_client.get('/api/v1/campaign/?stream=json&order_by=name', format='json',
+                                                      authentication=authentication))
+
+    def test_json_serializer(self):
+        now = timezone.now()
+        data = {'objects': [Bundle(data={'id': 1, 'name': u'Caf\xe9', 'bid': Decimal('1.250000'), 'updated': now,
+                                         'start_date': now.date(), 'end_date': None, 'nested': [Bundle(data={'id': 2})]})],
+                'meta': {'limit': 20, 'next': None}}
+        # what tastypie's serializer writes, without its to_simple() pass
+        self.assertEqual(json.loads(ApiSerializer().to_json(data)), json.loads(Serializer().to_json(data)))
+
+    @skipUnless(msgpack, "msgpack isn't installed")
+    def test_msgpack(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=1, ads=1)
+        campaign = Campaign.objects.get()
+        campaign.bid = '0.125'
+        campaign.save()
+
+        resp = self.api_client.client.get('/api/v1/campaign/?expand=ads', HTTP_AUTHORIZATION=authentication,
+                                          HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(resp['Content-Type'].split(';')[0], 'application/x-msgpack')
+        obj = msgpack.unpackb(resp.content, encoding='utf-8')['objects'][0]
+        expected = self.deserialize(self.api_client.get('/api/v1/campaign/?expand=ads', format='json',
+                                                        authentication=authentication))['objects'][0]
+        # money as integer micros, the rest as in JSON
+        self.assertEqual((obj['bid'], obj['daily_cap']), (125000, 0))
+        for name in ('bid', 'min_bid', 'daily_cap', 'monthly_cap', 'total_cap'):
+            self.assertEqual(obj.pop(name), int(Decimal(expected.pop(name)) * 1000000))
+        self.assertEqual(obj, expected)
+        resp = self.api_client.get('/api/v1/nativead/?format=msgpack', authentication=authentication)
+        self.assertEqual(len(msgpack.unpackb(resp.content, encoding='utf-8')['objects']), 1)
+
+        # responses only
+        resp = self.api_client.client.post('/api/v1/campaign/', data=msgpack.packb({'name': 'x'}),
+                                           content_type='application/x-msgpack', HTTP_AUTHORIZATION=authentication)
+        self.assertHttpBadRequest(resp)
+
+    def test_conditional_get(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=2, ads=1)
+        campaign, other = Campaign.objects.order_by('id')
+
+        def get(uri, **headers):
+            return self.api_client.get(uri, format='json', authentication=authentication, **headers)
+
+        resp = get('/api/v1/campaign/')
+        self.assertHttpOK(resp)
+        etag = resp['ETag']
+        self.assertTrue(resp.has_header('Last-Modified'))
+        # authlog, validators
+        with self.assertNumQueries(2):
+            resp = get('/api/v1/campaign/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((resp.status_code, resp['ETag'], resp.content), (304, etag, ''))
+        # the query string is part of the representation
+        self.assertHttpOK(get('/api/v1/campaign/?fields=name', HTTP_IF_NONE_MATCH=etag))
+
+        # changes and deletions
+        other.name = 'Renamed'
+        other.save()
+        resp = get('/api/v1/campaign/', HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(resp)
+        etag = resp['ETag']
+        other.delete()
+        resp = get('/api/v1/campaign/', HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(resp)
+        self.assertEqual(len(self.deserialize(resp)['objects']), 1)
+
+        # the ads are part of the validators when they are serialized
+        resp = get('/api/v1/campaign/?expand=ads')
+        etag = resp['ETag']
+        self.assertEqual(get('/api/v1/campaign/?expand=ads', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        ad = campaign.nativeads.get()
+        ad.title = 'New title'
+        ad.save()
+        self.assertHttpOK(get('/api/v1/campaign/?expand=ads', HTTP_IF_NONE_MATCH=etag))
+
+        # details; If-Modified-Since is only used without nested objects
+        uri = '/api/v1/campaign/%s/' % campaign.id
+        resp = get(uri)
+        self.assertEqual(get(uri, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+        self.assertHttpOK(get(uri, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']))
+        uri = '/api/v1/nativead/%s/' % ad.id
+        resp = get(uri)
+        self.assertEqual(get(uri, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified']).status_code, 304)
+        self.assertEqual(get(uri, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+        # not another advertiser's
+        resp = self.api_client.get(uri, format='json', HTTP_IF_NONE_MATCH=resp['ETag'],
+                                   authentication=self.create_oauth2(user=self.advertiser_user2))
+        self.assertNotEqual(resp.status_code, 304)
+
+
+    def test_response_cache(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.create_campaigns_with_ads(self.advertiser1, campaigns=1, ads=1)
+        campaign = Campaign.objects.get()
+        ad = campaign.nativeads.get()
+        campaign_uri, ad_uri = '/api/v1/campaign/%s/' % campaign.id, '/api/v1/nativead/%s/' % ad.id
+
+        def get(uri, **headers):
+            return self.api_client.get(uri, format='json', authentication=authentication, **headers)
+
+        response_cache.reset_stats()
+        resp = get(campaign_uri)
+        # authlog only
+        with self.assertNumQueries(1):
+            cached = get(campaign_uri)
+        self.assertEqual((cached.content, cached['ETag']), (resp.content, resp['ETag']))
+        with self.assertNumQueries(1):
+            self.assertEqual(get(campaign_uri, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+        self.assertEqual(response_cache.stats()['hits'], 2)
+        # other fields, other users: other entries
+        self.assertNotEqual(get(campaign_uri + '?fields=name').content, resp.content)
+        staff = self.api_client.get(campaign_uri, format='json', authentication=self.create_oauth2(user=self.staff_user))
+        self.assertEqual(response_cache.stats()['misses'], 3)
+        self.assertEqual(staff.content, resp.content)
+
+        # an asset edit evicts its ad and its campaign
+        get(ad_uri)
+        asset = ad.data_assets.get(asset_type=NativeAdDataAsset.TYPE_12)
+        asset.value = 'Shop now'
+        asset.save()
+        self.assertIn('Shop now', get(ad_uri).content)
+        self.assertIn('Shop now', get(campaign_uri).content)
+        stats = response_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 6))
+        self.assertEqual(stats['hit_ratio'], 0.25)
+
+        # and so do deletions
+        ad.delete()
+        self.assertHttpNotFound(get(ad_uri))
+        self.assertEqual(self.deserialize(get(campaign_uri))['ads']['nativeads'], [])
+
+
     def test_get_detail_json(self):
         # create a campaign for advertiser 1
         campaign = self.create_campaign(self.advertiser1)
@@ -130,3 +503,75 @@ class CampaignResourceTest(ApiResourceTestCaseMixin, TestCase):
                             authentication=self.create_oauth2(user=self.advertiser_user1))
         updated_campaign = Campaign.objects.get(id=campaign.id)
         self.assertEqual(updated_campaign.name, 'Campaign PUT')
+
+
+    def test_bulk_post(self):
+        post_data = {'objects': [
+            {'name': 'Bulk 1', 'campaign_type': CAMPAIGN_NATIVE, 'bid_type': BID_CPM, 'advertiser_id': self.advertiser1.id,
+             'bid': '1.25'},
+            {'name': 'Bulk 2', 'campaign_type': CAMPAIGN_NATIVE, 'bid_type': BID_CPC, 'advertiser_id': self.advertiser1.id},
+            # not this advertiser's
+            {'name': 'Bulk 3', 'campaign_type': CAMPAIGN_NATIVE, 'bid_type': BID_CPM, 'advertiser_id': self.advertiser2.id},
+            # missing name, invalid bid type
+            {'campaign_type': CAMPAIGN_NATIVE, 'bid_type': 99, 'advertiser_id': self.advertiser1.id},
+        ]}
+        resp = self.api_client.post('/api/v1/campaign/', format='json', data=post_data,
+                                    authentication=self.create_oauth2(user=self.advertiser_user1))
+        self.assertHttpOK(resp)
+        results = self.deserialize(resp)['objects']
+        self.assertEqual([r['status'] for r in results], ['created', 'created', 'error', 'error'])
+        self.assertEqual(results[2]['errors'], {'advertiser_id': ['Invalid advertiser_id.']})
+        self.assertEqual(sorted(results[3]['errors']), ['bid_type', 'name'])
+        self.assertEqual(self.deserialize(resp)['meta'], {'created': 2, 'updated': 0, 'errors': 2})
+
+        campaign = Campaign.objects.get(id=results[0]['id'])
+        self.assertEqual((campaign.name, campaign.advertiser_id, str(campaign.bid)), ('Bulk 1', self.advertiser1.id, '1.250000'))
+        self.assertEqual(Campaign.objects.count(), 2)
+
+    def test_bulk_patch_query_count(self):
+        authentication = self.create_oauth2(user=self.advertiser_user1)
+        self.api_client.get('/api/v1/campaign/', format='json', authentication=authentication)
+        campaigns = [self.create_campaign(self.advertiser1, index=i) for i in range(10)]
+        other = self.create_campaign(self.advertiser2, index=11)
+        patch_data = {'objects': [{'id': c.id, 'name': 'Renamed %s' % c.id, 'advertiser_id': self.advertiser2.id}
+                                  for c in campaigns] +
+                                 [{'id': other.id, 'name': 'Not mine'}] +
+                                 [{'name': 'New %s' % i, 'campaign_type': CAMPAIGN_NATIVE, 'bid_type': BID_CPM,
+                                   'advertiser_id': self.advertiser1.id} for i in range(10)]}
+        # authlog, campaigns to update, advertisers, update, insert (+ its ids on sqlite), outbox, effective bids
+        # + the savepoint queries of the transaction and of the outbox write
+        with self.assertNumQueries(12):
+            resp = self.api_client.patch('/api/v1/campaign/', format='json', data=patch_data,
+                                         authentication=authentication)
+        results = self.deserialize(resp)['objects']
+        self.assertEqual([r['status'] for r in results], ['updated'] * 10 + ['error'] + ['created'] * 10)
+        self.assertEqual(results[10]['errors'], {'id': ['Object not found.']})
+        # advertiser_id can't change, same as with PUT
+        self.assertEqual(Campaign.objects.filter(name__startswith='Renamed', advertiser=self.advertiser1).count(), 10)
+        self.assertEqual(Campaign.objects.get(id=other.id).name, other.name)
+
+    def test_bulk_nativeads(self):
+        campaign = self.create_campaign(self.advertiser1)
+        ad = self.create_native_ad(campaign)
+        patch_data = {'objects': [
+            {'id': ad.id, 'title': 'New title',
+             'dataassets': [{'asset_type': NativeAdDataAsset.TYPE_12, 'value': 'Shop now'}]},
+            {'campaign_id': campaign.id, 'name': 'Bulk ad', 'title': 'Bulk title', 'url': 'http://example.com/bulk',
+             'dataassets': [{'asset_type': NativeAdDataAsset.TYPE_2, 'value': 'Bulk description'}],
+             'imageassets': [{'asset_type': NativeAdImageAsset.TYPE_1, 'filename': 'icon.png',
+                              'original_width': 64, 'original_height': 64}]},
+            {'campaign_id': campaign.id, 'name': 'Bad ad', 'title': 'Bad', 'url': 'http://example.com/bad',
+             'dataassets': [{'asset_type': NativeAdDataAsset.TYPE_3, 'value': 'five stars'}]},
+        ]}
+        resp = self.api_client.patch('/api/v1/nativead/', format='json', data=patch_data,
+                                     authentication=self.create_oauth2(user=self.advertiser_user1))
+        results = self.deserialize(resp)['objects']
+        self.assertEqual([r['status'] for r in results], ['updated', 'created', 'error'])
+        self.assertEqual(list(results[2]['errors']), ['dataassets'])
+
+        ad = NativeAd.objects.get(id=ad.id)
+        self.assertEqual(ad.title, 'New title')
+        self.assertEqual([a.to_dict() for a in ad.data_assets.all()], [{'asset_type': 12, 'value': 'Shop now'}])
+        self.assertEqual(ad.image_assets.count(), 1)
+        new_ad = NativeAd.objects.get(id=results[1]['id'])
+        self.assertEqual((new_ad.data_assets.count(), new_ad.image_assets.count()), (1, 1))
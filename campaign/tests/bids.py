@@ -0,0 +1,107 @@
+
+from decimal import Decimal
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+
+from cedar_fe.api_common import ApiResourceTestCaseMixin
+from campaign.models import Campaign, CampaignCategories, CampaignDevices, EffectiveBid
+from campaign.constants import *
+from campaign.bids import BidTable, bid_table, NOT_TARGETED
+from config.models import Category, Device
+from account.models import Advertiser
+
+ANY = EffectiveBid.ANY
+
+
+class EffectiveBidTest(ApiResourceTestCaseMixin, TestCase):
+
+    def setUp(self):
+        super(EffectiveBidTest, self).setUp()
+        self.user = User.objects.create_user('bidadvertiser', 'bidadvertiser@example.com', 'bidpass')
+        Group.objects.get(name='advertisers').user_set.add(self.user)
+        self.advertiser = Advertiser.objects.create(user=self.user, name='Bid Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.arts = Category.objects.create(code='IAB1', name='Arts & Entertainment')
+        self.cars = Category.objects.create(code='IAB2', name='Automotive')
+        self.mobile = Device.objects.create()
+        self.desktop = Device.objects.create()
+        self.campaign = Campaign.objects.create(advertiser=self.advertiser, name='Bid Campaign', bid='1.5',
+                                                min_bid='1', campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+
+    def bids(self, campaign=None):
+        return sorted((b.category_id, b.device_id, b.bid)
+                      for b in EffectiveBid.objects.filter(campaign=campaign or self.campaign))
+
+    def test_compute(self):
+        self.assertEqual(EffectiveBid.compute(Decimal('1.5'), Decimal('1'), [], []), [(ANY, ANY, Decimal('1.5'))])
+        self.assertEqual(EffectiveBid.compute(Decimal('1.5'), Decimal('1'), [(1, Decimal('2')), (2, None)],
+                                              [(7, Decimal('1.8')), (8, Decimal('0.5'))]),
+                         [(1, 7, Decimal('1.8')), (1, 8, Decimal('1')), (2, 7, Decimal('1.8')), (2, 8, Decimal('1'))])
+
+    def test_rows_follow_changes(self):
+        self.assertEqual(self.bids(), [(ANY, ANY, Decimal('1.5'))])
+        link = CampaignCategories.objects.create(campaign=self.campaign, category=self.arts, max_bid='2')
+        CampaignCategories.objects.create(campaign=self.campaign, category=self.cars)
+        self.assertEqual(self.bids(), [(self.arts.id, ANY, Decimal('2')), (self.cars.id, ANY, Decimal('1.5'))])
+        CampaignDevices.objects.create(campaign=self.campaign, device=self.mobile, max_bid='0.5')
+        self.assertEqual(self.bids(), [(self.arts.id, self.mobile.id, Decimal('1')),
+                                       (self.cars.id, self.mobile.id, Decimal('1'))])
+
+        campaign = Campaign.objects.get(id=self.campaign.id)
+        campaign.min_bid = Decimal('0.25')
+        campaign.save()
+        self.assertEqual(self.bids(), [(self.arts.id, self.mobile.id, Decimal('0.5')),
+                                       (self.cars.id, self.mobile.id, Decimal('0.5'))])
+        link.delete()
+        CampaignDevices.objects.all().delete()
+        self.assertEqual(self.bids(), [(self.cars.id, ANY, Decimal('1.5'))])
+
+        # unchanged bids aren't recomputed
+        campaign.name = 'Renamed'
+        with self.assertNumQueries(6):
+            # savepoint, update, outbox (savepoint, insert, release), release
+            campaign.save()
+
+        campaign.delete()
+        self.assertEqual(EffectiveBid.objects.count(), 0)
+
+    def test_bid_table(self):
+        other = Campaign.objects.create(advertiser=self.advertiser, name='Other Campaign', bid='3',
+                                        campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+        CampaignCategories.objects.create(campaign=self.campaign, category=self.arts, max_bid='2')
+        CampaignDevices.objects.create(campaign=self.campaign, device=self.mobile)
+        table = BidTable()
+        table.load()
+        ids = [self.campaign.id, other.id, 12345]
+        self.assertEqual(list(table.lookup(ids, self.arts.id, self.mobile.id)), [2000000, 3000000, NOT_TARGETED])
+        self.assertEqual(list(table.lookup(ids, self.cars.id, self.mobile.id)), [NOT_TARGETED, 3000000, NOT_TARGETED])
+        self.assertEqual(list(table.lookup(ids, self.arts.id, self.desktop.id)), [NOT_TARGETED, 3000000, NOT_TARGETED])
+        self.assertEqual(list(table.lookup(ids)), [NOT_TARGETED, 3000000, NOT_TARGETED])
+
+        bid_table.load()
+        try:
+            CampaignCategories.objects.create(campaign=other, category=self.cars, max_bid='4')
+            self.assertEqual(list(bid_table.lookup(ids, self.cars.id, self.mobile.id)),
+                             [NOT_TARGETED, 4000000, NOT_TARGETED])
+            self.assertEqual(list(bid_table.lookup(ids, self.arts.id, self.mobile.id)),
+                             [2000000, NOT_TARGETED, NOT_TARGETED])
+        finally:
+            bid_table.loaded = False
+
+    def test_resource(self):
+        CampaignCategories.objects.create(campaign=self.campaign, category=self.arts, max_bid='2')
+        other_user = User.objects.create_user('otherbidadvertiser', 'otherbidadvertiser@example.com', 'bidpass')
+        Group.objects.get(name='advertisers').user_set.add(other_user)
+        other_advertiser = Advertiser.objects.create(user=other_user, name='Other', status=Advertiser.STATUS_ACTIVE)
+        Campaign.objects.create(advertiser=other_advertiser, name='Not mine', campaign_type=CAMPAIGN_NATIVE,
+                                bid_type=BID_CPM)
+
+        authentication = self.create_oauth2(user=self.user)
+        resp = self.api_client.get('/api/v1/effectivebid/', format='json', authentication=authentication)
+        self.assertValidJSONResponse(resp)
+        objects = self.deserialize(resp)['objects']
+        self.assertEqual([(o['campaign_id'], o['category_id'], o['device_id'], o['bid']) for o in objects],
+                         [(self.campaign.id, self.arts.id, ANY, '2.000000')])
+
+        resp = self.api_client.post('/api/v1/effectivebid/', format='json', authentication=authentication,
+                                    data={'campaign_id': self.campaign.id, 'bid': '10'})
+        self.assertHttpMethodNotAllowed(resp)
@@ -0,0 +1,74 @@
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from campaign.models import Campaign, NativeAd, CampaignCategories
+from campaign.constants import *
+from campaign.category_index import CategoryIndex, category_index
+from config.models import Category
+from account.models import Advertiser
+
+
+class CategoryIndexTest(TestCase):
+
+    def setUp(self):
+        super(CategoryIndexTest, self).setUp()
+        user = User.objects.create_user('indexadvertiser', 'indexadvertiser@example.com', 'indexpass')
+        self.advertiser = Advertiser.objects.create(user=user, name='Index Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.iab1 = Category.objects.create(code='IAB1', name='Arts & Entertainment')
+        self.iab1_1 = Category.objects.create(code='IAB1-1', name='Books & Literature', parent=self.iab1)
+        self.iab1_2 = Category.objects.create(code='IAB1-2', name='Celebrity Fan/Gossip', parent=self.iab1)
+        self.iab2 = Category.objects.create(code='IAB2', name='Automotive')
+
+    def create_campaign(self, categories, status=Campaign.STATUS_ACTIVE):
+        campaign = Campaign.objects.create(advertiser=self.advertiser, name='Index Campaign', status=status,
+                                           campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+        NativeAd.objects.create(campaign=campaign, name='Ad', title='Title', url='http://example.com',
+                                status=NativeAd.STATUS_ACTIVE)
+        for category in categories:
+            CampaignCategories.objects.create(campaign=campaign, category=category)
+        return campaign
+
+    def test_lookups(self):
+        arts = self.create_campaign([self.iab1])
+        books = self.create_campaign([self.iab1_1])
+        books_and_cars = self.create_campaign([self.iab1_1, self.iab2])
+        self.create_campaign([self.iab1_1], status=Campaign.STATUS_PAUSED)
+        index = CategoryIndex()
+        self.assertEqual(list(index.match_any(['IAB1'])), [])
+        index.build()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(index.campaigns('IAB1')), [arts.id])
+            # the parent's campaigns are inherited
+            self.assertEqual(list(index.campaigns('IAB1-1')), [arts.id, books.id, books_and_cars.id])
+            self.assertEqual(list(index.campaigns('IAB1-2')), [arts.id])
+            self.assertEqual(list(index.campaigns('IAB9')), [])
+            self.assertEqual(list(index.match_any(['IAB1-2', 'IAB2'])), [arts.id, books_and_cars.id])
+            self.assertEqual(list(index.match_any(['IAB2'])), [books_and_cars.id])
+            self.assertEqual(list(index.match_all(['IAB1-1', 'IAB2'])), [books_and_cars.id])
+            self.assertEqual(list(index.match_all(['IAB1-1', 'IAB1-2', 'IAB2'])), [])
+            self.assertEqual(list(index.match_any([])), [])
+
+    def test_incremental_updates(self):
+        arts = self.create_campaign([self.iab1])
+        cars = self.create_campaign([self.iab2])
+        category_index.build()
+        try:
+            link = CampaignCategories.objects.create(campaign=cars, category=self.iab1_2)
+            self.assertEqual(list(category_index.campaigns('IAB1-2')), [arts.id, cars.id])
+            self.assertEqual(list(category_index.campaigns('IAB1-1')), [arts.id])
+            link.category = self.iab1_1
+            link.save()
+            self.assertEqual(list(category_index.campaigns('IAB1-2')), [arts.id])
+            self.assertEqual(list(category_index.campaigns('IAB1-1')), [arts.id, cars.id])
+            CampaignCategories.objects.filter(campaign=arts).delete()
+            self.assertEqual(list(category_index.campaigns('IAB1-1')), [cars.id])
+            self.assertEqual(list(category_index.campaigns('IAB1')), [])
+
+            category_index.update_campaign(cars.id, eligible=False)
+            self.assertEqual(list(category_index.match_any(['IAB1', 'IAB1-1', 'IAB2'])), [])
+            category_index.update_campaign(cars.id, eligible=True)
+            self.assertEqual(list(category_index.match_any(['IAB1', 'IAB1-1', 'IAB2'])), [cars.id])
+        finally:
+            category_index.built = False
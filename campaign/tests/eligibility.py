@@ -0,0 +1,77 @@
+
+import datetime
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from campaign.models import Campaign, NativeAd
+from campaign.constants import *
+from campaign.eligibility import *
+from campaign.snapshot import servable_campaigns
+from account.models import Advertiser
+
+
+class EligibilityTest(TestCase):
+
+    def setUp(self):
+        super(EligibilityTest, self).setUp()
+        user = User.objects.create_user('eligibilityadvertiser', 'eligibilityadvertiser@example.com', 'pass')
+        self.advertiser = Advertiser.objects.create(user=user, name='Eligibility Advertiser',
+                                                    status=Advertiser.STATUS_ACTIVE)
+        self.today = timezone.localtime(timezone.now()).date()
+
+    def create_campaign(self, advertiser=None, status=Campaign.STATUS_ACTIVE, ad_status=NativeAd.STATUS_ACTIVE,
+                        **kwargs):
+        campaign = Campaign.objects.create(advertiser=advertiser or self.advertiser, name='Eligibility Campaign',
+                                           campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM, status=status, **kwargs)
+        if ad_status:
+            NativeAd.objects.create(campaign=campaign, name='Ad', title='Title', url='http://example.com',
+                                    status=ad_status)
+        return campaign
+
+    def test_reasons(self):
+        paused_user = User.objects.create_user('pausedadvertiser', 'pausedadvertiser@example.com', 'pass')
+        paused_advertiser = Advertiser.objects.create(user=paused_user, name='Paused Advertiser',
+                                                      status=Advertiser.STATUS_PAUSED)
+        day = datetime.timedelta(days=1)
+        expected = [
+            (self.create_campaign(), REASON_ELIGIBLE),
+            (self.create_campaign(start_date=self.today, end_date=self.today), REASON_ELIGIBLE),
+            (self.create_campaign(status=Campaign.STATUS_PAUSED), REASON_STATUS),
+            (self.create_campaign(advertiser=paused_advertiser), REASON_ADVERTISER_STATUS),
+            (self.create_campaign(start_date=self.today + day), REASON_NOT_STARTED),
+            (self.create_campaign(end_date=self.today - day), REASON_ENDED),
+            (self.create_campaign(ad_status=NativeAd.STATUS_PAUSED), REASON_NO_ACTIVE_ADS),
+            (self.create_campaign(ad_status=None), REASON_NO_ACTIVE_ADS),
+            # the first failed rule is reported
+            (self.create_campaign(status=Campaign.STATUS_PAUSED, end_date=self.today - day), REASON_STATUS),
+        ]
+        with self.assertNumQueries(2):
+            table = CampaignTable.load()
+        eligible_ids, reasons = evaluate(table, self.today)
+        self.assertEqual(list(table.ids), [c.id for c, reason in expected])
+        self.assertEqual(list(reasons), [reason for c, reason in expected])
+        self.assertEqual(list(eligible_ids), [c.id for c, reason in expected if reason == REASON_ELIGIBLE])
+        # same rules as the bidder snapshots, apart from the caps
+        self.assertEqual(sorted(eligible_ids), sorted(servable_campaigns(self.today).values_list('id', flat=True)))
+
+    def test_caps(self):
+        unlimited = self.create_campaign()
+        daily = self.create_campaign(daily_cap='10', monthly_cap='100')
+        monthly = self.create_campaign(daily_cap='10', monthly_cap='100')
+        total = self.create_campaign(total_cap='500.5')
+        table = CampaignTable.load(Campaign.objects.filter(id__in=[unlimited.id, daily.id, monthly.id, total.id]))
+
+        spend = {unlimited.id: 10 ** 12, daily.id: 10000000, monthly.id: 9999999, total.id: 500500000}
+        # (the total spend reuses the daily one; campaigns missing from a spend column get 0)
+        daily_spend = table.column(list(spend), list(spend.values()))
+        monthly_spend = table.column([monthly.id], [100000000])
+        eligible_ids, reasons = evaluate(table, self.today, daily_spend=daily_spend, monthly_spend=monthly_spend,
+                                         total_spend=daily_spend)
+        self.assertEqual(list(reasons), [REASON_ELIGIBLE, REASON_DAILY_CAP, REASON_MONTHLY_CAP, REASON_TOTAL_CAP])
+        self.assertEqual(list(eligible_ids), [unlimited.id])
+
+    def test_empty(self):
+        table = CampaignTable.load()
+        eligible_ids, reasons = evaluate(table, self.today, daily_spend=table.column([1], [1]))
+        self.assertEqual((len(eligible_ids), len(reasons)), (0, 0))
@@ -0,0 +1,77 @@
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from campaign.models import Campaign
+from campaign.constants import *
+from campaign.frequency import FrequencyStore, SLOT_SIZE
+from account.models import Advertiser
+
+# 2016-01-30 00:00 UTC
+MIDNIGHT = 1454112000
+
+
+class FrequencyStoreTest(TestCase):
+
+    def store(self, caps, memory=1024 * SLOT_SIZE, utc_offset=0):
+        return FrequencyStore(memory=memory, utc_offset=utc_offset, caps=caps)
+
+    def test_daily_cap(self):
+        store = self.store({1: (2, 0), 2: (0, 0)})
+        now = MIDNIGHT + 3600
+        for i in range(2):
+            self.assertTrue(store.allowed('user', 1, now))
+            store.record('user', 1, now)
+        self.assertFalse(store.allowed('user', 1, now))
+        self.assertTrue(store.allowed('other user', 1, now))
+        # uncapped campaign
+        for i in range(5):
+            store.record('user', 2, now)
+        self.assertTrue(store.allowed('user', 2, now))
+        # the count expires at the day boundary
+        self.assertFalse(store.allowed('user', 1, MIDNIGHT + 86399))
+        self.assertTrue(store.allowed('user', 1, MIDNIGHT + 86400))
+
+    def test_day_boundary_is_local(self):
+        store = self.store({1: (1, 0)}, utc_offset=-3600)
+        store.record('user', 1, MIDNIGHT + 1800)
+        self.assertFalse(store.allowed('user', 1, MIDNIGHT + 3599))
+        self.assertTrue(store.allowed('user', 1, MIDNIGHT + 3600))
+
+    def test_minutes_frequency(self):
+        store = self.store({1: (0, 30)})
+        store.record(7, 1, MIDNIGHT)
+        self.assertFalse(store.allowed(7, 1, MIDNIGHT + 29 * 60))
+        self.assertTrue(store.allowed(7, 1, MIDNIGHT + 30 * 60))
+        store.record(7, 1, MIDNIGHT + 30 * 60)
+        self.assertFalse(store.allowed(7, 1, MIDNIGHT + 31 * 60))
+
+    def test_expired_slots_are_reused(self):
+        store = self.store({1: (1, 60)}, memory=16 * SLOT_SIZE)
+        for user_id in range(16):
+            store.record(user_id, 1, MIDNIGHT)
+        self.assertEqual(store.stats()['used'], 16)
+        # all full and nothing expired yet: the least recently seen pair makes room
+        store.record(100, 1, MIDNIGHT + 60)
+        self.assertEqual(store.evicted, 1)
+        self.assertFalse(store.allowed(100, 1, MIDNIGHT + 120))
+        # next day the expired pairs are replaced without evictions
+        for user_id in range(200, 215):
+            store.record(user_id, 1, MIDNIGHT + 86400)
+        self.assertEqual(store.evicted, 1)
+        self.assertFalse(store.allowed(214, 1, MIDNIGHT + 86400))
+
+    def test_memory_budget(self):
+        store = self.store({}, memory=1000 * SLOT_SIZE)
+        self.assertEqual((store.capacity, store.memory), (512, 512 * SLOT_SIZE))
+
+    def test_load_caps(self):
+        user = User.objects.create_user('frequencyadvertiser', 'frequencyadvertiser@example.com', 'pass')
+        advertiser = Advertiser.objects.create(user=user, name='Frequency Advertiser', status=Advertiser.STATUS_ACTIVE)
+        campaign = Campaign.objects.create(advertiser=advertiser, name='Frequency Campaign', bid_type=BID_CPM,
+                                           campaign_type=CAMPAIGN_NATIVE, status=Campaign.STATUS_ACTIVE,
+                                           daily_frequency_cap=3, minutes_frequency=90)
+        store = self.store({})
+        store.load_caps()
+        self.assertEqual(store.caps, {campaign.id: (3, 90)})
+        self.assertEqual(store.window, 90)
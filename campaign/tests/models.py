@@ -0,0 +1,73 @@
+
+import re
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, NativeAdImageAsset
+from campaign.constants import *
+from account.models import Advertiser
+
+
+class NativeAdAssetsTest(TestCase):
+
+    def setUp(self):
+        super(NativeAdAssetsTest, self).setUp()
+        user = User.objects.create_user('modeladvertiser', 'modeladvertiser@example.com', 'modelpass')
+        advertiser = Advertiser.objects.create(user=user, name='Model Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.campaign = Campaign.objects.create(advertiser=advertiser, name='Model Campaign',
+                                                campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+        self.ad = NativeAd.objects.create(campaign=self.campaign, name='Model Ad', title='Title',
+                                          url='http://example.com')
+        self.data_assets = [{'asset_type': asset_type, 'value': '%s' % asset_type}
+                            for asset_type in sorted(NativeAdDataAsset.DATA_TYPES)]
+        self.image_assets = [{'asset_type': NativeAdImageAsset.TYPE_1, 'filename': 'icon.png',
+                              'original_width': 64, 'original_height': 64}]
+
+    def written_queries(self, context):
+        # (some backends log the query as "QUERY = '...' - PARAMS = ..."); outbox entries and the recompiled
+        # OpenRTB payload of the ad are checked separately
+        statements = [re.search(r'(SELECT|INSERT|UPDATE|DELETE|SAVEPOINT)', q['sql']) for q in context.captured_queries
+                      if 'campaign_outboxentry' not in q['sql'] and 'openrtb_payload' not in q['sql']]
+        return [m.group(1) for m in statements if m and m.group(1) in ('INSERT', 'UPDATE', 'DELETE')]
+
+    def test_create_is_one_insert(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.ad.set_data_assets(self.data_assets), (12, 0, 0))
+        self.assertEqual(self.written_queries(context), ['INSERT'])
+        self.assertEqual([a.to_dict() for a in self.ad.data_assets.order_by('asset_type')],
+                         [{'asset_type': a['asset_type'], 'value': a['value']} for a in self.data_assets])
+
+    def test_single_change_is_one_update(self):
+        self.ad.set_data_assets(self.data_assets)
+        self.data_assets[-1]['value'] = 'Buy now'
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.ad.set_data_assets(self.data_assets), (0, 1, 0))
+        self.assertEqual(self.written_queries(context), ['UPDATE'])
+        self.assertEqual(self.ad.data_assets.get(asset_type=NativeAdDataAsset.TYPE_12).value, 'Buy now')
+
+    def test_unchanged_assets_are_not_written(self):
+        self.ad.set_image_assets(self.image_assets)
+        # values coming from the API may not have the stored type
+        self.image_assets[0]['original_width'] = '64'
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.ad.set_image_assets(self.image_assets), (0, 0, 0))
+        self.assertEqual(self.written_queries(context), [])
+
+    def test_mixed_changes(self):
+        self.ad.set_data_assets(self.data_assets[:3])
+        self.data_assets[0]['value'] = 'Sponsored by'
+        self.data_assets[1]['value'] = 'Other description'
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.ad.set_data_assets(self.data_assets[:2] + self.data_assets[5:7]), (2, 2, 1))
+        self.assertEqual(self.written_queries(context), ['INSERT', 'UPDATE', 'DELETE'])
+        self.assertEqual(sorted((a.asset_type, a.value) for a in self.ad.data_assets.all()),
+                         [(1, 'Sponsored by'), (2, 'Other description'), (6, '6'), (7, '7')])
+
+    def test_invalid_asset_writes_nothing(self):
+        self.ad.set_data_assets(self.data_assets[:2])
+        invalid = [{'asset_type': NativeAdDataAsset.TYPE_1, 'value': 'changed'},
+                   {'asset_type': NativeAdDataAsset.TYPE_3, 'value': 'not a rating'}]
+        self.assertRaises(Exception, self.ad.set_data_assets, invalid)
+        self.assertEqual(sorted((a.asset_type, a.value) for a in self.ad.data_assets.all()), [(1, '1'), (2, '2')])
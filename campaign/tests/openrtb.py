@@ -0,0 +1,162 @@
+import os
+import json
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cedar_fe.api_common import ApiResourceTestCaseMixin
+from cedar_fe.response_cache import response_cache
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, NativeAdImageAsset, OutboxEntry
+from campaign.constants import *
+from campaign.openrtb import native_payload, check_image_base_url, PAYLOAD_VERSION
+from account.models import Advertiser
+
+
+class OpenRtbPayloadTest(ApiResourceTestCaseMixin, TestCase):
+
+    def setUp(self):
+        super(OpenRtbPayloadTest, self).setUp()
+        # the shared cache outlives the test database
+        response_cache.cache.clear()
+        self.staff_user = User.objects.create_superuser('openrtbstaff', 'openrtbstaff@example.com', 'openrtbpass')
+        user = User.objects.create_user('openrtbadvertiser', 'openrtbadvertiser@example.com', 'openrtbpass')
+        Group.objects.get(name='advertisers').user_set.add(user)
+        self.advertiser = Advertiser.objects.create(user=user, name='OpenRTB Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.campaign = Campaign.objects.create(advertiser=self.advertiser, name='OpenRTB Campaign',
+                                                campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+        self.ad = NativeAd.objects.create(campaign=self.campaign, name='OpenRTB Ad', title='Title',
+                                          url='http://example.com')
+
+    def payload(self):
+        return NativeAd.objects.get(id=self.ad.id).openrtb
+
+    def test_native_payload(self):
+        payload, digest = native_payload('Title', 'http://example.com', [(2, 'Description'), (12, 'Buy now')],
+                                         [(3, 'main.png', 1200, 627)], image_base_url='http://cdn.example.com/')
+        self.assertEqual(json.loads(payload), {
+            'ver': '1.2',
+            'link': {'url': 'http://example.com'},
+            'assets': [{'id': 1, 'title': {'text': 'Title'}},
+                       {'id': 2, 'img': {'type': 3, 'url': 'http://cdn.example.com/main.png', 'w': 1200, 'h': 627}},
+                       {'id': 3, 'data': {'type': 2, 'value': 'Description'}},
+                       {'id': 4, 'data': {'type': 12, 'value': 'Buy now'}}],
+        })
+        self.assertEqual(native_payload('Title', 'http://example.com', [(2, 'Description'), (12, 'Buy now')],
+                                        [(3, 'main.png', 1200, 627)], image_base_url='http://cdn.example.com/')[1],
+                         digest)
+
+    def test_compiled_on_write(self):
+        ad = NativeAd.objects.get(id=self.ad.id)
+        self.assertEqual((ad.openrtb_version, len(ad.openrtb_hash)), (PAYLOAD_VERSION, 40))
+        self.assertEqual(ad.openrtb['assets'], [{'id': 1, 'title': {'text': 'Title'}}])
+
+        asset = NativeAdDataAsset.objects.create(ad=self.ad, asset_type=NativeAdDataAsset.TYPE_2, value='Description')
+        NativeAdImageAsset.objects.create(ad=self.ad, asset_type=NativeAdImageAsset.TYPE_1, filename='icon.png',
+                                          original_width=64, original_height=64)
+        self.assertEqual([sorted(a) for a in self.payload()['assets']],
+                         [['id', 'title'], ['id', 'img'], ['data', 'id']])
+        asset.value = 'Other description'
+        asset.save()
+        self.assertEqual(self.payload()['assets'][2]['data']['value'], 'Other description')
+        asset.delete()
+        self.assertEqual(len(self.payload()['assets']), 2)
+
+        self.ad.url = 'http://example.com/other'
+        self.ad.save()
+        self.assertEqual(self.payload()['link'], {'url': 'http://example.com/other'})
+        self.ad.set_data_assets([{'asset_type': NativeAdDataAsset.TYPE_12, 'value': 'Buy now'}])
+        self.assertEqual(self.payload()['assets'][2], {'id': 3, 'data': {'type': 12, 'value': 'Buy now'}})
+
+        # nothing left to compile for the deleted ones
+        self.campaign.delete()
+        self.assertEqual(NativeAd.objects.count(), 0)
+
+    def test_saved_instance_has_its_payload(self):
+        self.ad.title = 'New title'
+        self.ad.save()
+        self.assertEqual(self.ad.openrtb['assets'][0]['title']['text'], 'New title')
+        self.assertEqual(self.ad.openrtb_hash, NativeAd.objects.get(id=self.ad.id).openrtb_hash)
+
+        # an instance loaded before its assets changed doesn't write its payload back
+        ad = NativeAd.objects.get(id=self.ad.id)
+        NativeAdDataAsset.objects.create(ad=self.ad, asset_type=NativeAdDataAsset.TYPE_2, value='Description')
+        ad.name = 'Renamed'
+        with CaptureQueriesContext(connection) as context:
+            ad.save()
+        self.assertEqual([q for q in context.captured_queries if 'openrtb_payload' in q['sql']], [])
+        self.assertEqual(len(self.payload()['assets']), 2)
+        self.assertEqual(len(ad.openrtb['assets']), 2)
+
+    def test_image_base_url_check(self):
+        with self.settings(NATIVE_IMAGE_BASE_URL=''):
+            self.assertEqual([w.id for w in check_image_base_url(None)], ['campaign.W001'])
+        with self.settings(NATIVE_IMAGE_BASE_URL='https://cdn.example.com/'):
+            self.assertEqual(check_image_base_url(None), [])
+
+    def test_unchanged_payload_is_not_written(self):
+        self.assertEqual(NativeAd.compile_payloads([self.ad.id]), 0)
+        NativeAd.objects.filter(id=self.ad.id).update(title='Changed behind its back')
+        self.assertEqual(NativeAd.compile_payloads([self.ad.id]), 1)
+        self.assertEqual(self.payload()['assets'][0]['title']['text'], 'Changed behind its back')
+
+    def test_recompiled_payload_is_served(self):
+        authentication = self.create_oauth2(user=self.advertiser.user)
+        uri = '/api/v1/nativead/%s/' % self.ad.id
+        with self.settings(NATIVE_IMAGE_BASE_URL='http://old.example.com/'):
+            NativeAdImageAsset.objects.create(ad=self.ad, asset_type=NativeAdImageAsset.TYPE_3, filename='main.png',
+                                              original_width=1200, original_height=627)
+        resp = self.api_client.get(uri, format='json', authentication=authentication)
+        etag = resp['ETag']
+        self.assertEqual(self.api_client.get(uri, format='json', authentication=authentication,
+                                             HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        last_entry = OutboxEntry.objects.latest('id').id
+
+        with self.settings(NATIVE_IMAGE_BASE_URL='http://cdn.example.com/'):
+            call_command('compile_native_payloads', stdout=open(os.devnull, 'w'))
+        resp = self.api_client.get(uri, format='json', authentication=authentication, HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(resp)
+        self.assertEqual(self.deserialize(resp)['openrtb']['assets'][1]['img']['url'], 'http://cdn.example.com/main.png')
+        # and the bidders see the change
+        self.assertEqual(list(OutboxEntry.objects.filter(id__gt=last_entry).values_list('object_type', 'object_id')),
+                         [('nativead', self.ad.id)])
+
+    @override_settings(NATIVE_IMAGE_BASE_URL='http://cdn.example.com/')
+    def test_api(self):
+        authentication = self.create_oauth2(user=self.advertiser.user)
+        patch_data = {'objects': [
+            {'id': self.ad.id, 'title': 'Bulk title'},
+            {'campaign_id': self.campaign.id, 'name': 'Bulk ad', 'title': 'New', 'url': 'http://example.com/new',
+             'imageassets': [{'asset_type': NativeAdImageAsset.TYPE_3, 'filename': 'main.png',
+                              'original_width': 1200, 'original_height': 627}]},
+        ]}
+        resp = self.api_client.patch('/api/v1/nativead/', format='json', data=patch_data, authentication=authentication)
+        new_id = self.deserialize(resp)['objects'][1]['id']
+        self.assertEqual(self.payload()['assets'][0]['title']['text'], 'Bulk title')
+
+        resp = self.api_client.get('/api/v1/nativead/%s/' % new_id, format='json', authentication=authentication)
+        data = self.deserialize(resp)
+        self.assertEqual(data['openrtb'], NativeAd.objects.get(id=new_id).openrtb)
+        self.assertEqual(data['openrtb']['assets'][1]['img']['url'], 'http://cdn.example.com/main.png')
+        self.assertEqual(data['openrtb_version'], PAYLOAD_VERSION)
+        # read only
+        self.api_client.put('/api/v1/nativead/%s/' % new_id, format='json', authentication=authentication,
+                            data={'title': 'Put title', 'openrtb_hash': 'x', 'openrtb': {}})
+        ad = NativeAd.objects.get(id=new_id)
+        self.assertEqual((ad.openrtb['assets'][0]['title']['text'], len(ad.openrtb_hash)), ('Put title', 40))
+
+        # bidder lookup
+        resp = self.api_client.get('/api/bidder/payloads/', data={'campaign_ids': self.campaign.id},
+                                   authentication=self.create_oauth2(user=self.staff_user))
+        self.assertHttpOK(resp)
+        objects = self.deserialize(resp)['objects']
+        self.assertEqual([o['id'] for o in objects], [self.ad.id, new_id])
+        self.assertEqual((objects[1]['native'], objects[1]['hash']), (ad.openrtb, ad.openrtb_hash))
+        resp = self.api_client.get('/api/bidder/payloads/', data={'ids': new_id},
+                                   authentication=self.create_oauth2(user=self.staff_user))
+        self.assertEqual([o['id'] for o in self.deserialize(resp)['objects']], [new_id])
+        self.assertHttpBadRequest(self.api_client.get('/api/bidder/payloads/', data={'ids': 'x'},
+                                                      authentication=self.create_oauth2(user=self.staff_user)))
+        self.assertHttpForbidden(self.api_client.get('/api/bidder/payloads/', data={'ids': new_id},
+                                                     authentication=authentication))
@@ -0,0 +1,144 @@
+
+import os
+import logging
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from cedar_fe.api_common import ApiResourceTestCaseMixin
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, OutboxEntry
+from campaign.constants import *
+from campaign.outbox import read_changes, compact_outbox
+from cedar_fe import cache_common
+from cedar_fe.cache_common import shared_cache
+from cedar_fe.response_cache import response_cache
+from account.models import Advertiser
+
+
+class OutboxTest(ApiResourceTestCaseMixin, TestCase):
+
+    def setUp(self):
+        super(OutboxTest, self).setUp()
+        # the shared cache outlives the test database
+        response_cache.cache.clear()
+        self.staff_user = User.objects.create_superuser('outboxstaff', 'outboxstaff@example.com', 'outboxpass')
+        user = User.objects.create_user('outboxadvertiser', 'outboxadvertiser@example.com', 'outboxpass')
+        self.advertiser = Advertiser.objects.create(user=user, name='Outbox Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.campaign = Campaign.objects.create(advertiser=self.advertiser, name='Outbox Campaign',
+                                                campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+        self.ad = NativeAd.objects.create(campaign=self.campaign, name='Outbox Ad', title='Title',
+                                          url='http://example.com')
+
+    def changes(self, after=0):
+        return [(e.object_type, e.object_id, e.campaign_id, e.action) for e in read_changes(after)[0]]
+
+    def test_mutations_are_recorded(self):
+        cursor = read_changes()[1]
+        self.campaign.set_status(Campaign.STATUS_PAUSED)
+        self.ad.set_data_assets([{'asset_type': NativeAdDataAsset.TYPE_1, 'value': 'Sponsor'}])
+        asset = self.ad.data_assets.get()
+        self.ad.set_data_assets([])
+        ad_id = self.ad.id
+        self.ad.delete()
+
+        save, delete = OutboxEntry.ACTION_SAVE, OutboxEntry.ACTION_DELETE
+        self.assertEqual(self.changes(cursor), [
+            ('campaign', self.campaign.id, self.campaign.id, save),
+            ('nativeaddataasset', asset.id, self.campaign.id, save),
+            # the payload of the ad changed
+            ('nativead', ad_id, self.campaign.id, save),
+            ('nativeaddataasset', asset.id, self.campaign.id, delete),
+            ('nativead', ad_id, self.campaign.id, save),
+            ('nativead', ad_id, self.campaign.id, delete),
+        ])
+
+    def test_failed_mutation_is_not_recorded(self):
+        cursor = read_changes()[1]
+        self.assertRaises(Exception, self.ad.set_data_assets, [{'asset_type': NativeAdDataAsset.TYPE_3, 'value': 'x'}])
+        self.assertEqual(self.changes(cursor), [])
+
+    def test_paging(self):
+        for i in range(5):
+            self.campaign.save()
+        entries, cursor = read_changes(limit=3)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(cursor, entries[-1].id)
+        entries, cursor = read_changes(cursor, limit=10)
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(read_changes(cursor), ([], cursor))
+
+    def test_compaction(self):
+        for i in range(3):
+            self.campaign.save()
+            self.ad.save()
+        last_ad_entry = OutboxEntry.objects.filter(object_type='nativead').latest('id')
+        self.assertEqual(compact_outbox(before=last_ad_entry.id), 6)
+        self.assertEqual(OutboxEntry.objects.filter(object_type='campaign').count(), 1)
+        self.assertEqual(OutboxEntry.objects.filter(object_type='nativead').count(), 1)
+        call_command('compact_outbox', stdout=open(os.devnull, 'w'))
+        self.assertEqual(OutboxEntry.objects.count(), 2)
+
+    def test_endpoint(self):
+        self.campaign.save()
+        resp = self.api_client.get('/api/bidder/changes/', data={'limit': 1},
+                                   authentication=self.create_oauth2(user=self.staff_user))
+        self.assertHttpOK(resp)
+        data = self.deserialize(resp)
+        self.assertEqual(len(data['objects']), 1)
+        self.assertEqual(data['meta']['next'], data['objects'][0]['seq'])
+
+        resp = self.api_client.get('/api/bidder/changes/', authentication=self.create_oauth2(user=self.advertiser.user))
+        self.assertHttpForbidden(resp)
+
+
+class OutboxCommitTest(TransactionTestCase):
+
+    def setUp(self):
+        super(OutboxCommitTest, self).setUp()
+        # the shared cache outlives the test database
+        response_cache.cache.clear()
+        user = User.objects.create_user('commitadvertiser', 'commitadvertiser@example.com', 'commitpass')
+        advertiser = Advertiser.objects.create(user=user, name='Commit Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.campaign = Campaign.objects.create(advertiser=advertiser, name='Commit Campaign',
+                                                campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+        response_cache.reset_stats()
+
+    def test_responses_are_invalidated_again_after_commit(self):
+        with transaction.atomic():
+            self.campaign.save()
+            self.campaign.save()
+            self.assertEqual(response_cache.stats()['invalidations'], 2)
+        self.assertEqual(response_cache.stats()['invalidations'], 4)
+
+        response_cache.reset_stats()
+        try:
+            with transaction.atomic():
+                self.campaign.save()
+                raise ValueError
+        except ValueError:
+            pass
+        with transaction.atomic():
+            pass
+        self.assertEqual(response_cache.stats()['invalidations'], 1)
+
+        # outside of a transaction save() commits its own
+        response_cache.reset_stats()
+        self.campaign.save()
+        self.assertEqual(response_cache.stats()['invalidations'], 2)
+
+    def test_shared_cache(self):
+        # a cache local to the process does, with a warning
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        cache_common.logger.addHandler(handler)
+        cache_common._local_warned.discard(('default', 'API_RESPONSE_CACHE'))
+        try:
+            self.assertIs(shared_cache('default', 'API_RESPONSE_CACHE'), caches['default'])
+            self.assertIs(shared_cache('default', 'API_RESPONSE_CACHE'), caches['default'])
+        finally:
+            cache_common.logger.removeHandler(handler)
+        self.assertEqual([r.levelno for r in records], [logging.WARNING])
+        self.assertIn('API_RESPONSE_CACHE', records[0].getMessage())
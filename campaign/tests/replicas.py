@@ -0,0 +1,105 @@
+import json
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from cedar_fe.api_common import ApiResourceTestCaseMixin
+from cedar_fe.db_router import ReplicaRouter, primary_pins, _state
+from cedar_fe.response_cache import response_cache
+from campaign.models import Campaign
+from campaign.constants import *
+from account.models import Advertiser
+
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTest(ApiResourceTestCaseMixin, TransactionTestCase):
+    """
+    The 'replica' alias is a second connection to the test database of 'default', so it sees the committed rows.
+    """
+
+    def setUp(self):
+        default = connections[DEFAULT_DB_ALIAS]
+        connections.databases[REPLICA] = dict(default.settings_dict, TEST={'MIRROR': DEFAULT_DB_ALIAS})
+        self.shared = default.vendor == 'sqlite' and default.is_in_memory_db(default.settings_dict['NAME'])
+        if self.shared:
+            # another connection to an in-memory database opens another, empty, one
+            default.ensure_connection()
+            connections[REPLICA].connection = default.connection
+        super(ReplicaRouterTest, self).setUp()
+        # the shared cache outlives the test database
+        primary_pins.cache.clear()
+        self.staff_user = User.objects.create_superuser('replicastaff', 'replicastaff@example.com', 'replicapass')
+        self.advertiser = Advertiser.objects.create(user=self.staff_user, name='Replica Advertiser',
+                                                    status=Advertiser.STATUS_ACTIVE)
+        self.campaign = Campaign.objects.create(advertiser=self.advertiser, name='Replica Campaign',
+                                                campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM)
+
+    def tearDown(self):
+        super(ReplicaRouterTest, self).tearDown()
+        if self.shared:
+            connections[REPLICA].connection = None
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertEqual((router.db_for_read(Campaign), router.db_for_write(Campaign)),
+                         (DEFAULT_DB_ALIAS, DEFAULT_DB_ALIAS))
+        _state.alias = REPLICA
+        try:
+            self.assertEqual((router.db_for_read(Campaign), router.db_for_write(Campaign)),
+                             (REPLICA, DEFAULT_DB_ALIAS))
+            self.assertEqual(Campaign.objects.get().name, 'Replica Campaign')
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Campaign), DEFAULT_DB_ALIAS)
+        finally:
+            _state.alias = None
+        self.assertEqual((router.allow_migrate(REPLICA, 'campaign'), router.allow_migrate(DEFAULT_DB_ALIAS, 'campaign')),
+                         (False, None))
+
+    def test_api_reads(self):
+        authentication = self.create_oauth2(user=self.staff_user)
+
+        def get(uri):
+            with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+                resp = self.api_client.get(uri, format='json', authentication=authentication)
+                self.assertHttpOK(resp)
+                content = ''.join(resp.streaming_content) if resp.streaming else resp.content
+            return content, len(replica_queries)
+
+        content, replica_queries = get('/api/v1/campaign/')
+        self.assertEqual([o['name'] for o in json.loads(content)['objects']], ['Replica Campaign'])
+        self.assertGreater(replica_queries, 0)
+        content, replica_queries = get('/api/v1/campaign/?stream=jsonl')
+        self.assertEqual(json.loads(content)['name'], 'Replica Campaign')
+        self.assertGreater(replica_queries, 0)
+
+        # the writer reads from the primary for a while
+        with CaptureQueriesContext(connections[REPLICA]) as replica_queries:
+            self.assertHttpAccepted(self.api_client.patch('/api/v1/campaign/%s/' % self.campaign.id, format='json',
+                                                          data={'name': 'Patched'}, authentication=authentication))
+        self.assertEqual(len(replica_queries), 0)
+        content, replica_queries = get('/api/v1/campaign/')
+        self.assertEqual([o['name'] for o in json.loads(content)['objects']], ['Patched'])
+        self.assertEqual(replica_queries, 0)
+
+        primary_pins.cache.clear()
+        self.assertGreater(get('/api/v1/campaign/')[1], 0)
+
+    def test_replica_details_are_not_cached(self):
+        authentication = self.create_oauth2(user=self.staff_user)
+        uri = '/api/v1/campaign/%s/' % self.campaign.id
+        response_cache.reset_stats()
+        for i in range(2):
+            self.assertHttpOK(self.api_client.get(uri, format='json', authentication=authentication))
+        self.assertEqual(response_cache.stats()['misses'], 2)
+
+        # the primary's are
+        primary_pins.pin(self.staff_user.id)
+        for i in range(2):
+            self.assertHttpOK(self.api_client.get(uri, format='json', authentication=authentication))
+        self.assertEqual(response_cache.stats()['misses'], 3)
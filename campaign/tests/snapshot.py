@@ -0,0 +1,117 @@
+
+import os
+import datetime
+import tempfile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from cedar_fe.api_common import ApiResourceTestCaseMixin
+from campaign.models import Campaign, NativeAd, NativeAdDataAsset, CampaignDevices, OutboxEntry
+from config.models import Device
+from campaign.constants import *
+from campaign.snapshot import (build_snapshot, encode_snapshot, decode_snapshot, SnapshotError,
+                               KIND_FULL, KIND_DELTA)
+from account.models import Advertiser
+
+
+class BidderSnapshotTest(ApiResourceTestCaseMixin, TestCase):
+
+    def setUp(self):
+        super(BidderSnapshotTest, self).setUp()
+        self.staff_user = User.objects.create_superuser('snapshotstaff', 'snapshotstaff@example.com', 'snapshotpass')
+        user = User.objects.create_user('snapshotadvertiser', 'snapshotadvertiser@example.com', 'snapshotpass')
+        self.advertiser = Advertiser.objects.create(user=user, name='Snapshot Advertiser', status=Advertiser.STATUS_ACTIVE)
+        self.today = timezone.localtime(timezone.now()).date()
+
+    def create_campaign(self, index=1, status=Campaign.STATUS_ACTIVE, ad_status=NativeAd.STATUS_ACTIVE, **kwargs):
+        campaign = Campaign.objects.create(advertiser=self.advertiser, name='Snapshot Campaign %s' % index,
+                                           campaign_type=CAMPAIGN_NATIVE, bid_type=BID_CPM, status=status,
+                                           bid='0.75', daily_cap='100', **kwargs)
+        ad = NativeAd.objects.create(campaign=campaign, name='Snapshot Ad %s' % index, title='Title %s' % index,
+                                     url='http://example.com/%s' % index, status=ad_status)
+        NativeAdDataAsset.objects.create(ad=ad, asset_type=NativeAdDataAsset.TYPE_12, value='Buy now')
+        return campaign
+
+    def test_full_snapshot_has_servable_campaigns(self):
+        servable = self.create_campaign(1)
+        self.create_campaign(2, status=Campaign.STATUS_PAUSED)
+        self.create_campaign(3, ad_status=NativeAd.STATUS_PAUSED)
+        self.create_campaign(4, end_date=self.today - datetime.timedelta(days=1))
+        self.create_campaign(5, start_date=self.today + datetime.timedelta(days=1))
+
+        payload = decode_snapshot(encode_snapshot(build_snapshot()))
+        self.assertEqual(payload['kind'], KIND_FULL)
+        self.assertEqual([c['id'] for c in payload['campaigns']], [servable.id])
+        campaign = payload['campaigns'][0]
+        self.assertEqual((campaign['bid'], campaign['daily_cap'], campaign['total_cap']), (750000, 100000000, 0))
+        self.assertEqual(campaign['ads'][0][1:3], ['Title 1', 'http://example.com/1'])
+        self.assertEqual(campaign['ads'][0][4], [[NativeAdDataAsset.TYPE_12, 'Buy now']])
+
+    def test_delta_snapshot(self):
+        unchanged = self.create_campaign(1)
+        paused = self.create_campaign(2)
+        edited = self.create_campaign(3)
+        asset_edited = self.create_campaign(4)
+        bid_edited = self.create_campaign(5)
+        device_bid = CampaignDevices.objects.create(campaign=bid_edited, device=Device.objects.create(),
+                                                    max_bid='1.5')
+        late_commit = self.create_campaign(7)
+        since = timezone.now()
+        Advertiser.objects.update(updated=since - datetime.timedelta(minutes=10))
+        Campaign.objects.update(updated=since - datetime.timedelta(minutes=10))
+        NativeAd.objects.update(updated=since - datetime.timedelta(minutes=10))
+        OutboxEntry.objects.update(created=since - datetime.timedelta(minutes=10))
+        # written before the previous snapshot was generated, committed after it
+        Campaign.objects.filter(id=late_commit.id).update(updated=since - datetime.timedelta(seconds=30))
+
+        paused.set_status(Campaign.STATUS_PAUSED)
+        ad = edited.nativeads.get()
+        ad.title = 'New title'
+        ad.save()
+        created = self.create_campaign(6)
+        asset = NativeAd.objects.get(campaign=asset_edited).data_assets.get()
+        asset.value = 'Shop now'
+        asset.save()
+        NativeAd.objects.filter(campaign=asset_edited).update(updated=since - datetime.timedelta(minutes=10))
+        device_bid.max_bid = '2'
+        device_bid.save()
+        self.assertTrue(OutboxEntry.objects.filter(object_type='campaign', campaign_id=bid_edited.id,
+                                                   created__gt=since).exists())
+
+        payload = build_snapshot(since=since)
+        self.assertEqual(payload['kind'], KIND_DELTA)
+        self.assertEqual([c['id'] for c in payload['campaigns']], [edited.id, asset_edited.id, bid_edited.id, late_commit.id,
+                                                                   created.id])
+        self.assertEqual(payload['campaigns'][1]['ads'][0][4], [[NativeAdDataAsset.TYPE_12, 'Shop now']])
+        self.assertEqual(payload['campaigns'][2]['device_bids'][0][1], 2000000)
+        self.assertEqual(payload['campaigns'][0]['ads'][0][1], 'New title')
+        self.assertEqual(payload['removed'], [paused.id])
+
+    def test_corrupted_snapshot(self):
+        self.create_campaign(1)
+        data = encode_snapshot(build_snapshot())
+        self.assertRaises(SnapshotError, decode_snapshot, data[:-1] + chr((ord(data[-1]) + 1) % 256))
+        self.assertRaises(SnapshotError, decode_snapshot, data[:20])
+        self.assertRaises(SnapshotError, decode_snapshot, 'x' * len(data))
+
+    def test_command(self):
+        self.create_campaign(1)
+        path = os.path.join(tempfile.mkdtemp(), 'snapshot.bin')
+        call_command('export_bidder_snapshot', path, stdout=open(os.devnull, 'w'))
+        with open(path, 'rb') as f:
+            self.assertEqual(len(decode_snapshot(f.read())['campaigns']), 1)
+        delta_path = path + '.delta'
+        call_command('export_bidder_snapshot', delta_path, base=path, stdout=open(os.devnull, 'w'))
+        with open(delta_path, 'rb') as f:
+            self.assertEqual(decode_snapshot(f.read())['kind'], KIND_DELTA)
+
+    def test_endpoint(self):
+        self.create_campaign(1)
+        resp = self.api_client.get('/api/bidder/snapshot/', authentication=self.create_oauth2(user=self.staff_user))
+        self.assertHttpOK(resp)
+        self.assertEqual(len(decode_snapshot(resp.content)['campaigns']), 1)
+
+        resp = self.api_client.get('/api/bidder/snapshot/', authentication=self.create_oauth2(user=self.advertiser.user))
+        self.assertHttpForbidden(resp)
@@ -0,0 +1,120 @@
+
+import os
+import datetime
+import tempfile
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from campaign.models import Campaign, SpendLedgerEntry, OutboxEntry
+from campaign.constants import *
+from campaign.spend import SpendCounters, PERIOD_DAILY, PERIOD_MONTHLY, PERIOD_TOTAL
+from account.models import Advertiser
+
+
+class SpendCountersTest(TestCase):
+
+    def setUp(self):
+        super(SpendCountersTest, self).setUp()
+        user = User.objects.create_user('spendadvertiser', 'spendadvertiser@example.com', 'spendpass')
+        self.advertiser = Advertiser.objects.create(user=user, name='Spend Advertiser', status=Advertiser.STATUS_ACTIVE)
+        # a fixed (aware) time, so the day and month changes are under control
+        self.now = timezone.make_aware(datetime.datetime(2016, 1, 30, 12), timezone.get_current_timezone())
+        self.counters = SpendCounters(flush_interval=3600)
+
+    def create_campaign(self, **kwargs):
+        return Campaign.objects.create(advertiser=self.advertiser, name='Spend Campaign', campaign_type=CAMPAIGN_NATIVE,
+                                       bid_type=BID_CPM, status=Campaign.STATUS_ACTIVE, **kwargs)
+
+    def status(self, campaign):
+        return Campaign.objects.get(id=campaign.id).status
+
+    def test_events_cost_no_queries(self):
+        campaign = self.create_campaign(daily_cap='2')
+        self.counters.apply([], now=self.now)
+        with self.assertNumQueries(0):
+            self.counters.apply([(campaign.id, 1000)] * 1000, now=self.now)
+        self.assertEqual(self.counters.daily[campaign.id], 1000000)
+        self.assertEqual(self.counters.total[campaign.id], 1000000)
+
+    def test_caps_pause_in_bulk(self):
+        daily = self.create_campaign(daily_cap='1')
+        monthly = self.create_campaign(daily_cap='10', monthly_cap='2')
+        total = self.create_campaign(total_cap='3')
+        unlimited = self.create_campaign()
+        self.counters.apply([], now=self.now)
+
+        events = [(daily.id, 1000000), (monthly.id, 2000000), (total.id, 3500000), (unlimited.id, 10 ** 9)]
+        with CaptureQueriesContext(connection) as context:
+            self.counters.apply(events, now=self.now)
+        updates = [q for q in context.captured_queries if 'UPDATE "campaign_campaign"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.counters.paused, {daily.id: PERIOD_DAILY, monthly.id: PERIOD_MONTHLY,
+                                                total.id: PERIOD_TOTAL})
+        self.assertEqual([self.status(c) for c in (daily, monthly, total, unlimited)],
+                         [Campaign.STATUS_PAUSED] * 3 + [Campaign.STATUS_ACTIVE])
+        self.assertEqual(OutboxEntry.objects.filter(object_type='campaign', object_id=daily.id).count(), 2)
+
+    def test_flush_and_load(self):
+        campaign = self.create_campaign(daily_cap='5', monthly_cap='8')
+        self.counters.apply([(campaign.id, 1000000), (campaign.id, 500000)], now=self.now)
+        self.counters.apply([(campaign.id, 1500000)], now=self.now + datetime.timedelta(days=1))
+        self.assertEqual(self.counters.flush(), 1)
+        self.assertEqual(sorted(SpendLedgerEntry.objects.values_list('day', 'amount')),
+                         [(datetime.date(2016, 1, 30), 1500000), (datetime.date(2016, 1, 31), 1500000)])
+
+        counters = SpendCounters()
+        counters.load(datetime.date(2016, 1, 31))
+        self.assertEqual((counters.daily[campaign.id], counters.monthly[campaign.id], counters.total[campaign.id]),
+                         (1500000, 3000000, 3000000))
+        # the caps are enforced from the loaded spend
+        counters.load(datetime.date(2016, 2, 1))
+        counters.apply([(campaign.id, 4900000)], now=self.now + datetime.timedelta(days=2))
+        self.assertEqual(self.status(campaign), Campaign.STATUS_ACTIVE)
+        counters.apply([(campaign.id, 100000)], now=self.now + datetime.timedelta(days=2))
+        self.assertEqual(counters.paused, {campaign.id: PERIOD_DAILY})
+
+    def test_rollover_resumes_campaigns(self):
+        daily = self.create_campaign(daily_cap='1', monthly_cap='1')
+        monthly = self.create_campaign(monthly_cap='1')
+        user_paused = self.create_campaign(daily_cap='1')
+        self.counters.apply([(daily.id, 1000000), (monthly.id, 1000000), (user_paused.id, 1000000)], now=self.now)
+        user_paused.set_status(Campaign.STATUS_DELETED)
+
+        # next day: the daily cap paused campaign is still over its monthly cap
+        self.counters.apply([], now=self.now + datetime.timedelta(days=1))
+        self.assertEqual([self.status(c) for c in (daily, monthly, user_paused)],
+                         [Campaign.STATUS_PAUSED, Campaign.STATUS_PAUSED, Campaign.STATUS_DELETED])
+        # next month
+        self.counters.apply([], now=self.now + datetime.timedelta(days=2))
+        self.assertEqual([self.status(c) for c in (daily, monthly, user_paused)],
+                         [Campaign.STATUS_ACTIVE, Campaign.STATUS_ACTIVE, Campaign.STATUS_DELETED])
+        self.assertEqual(self.counters.paused, {})
+
+    def test_reactivated_campaigns_are_capped_again(self):
+        raised = self.create_campaign(total_cap='1')
+        same_cap = self.create_campaign(total_cap='1')
+        self.counters.apply([(raised.id, 1000000), (same_cap.id, 1000000)], now=self.now)
+        self.assertEqual(self.counters.paused, {raised.id: PERIOD_TOTAL, same_cap.id: PERIOD_TOTAL})
+
+        Campaign.objects.filter(id=raised.id).update(total_cap='2')
+        Campaign.objects.filter(id__in=[raised.id, same_cap.id]).update(status=Campaign.STATUS_ACTIVE)
+        self.counters.flush()
+        self.assertEqual(self.counters.paused, {})
+        self.counters.apply([(raised.id, 500000)], now=self.now)
+        self.assertEqual([self.status(c) for c in (raised, same_cap)], [Campaign.STATUS_ACTIVE, Campaign.STATUS_PAUSED])
+        self.counters.apply([(raised.id, 500000)], now=self.now)
+        self.assertEqual(self.status(raised), Campaign.STATUS_PAUSED)
+        self.assertEqual(self.counters.paused, {raised.id: PERIOD_TOTAL, same_cap.id: PERIOD_TOTAL})
+
+    def test_command(self):
+        campaign = self.create_campaign(total_cap='1')
+        path = os.path.join(tempfile.mkdtemp(), 'spend.txt')
+        with open(path, 'w') as f:
+            f.write("%s 600000\n\n%s 600000\n" % (campaign.id, campaign.id))
+        call_command('run_spend_counters', path, batch_size=1, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.status(campaign), Campaign.STATUS_PAUSED)
+        self.assertEqual(sum(SpendLedgerEntry.objects.values_list('amount', flat=True)), 1200000)
@@ -0,0 +1,8 @@
+from django.conf.urls import include, url
+from campaign.views import bidder_snapshot, bidder_changes, bidder_payloads
+
+urlpatterns = [
+    url(r'^snapshot/$', bidder_snapshot, name='snapshot'),
+    url(r'^changes/$', bidder_changes, name='changes'),
+    url(r'^payloads/$', bidder_payloads, name='payloads'),
+]
@@ -1,3 +1,67 @@
-from django.shortcuts import render
 
-# Create your views here.
+import json
+from django.http import HttpResponse, HttpResponseBadRequest
+
+from account.auth import staff_member_required
+from campaign.snapshot import build_snapshot, encode_snapshot, from_epoch
+from campaign.outbox import read_changes, serialize_entry, DEFAULT_PAGE_SIZE
+from campaign.models import NativeAd
+
+MAX_PAYLOADS = 1000
+
+
+@staff_member_required()
+def bidder_snapshot(request):
+    """
+    Download a bidder snapshot (see campaign.snapshot): a full one, or a delta if ?since=<epoch seconds> is given
+    (use the "generated" value of the previous snapshot).
+    """
+    since = request.GET.get('since')
+    if since:
+        try:
+            since = from_epoch(float(since))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid since parameter.')
+    payload = build_snapshot(since=since or None)
+    response = HttpResponse(encode_snapshot(payload), content_type='application/octet-stream')
+    response['X-Snapshot-Version'] = payload['version']
+    response['X-Snapshot-Generated'] = repr(payload['generated'])
+    return response
+
+
+@staff_member_required()
+def bidder_changes(request):
+    """
+    Page through the campaign change outbox: ?after=<seq of the last entry processed>&limit=<page size>.
+    """
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = int(request.GET.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid after or limit parameter.')
+    entries, cursor = read_changes(after, limit)
+    data = {'objects': [serialize_entry(e) for e in entries], 'meta': {'after': after, 'next': cursor}}
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@staff_member_required()
+def bidder_payloads(request):
+    """
+    The pre-rendered OpenRTB native payloads (see campaign.openrtb) of ?ids=<ad ids> or ?campaign_ids=<campaign ids>,
+    comma separated: {"objects": [{"id", "campaign_id", "version", "hash", "native"}, ...]}.
+    The stored JSON is copied into the response as it is.
+    """
+    try:
+        ids = [int(id) for id in request.GET.get('ids', '').split(',') if id]
+        campaign_ids = [int(id) for id in request.GET.get('campaign_ids', '').split(',') if id]
+    except ValueError:
+        return HttpResponseBadRequest('Invalid ids or campaign_ids parameter.')
+    if not ids and not campaign_ids:
+        return HttpResponseBadRequest('Missing ids or campaign_ids parameter.')
+    ads = NativeAd.objects.filter(id__in=ids) if ids else NativeAd.objects.filter(campaign_id__in=campaign_ids)
+    rows = ads.order_by('id').values_list('id', 'campaign_id', 'openrtb_version', 'openrtb_hash',
+                                          'openrtb_payload')[:MAX_PAYLOADS]
+    objects = ['{"id":%d,"campaign_id":%d,"version":%d,"hash":"%s","native":%s}' % (id, campaign_id, version, digest,
+                                                                                   payload or 'null')
+               for id, campaign_id, version, digest, payload in rows]
+    return HttpResponse('{"objects":[%s]}' % ','.join(objects), content_type='application/json')
@@ -1,14 +1,95 @@
 
+import json
+import base64
+import hashlib
+import datetime
+from decimal import Decimal
+from calendar import timegm
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from tastypie.authorization import Authorization
+from tastypie.paginator import Paginator
 from tastypie.test import ResourceTestCaseMixin
-from tastypie.http import HttpForbidden
-from tastypie.exceptions import ImmediateHttpResponse
-from django.core.exceptions import PermissionDenied
+from tastypie.http import HttpForbidden, HttpNotModified
+from tastypie.exceptions import ImmediateHttpResponse, BadRequest, ApiFieldError
+from tastypie.resources import convert_post_to_patch
+from tastypie.serializers import Serializer
+from tastypie.bundle import Bundle
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError, FieldDoesNotExist
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db.models import Q, Max, Count
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
 
 from account import auth
+from cedar_fe.db_common import bulk_update, bulk_create_with_ids
+from cedar_fe.db_router import reading_from_replica
+from cedar_fe.response_cache import response_cache
 
 UNAUTHORIZED_MESSAGE = "You are not authorized to access this resource."
 
+class ApiSerializer(Serializer):
+    """
+    Serializer of the v1 API resources.
+
+    JSON is written by the C encoder of the json module: the data is converted on the fly by json_default()
+    instead of a to_simple() pass over the whole structure, and the keys aren't sorted (sorting makes json fall
+    back to its pure Python encoder).
+
+    MessagePack (`Accept: application/x-msgpack` or `?format=msgpack`, when the msgpack package is installed) is
+    a compact binary format for the consumers that read a lot of it, the bidder's. Strings are UTF-8, datetimes
+    are the same strings as in JSON, and decimals - the API only has money amounts with 6 decimal places - are
+    integer micros instead of strings. It's only used for responses: requests are sent as JSON.
+    """
+    formats = Serializer.formats + (['msgpack'] if msgpack is not None else [])
+    content_types = dict(Serializer.content_types, msgpack='application/x-msgpack')
+    decimal_scale = 10 ** 6
+
+    def simple_value(self, value):
+        """
+        The serializable form of a value json and msgpack can't write, like to_simple() makes it.
+        """
+        if isinstance(value, Bundle):
+            return value.data
+        if isinstance(value, datetime.datetime):
+            return self.format_datetime(value)
+        if isinstance(value, datetime.date):
+            return self.format_date(value)
+        if isinstance(value, datetime.time):
+            return self.format_time(value)
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        return force_text(value)
+
+    def to_json(self, data, options=None):
+        return json.dumps(data, default=self.simple_value)
+
+    def msgpack_value(self, value):
+        if isinstance(value, Decimal):
+            return int(value * self.decimal_scale)
+        return self.simple_value(value)
+
+    def to_msgpack(self, data, options=None):
+        return msgpack.packb(data, default=self.msgpack_value)
+
+    def from_msgpack(self, content):
+        raise BadRequest('MessagePack is only supported for responses, please send JSON.')
+
+    def deserialize(self, content, format='application/json'):
+        # before Serializer.deserialize() decodes the content as text
+        if format.split(';')[0] == self.content_types['msgpack']:
+            return self.from_msgpack(content)
+        return super(ApiSerializer, self).deserialize(content, format=format)
+
+
 class ApiAuthorization(Authorization):
     """
     OAuth2 authorization to be used by all API Resources
@@ -60,6 +141,13 @@ class ApiAuthorization(Authorization):
             raise ImmediateHttpResponse(HttpForbidden(UNAUTHORIZED_MESSAGE))
 
     def create_list(self, object_list, bundle):
+        # bulk create (see BulkResourceMixin): checked once for the whole batch, objects are checked by the resource
+        try:
+            kwargs = {'model': self.model}
+            if self.auth_post_func == None or self.auth_post_func(bundle.request.user, **kwargs):
+                return object_list
+        except PermissionDenied:
+            pass
         raise ImmediateHttpResponse(HttpForbidden(UNAUTHORIZED_MESSAGE))
 
     def create_detail(self, object_list, bundle):
@@ -74,6 +162,14 @@ class ApiAuthorization(Authorization):
             raise ImmediateHttpResponse(HttpForbidden(UNAUTHORIZED_MESSAGE))
 
     def update_list(self, object_list, bundle):
+        # bulk update (see BulkResourceMixin): checked once for the whole batch, the objects to update are only
+        # looked up in the list filtered by read_list
+        try:
+            kwargs = {'model': self.model}
+            if self.auth_put_func == None or self.auth_put_func(bundle.request.user, **kwargs):
+                return object_list
+        except PermissionDenied:
+            pass
         raise ImmediateHttpResponse(HttpForbidden(UNAUTHORIZED_MESSAGE))
 
     def update_detail(self, object_list, bundle):
@@ -103,6 +199,708 @@ class ApiAuthorization(Authorization):
 
 
 
+class BulkResourceMixin(object):
+    """
+    Bulk create/update for ModelResources.
+
+    POST to the list endpoint with {"objects": [{...}, ...]} creates all the objects; PATCH with the same payload
+    creates the objects without an "id" and updates the others (deleted_objects are not supported).
+    The batch is authorized once, every object is validated without touching the db per object (relations are
+    checked for the whole batch by bulk_validate), and the valid objects are written with bulk INSERT/UPDATE
+    statements in one transaction. Invalid objects are skipped and reported in the response, which has one
+    entry per sent object, in order:
+
+        {"objects": [{"index": 0, "status": "created", "id": 12, "resource_uri": "..."},
+                     {"index": 1, "status": "error", "errors": {"name": ["This field cannot be blank."]}}],
+         "meta": {"created": 1, "updated": 0, "errors": 1}}
+
+    Resources list the model fields that can be written in `bulk_fields`; `bulk_create_only_fields` are ignored
+    on updates (same as the PUT handling in the hydrate_* methods).
+    """
+    bulk_fields = []
+    bulk_create_only_fields = []
+    bulk_max_objects = 1000
+
+    def post_list(self, request, **kwargs):
+        deserialized = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        if not self.is_bulk_data(deserialized):
+            return super(BulkResourceMixin, self).post_list(request, **kwargs)
+        return self.bulk_write(request, deserialized[self._meta.collection_name], allow_update=False)
+
+    def patch_list(self, request, **kwargs):
+        request = convert_post_to_patch(request)
+        deserialized = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        if not self.is_bulk_data(deserialized):
+            raise BadRequest("Invalid data sent: missing '%s'" % self._meta.collection_name)
+        if deserialized.get('deleted_%s' % self._meta.collection_name):
+            raise BadRequest("Deleting objects in bulk is not supported.")
+        return self.bulk_write(request, deserialized[self._meta.collection_name], allow_update=True)
+
+    def is_bulk_data(self, deserialized):
+        return isinstance(deserialized, dict) and isinstance(deserialized.get(self._meta.collection_name), list)
+
+    def bulk_write(self, request, items, allow_update):
+        if len(items) > self.bulk_max_objects:
+            raise BadRequest("Too many objects, at most %s can be sent at once." % self.bulk_max_objects)
+        model = self._meta.object_class
+        bundle = self.build_bundle(request=request)
+        object_list = self.get_object_list(request).prefetch_related(None)
+
+        results = [{'index': index} for index in range(len(items))]
+        update_ids = set()
+        for result, data in zip(results, items):
+            if not isinstance(data, dict):
+                result['errors'] = {'__all__': ['Each object must be a dictionary.']}
+            elif data.get('id') is not None:
+                if not allow_update:
+                    result['errors'] = {'id': ['Objects can only be updated with PATCH.']}
+                else:
+                    try:
+                        data['id'] = int(data['id'])
+                        update_ids.add(data['id'])
+                    except (TypeError, ValueError):
+                        result['errors'] = {'id': ['Invalid id.']}
+
+        # authorize the whole batch at once; objects to update must be readable by the user
+        if len(update_ids) < len(items):
+            self.authorized_create_list(object_list, bundle)
+        existing = {}
+        if update_ids:
+            self.authorized_update_list(object_list, bundle)
+            existing = dict((obj.pk, obj) for obj in self.authorized_read_list(object_list.filter(pk__in=update_ids), bundle))
+
+        pending = []
+        seen_ids = set()
+        for result, data in zip(results, items):
+            if 'errors' in result:
+                continue
+            if data.get('id') is None:
+                obj = model()
+            elif data['id'] not in existing:
+                result['errors'] = {'id': ['Object not found.']}
+                continue
+            elif data['id'] in seen_ids:
+                result['errors'] = {'id': ['Object sent more than once.']}
+                continue
+            else:
+                obj = existing[data['id']]
+                seen_ids.add(obj.pk)
+            errors = self.bulk_hydrate(obj, data)
+            if errors:
+                result['errors'] = errors
+            else:
+                pending.append((result, obj, data))
+
+        for position, errors in self.bulk_validate(request, [(obj, data) for result, obj, data in pending]).items():
+            pending[position][0]['errors'] = errors
+        pending = [p for p in pending if 'errors' not in p[0]]
+
+        to_create = [obj for result, obj, data in pending if obj.pk is None]
+        to_update = [obj for result, obj, data in pending if obj.pk is not None]
+        update_fields = set()
+        for result, obj, data in pending:
+            result['status'] = 'created' if obj.pk is None else 'updated'
+            if obj.pk is not None:
+                update_fields.update(f for f in self.bulk_fields if f in data and f not in self.bulk_create_only_fields)
+        if to_update and 'updated' in [f.name for f in model._meta.fields]:
+            now = timezone.now()
+            for obj in to_update:
+                obj.updated = now
+            update_fields.add('updated')
+
+        with transaction.atomic():
+            if to_update and update_fields:
+                bulk_update(model, to_update, update_fields)
+            bulk_create_with_ids(model, to_create)
+            self.bulk_save_related(request, [(obj, data) for result, obj, data in pending])
+
+        for result, obj, data in pending:
+            result['id'] = obj.pk
+            result['resource_uri'] = self.get_resource_uri(obj)
+        for result in results:
+            if 'errors' in result:
+                result['status'] = 'error'
+
+        response_data = {self._meta.collection_name: results,
+                         'meta': {'created': len(to_create), 'updated': len(to_update),
+                                  'errors': len(results) - len(pending)}}
+        return self.create_response(request, response_data)
+
+    def bulk_hydrate(self, obj, data):
+        """
+        Set the bulk_fields found in data on obj and validate them (no db queries; relations are not checked here).
+        Returns a dict of errors per field.
+        """
+        creating = obj.pk is None
+        errors = {}
+        for name in self.bulk_fields:
+            if name not in data or (not creating and name in self.bulk_create_only_fields):
+                continue
+            field = obj._meta.get_field(name)
+            try:
+                setattr(obj, field.attname, field.to_python(data[name]))
+            except ValidationError as e:
+                errors[name] = e.messages
+        if errors:
+            return errors
+
+        exclude = []
+        for field in obj._meta.fields:
+            value = getattr(obj, field.attname)
+            if field.is_relation:
+                exclude.append(field.name)
+                if value is None and not field.null:
+                    errors[field.attname] = ['This field is required.']
+            elif value is None and field.null:
+                exclude.append(field.name)
+        try:
+            obj.clean_fields(exclude=exclude)
+        except ValidationError as e:
+            errors.update(e.message_dict)
+        return errors
+
+    def bulk_validate(self, request, objs):
+        """
+        Hook for the checks that need the db (related objects, access to them), done for the whole batch.
+        Gets the list of hydrated (obj, data) pairs and returns a dict {position in objs: {field: [errors]}}.
+        """
+        return {}
+
+    def bulk_save_related(self, request, objs):
+        """
+        Hook called in the write transaction, once the objects are saved, to write related data.
+        """
+        pass
+
+
+class KeysetPaginator(Paginator):
+    """
+    Cursor (keyset) pagination for list endpoints.
+
+    A page is read with WHERE key > (the key of the last object of the previous page) ORDER BY key LIMIT n, so with
+    an index on the key every page costs the same however deep it is; and there is no COUNT(*) unless the client
+    asks for it with `?count=1` (meta.total_count).
+
+    The key is `id`, or `updated, id` with `?order_by=updated` (`-id` / `-updated` for descending; the resource must
+    allow them in Meta.ordering). meta.next and meta.previous are the URIs of the neighbour pages, with an opaque
+    `cursor` parameter. Requests with an `offset` are paginated by offset as before.
+    """
+    orderings = {
+        'id': ('id',),
+        'updated': ('updated', 'id'),
+    }
+
+    def page(self):
+        if 'offset' in self.request_data:
+            return super(KeysetPaginator, self).page()
+
+        limit = self.get_limit()
+        order_by, keys, descending = self.get_ordering()
+        cursor = self.request_data.get('cursor')
+        backwards = False
+        objects = self.objects
+        if cursor:
+            backwards, values = self.decode_cursor(cursor, order_by, keys)
+            objects = self.after(objects, keys, values, descending != backwards)
+        objects = objects.order_by(*[('-' if descending != backwards else '') + key for key in keys])
+
+        # one more object tells whether there is a page after this one
+        objs = list(objects[:limit + 1] if limit else objects)
+        more = len(objs) > limit > 0
+        objs = objs[:limit] if limit else objs
+        if backwards:
+            objs.reverse()
+
+        # a page reached with a cursor has a neighbour on the side it was reached from
+        has_previous = more if backwards else bool(cursor)
+        has_next = bool(cursor) if backwards else more
+        meta = {'limit': limit, 'previous': None, 'next': None}
+        if objs and has_previous:
+            meta['previous'] = self.cursor_uri(limit, order_by, keys, objs[0], backwards=True)
+        if objs and has_next:
+            meta['next'] = self.cursor_uri(limit, order_by, keys, objs[-1], backwards=False)
+        if self.request_data.get('count') in ('1', 'true'):
+            meta['total_count'] = self.get_count()
+        return {
+            self.collection_name: objs,
+            'meta': meta,
+        }
+
+    def chunks(self, size):
+        """
+        All the objects in lists of `size`, each one read after the key of the last object of the previous one
+        like the pages are, so the deep ones cost the same as the first one.
+        """
+        order_by, keys, descending = self.get_ordering()
+        objects = self.objects.order_by(*[('-' if descending else '') + key for key in keys])
+        values = None
+        while True:
+            chunk = list((objects if values is None else self.after(objects, keys, values, descending))[:size])
+            if chunk:
+                yield chunk
+            if len(chunk) < size:
+                return
+            last = chunk[-1]
+            values = [last[key] if isinstance(last, dict) else getattr(last, key) for key in keys]
+
+    def get_ordering(self):
+        order_by = self.request_data.get('order_by', 'id')
+        keys = self.orderings.get(order_by.lstrip('-'))
+        if keys is None:
+            raise BadRequest("Invalid order_by '%s' provided. Please use one of: %s." % (
+                order_by, ', '.join(sorted(self.orderings))))
+        return order_by, keys, order_by.startswith('-')
+
+    @staticmethod
+    def after(objects, keys, values, descending):
+        """
+        Filter the objects whose key is after `values`. With two keys it's written as
+        first >= a AND (first > a OR second > b) so that the index on the key is scanned from `values` on.
+        """
+        op = 'lt' if descending else 'gt'
+        if len(keys) == 1:
+            return objects.filter(**{'%s__%s' % (keys[0], op): values[0]})
+        return objects.filter(**{'%s__%se' % (keys[0], op): values[0]}).filter(
+            Q(**{'%s__%s' % (keys[0], op): values[0]}) | Q(**{'%s__%s' % (keys[1], op): values[1]}))
+
+    def cursor_uri(self, limit, order_by, keys, obj, backwards):
+        if self.resource_uri is None:
+            return None
+        values = []
+        for key in keys:
+            # a model instance or a values() row (see ValuesListMixin)
+            value = obj[key] if isinstance(obj, dict) else getattr(obj, key)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        cursor = base64.urlsafe_b64encode(json.dumps({'o': order_by, 'b': backwards, 'k': values},
+                                                     separators=(',', ':'))).rstrip('=')
+        request_params = self.request_data.copy()
+        for name in ('limit', 'offset', 'cursor'):
+            request_params.pop(name, None)
+        request_params.update({'limit': limit, 'cursor': cursor})
+        return '%s?%s' % (self.resource_uri, request_params.urlencode())
+
+    @staticmethod
+    def decode_cursor(cursor, order_by, keys):
+        """
+        Returns (backwards, key values) of a cursor made by cursor_uri() for the same order_by.
+        """
+        try:
+            data = json.loads(base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)))
+            values = data['k']
+            if data['o'] != order_by or len(values) != len(keys):
+                raise ValueError
+            for position, key in enumerate(keys):
+                if key == 'id':
+                    values[position] = int(values[position])
+                else:
+                    values[position] = parse_datetime(values[position])
+                    if values[position] is None:
+                        raise ValueError
+            return bool(data['b']), values
+        except Exception:
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+
+class SparseFieldsMixin(object):
+    """
+    Sparse fieldsets and opt-in nested resources for ModelResources.
+
+    `?fields=id,name,status` serializes only the listed fields (plus `id` and `resource_uri`); lists also load
+    only the columns (QuerySet.only()) and the related objects those fields need. The nested resources of
+    `expandable_fields` ({name: [resource fields]}) are left out of lists unless they are asked for with
+    `?expand=name` or listed in `fields`; detail responses without `fields` have all of them.
+    This only applies to the resource of the request: nested resources are serialized in full.
+
+    `field_columns` ({resource field: [model fields]}) lists the columns needed by fields that are computed in
+    dehydrate, `field_prefetches` ({resource field: [lookups]}) the prefetch_related() lookups a field needs.
+    """
+    expandable_fields = {}
+    field_columns = {}
+    field_prefetches = {}
+    always_fields = ['id', 'resource_uri']
+
+    def selected_fields(self, request, for_list):
+        """
+        The names of the resource fields to serialize for `request`, or None for all of them.
+        """
+        resolver_match = getattr(request, 'resolver_match', None)
+        if resolver_match is None or resolver_match.kwargs.get('resource_name') != self._meta.resource_name:
+            return None
+        requested = set(name for name in request.GET.get('fields', '').split(',') if name)
+        expand = set(name for name in request.GET.get('expand', '').split(',') if name)
+        unknown = (expand - set(self.expandable_fields)) | (requested - set(self.fields) - set(self.expandable_fields))
+        if unknown:
+            raise BadRequest("Invalid fields '%s' requested." % ', '.join(sorted(unknown)))
+        if requested:
+            selected = requested | set(self.always_fields)
+            expand |= requested
+        elif for_list:
+            selected = set(self.fields)
+        else:
+            return None
+        for name, fields in self.expandable_fields.items():
+            if name in expand:
+                selected.update(fields)
+            else:
+                selected.difference_update(fields)
+        return selected & set(self.fields)
+
+    def selected_columns(self, request, fields):
+        """
+        The model fields to load for the resource `fields`, including the keys of the pagination.
+        """
+        model = self._meta.object_class
+        columns = set()
+        for name in fields:
+            columns.update(self.field_columns.get(name, ()))
+            attribute = self.fields[name].attribute
+            if attribute and not self.fields[name].is_related:
+                try:
+                    field = model._meta.get_field(attribute)
+                except FieldDoesNotExist:
+                    continue
+                if field.concrete:
+                    columns.add(field.name)
+        order_by = request.GET.get('order_by', 'id').lstrip('-')
+        columns.update(getattr(self._meta.paginator_class, 'orderings', {}).get(order_by, ()))
+        return columns
+
+    def apply_filters(self, request, applicable_filters):
+        objects = super(SparseFieldsMixin, self).apply_filters(request, applicable_filters)
+        fields = self.selected_fields(request, for_list=True)
+        if fields is None:
+            return objects
+        objects = objects.prefetch_related(None).prefetch_related(
+            *[lookup for name in fields for lookup in self.field_prefetches.get(name, ())])
+        if request.GET.get('fields'):
+            objects = objects.only(*self.selected_columns(request, fields))
+        return objects
+
+    def full_dehydrate(self, bundle, for_list=False):
+        fields = self.selected_fields(bundle.request, for_list)
+        if fields is None:
+            return super(SparseFieldsMixin, self).full_dehydrate(bundle, for_list=for_list)
+        # Resource.full_dehydrate, for the selected fields only
+        for field_name, field_object in self.fields.items():
+            if field_name not in fields:
+                continue
+            field_use_in = field_object.use_in
+            if callable(field_use_in):
+                if not field_use_in(bundle):
+                    continue
+            elif field_use_in not in ['all', 'list' if for_list else 'detail']:
+                continue
+            if field_object.dehydrated_type == 'related':
+                field_object.api_name = self._meta.api_name
+                field_object.resource_name = self._meta.resource_name
+            bundle.data[field_name] = field_object.dehydrate(bundle, for_list=for_list)
+            method = getattr(self, 'dehydrate_%s' % field_name, None)
+            if method:
+                bundle.data[field_name] = method(bundle)
+        return self.dehydrate(bundle)
+
+
+class ValuesListMixin(object):
+    """
+    List responses built from QuerySet.values() rows instead of model instances and bundles, for resources that
+    are SparseFieldsMixin resources too.
+
+    Fields whose attribute is a column are read from the row and converted by the field, like full_dehydrate()
+    does, and resource_uri is built from the id. Nested resources (a full ToManyField over a reverse foreign key
+    whose resource is a ValuesListMixin one too) are loaded for the whole page with one values() query and
+    grouped by their foreign key in Python. The other fields are set to None and left to values_dehydrate(),
+    which gets all the rows of the page at once: that's where the fields computed in dehydrate() are filled in.
+    dehydrate_<field> methods (other than resource_uri's) and callable use_in are not supported; lists with other
+    related fields are built the tastypie way.
+
+    The responses are the same as with model instances; API_VALUES_LISTS = False builds them the tastypie way.
+    """
+
+    def values_dehydrate(self, request, objects):
+        """
+        Fill in the computed fields of the (row, data) `objects`, like dehydrate() does for a bundle.
+        """
+        pass
+
+    def values_fields(self, request, for_list):
+        fields = self.selected_fields(request, for_list)
+        if fields is None:
+            fields = set(self.fields)
+        return [(name, field) for name, field in self.fields.items() if name in fields and
+                field.use_in in ('all', 'list' if for_list else 'detail')]
+
+    def values_rows(self, request, objects, fields, extra_columns=()):
+        """
+        The values() rows of `objects` (a QuerySet) with the columns that the `fields` need.
+        """
+        model = self._meta.object_class
+        columns = set([model._meta.pk.attname]) | set(extra_columns)
+        columns.update(model._meta.get_field(name).attname
+                       for name in self.selected_columns(request, [name for name, field in fields]))
+        return objects.prefetch_related(None).values(*columns)
+
+    def values_supported(self, request, fields, for_list):
+        """
+        Whether dehydrate_rows() can serialize the `fields`, nested ones included.
+        """
+        model = self._meta.object_class
+        for name, field in fields:
+            if not field.is_related:
+                continue
+            resource = field.to_class()
+            try:
+                relation = model._meta.get_field(field.attribute)
+            except FieldDoesNotExist:
+                return False
+            if not (field.should_full_dehydrate(self.build_bundle(request=request), for_list) and
+                    relation.one_to_many and isinstance(resource, ValuesListMixin) and
+                    resource.values_supported(request, resource.values_fields(request, for_list), for_list)):
+                return False
+        return True
+
+    def dehydrate_rows(self, request, rows, fields, for_list):
+        """
+        The serializable data of the values() `rows`, as full_dehydrate() would make it for their objects.
+        """
+        model = self._meta.object_class
+        pk = model._meta.pk.attname
+        uri_prefix = self.get_resource_uri()
+        columns, nested, computed = [], [], []
+        for name, field in fields:
+            if name == 'resource_uri':
+                continue
+            if field.is_related:
+                nested.append((name, field))
+                continue
+            try:
+                column = model._meta.get_field(field.attribute).attname if field.attribute else None
+            except FieldDoesNotExist:
+                column = None
+            if column:
+                columns.append((name, field, column))
+            else:
+                computed.append(name)
+
+        objects = []
+        for row in rows:
+            data = dict.fromkeys(computed)
+            for name, field, column in columns:
+                value = row[column]
+                if value is None:
+                    if field.has_default():
+                        value = field._default
+                    elif not field.null:
+                        raise ApiFieldError("The object '%r' has an empty attribute '%s' and doesn't allow a default "
+                                            "or null value." % (row, field.attribute))
+                data[name] = field.convert(value)
+            if any(name == 'resource_uri' for name, field in fields):
+                data['resource_uri'] = '%s%s/' % (uri_prefix, row[pk])
+            objects.append((row, data))
+
+        ids = [row[pk] for row in rows]
+        for name, field in nested:
+            resource = field.to_class()
+            relation = model._meta.get_field(field.attribute)
+            if not (field.should_full_dehydrate(self.build_bundle(request=request), for_list) and
+                    relation.one_to_many and isinstance(resource, ValuesListMixin)):
+                raise NotImplementedError("%s can't be serialized from values()." % name)
+            foreign_key = relation.field.attname
+            nested_fields = resource.values_fields(request, for_list)
+            nested_rows = list(resource.values_rows(
+                request, relation.related_model._default_manager.filter(**{'%s__in' % foreign_key: ids}),
+                nested_fields, extra_columns=[foreign_key]).order_by(relation.related_model._meta.pk.attname))
+            by_parent = {}
+            for nested_row, nested_data in zip(nested_rows,
+                                               resource.dehydrate_rows(request, nested_rows, nested_fields, for_list)):
+                by_parent.setdefault(nested_row[foreign_key], []).append(nested_data)
+            for row, data in objects:
+                data[name] = by_parent.get(row[pk], [])
+
+        self.values_dehydrate(request, objects)
+        return [data for row, data in objects]
+
+    def get_list(self, request, **kwargs):
+        fields = self.values_fields(request, for_list=True)
+        if not getattr(settings, 'API_VALUES_LISTS', True) or not self.values_supported(request, fields, True):
+            return super(ValuesListMixin, self).get_list(request, **kwargs)
+        # ModelResource.get_list, with values() rows
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+
+        paginator = self._meta.paginator_class(request.GET, self.values_rows(request, sorted_objects, fields),
+                                               resource_uri=self.get_resource_uri(), limit=self._meta.limit,
+                                               max_limit=self._meta.max_limit, collection_name=self._meta.collection_name)
+        to_be_serialized = paginator.page()
+        rows = list(to_be_serialized[self._meta.collection_name])
+        to_be_serialized[self._meta.collection_name] = self.dehydrate_rows(request, rows, fields, for_list=True)
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.create_response(request, to_be_serialized)
+
+
+class StreamingListMixin(object):
+    """
+    Streamed list responses for full exports, on top of ValuesListMixin and KeysetPaginator.
+
+    `?stream=jsonl` writes one JSON object per line (JSON Lines), `?stream=json` a JSON array of the objects.
+    Either way there's no pagination and no meta: the objects are read API_STREAM_CHUNK_SIZE at a time (see
+    KeysetPaginator.chunks(); `order_by` applies), their nested objects are loaded per chunk, and each chunk is
+    serialized and sent before the next one is read, so memory doesn't grow with the number of objects.
+    The other query parameters (filters, fields, expand) apply as for the other lists.
+    """
+    stream_content_types = {
+        'json': 'application/json',
+        'jsonl': 'application/x-ndjson',
+    }
+
+    def get_list(self, request, **kwargs):
+        stream = request.GET.get('stream')
+        if stream is None:
+            return super(StreamingListMixin, self).get_list(request, **kwargs)
+        if stream not in self.stream_content_types:
+            raise BadRequest("Invalid stream '%s' provided. Please use one of: %s." % (
+                stream, ', '.join(sorted(self.stream_content_types))))
+        fields = self.values_fields(request, for_list=True)
+        if not self.values_supported(request, fields, True):
+            raise BadRequest("These fields can't be streamed, leave stream out.")
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        paginator = self._meta.paginator_class(request.GET, self.values_rows(request, objects, fields),
+                                               collection_name=self._meta.collection_name)
+        # invalid order_by: a 400 now rather than a broken stream
+        paginator.get_ordering()
+        request._stream_response = StreamingHttpResponse(self.stream_content(request, paginator, fields, stream),
+                                                         content_type=self.stream_content_types[stream])
+        return request._stream_response
+
+    def dispatch(self, request_type, request, **kwargs):
+        response = super(StreamingListMixin, self).dispatch(request_type, request, **kwargs)
+        # Resource.dispatch() answers 204 to anything that isn't an HttpResponse
+        return getattr(request, '_stream_response', None) or response
+
+    def stream_content(self, request, paginator, fields, stream):
+        to_json = self._meta.serializer.to_json
+        chunks = (self.dehydrate_rows(request, rows, fields, for_list=True)
+                  for rows in paginator.chunks(getattr(settings, 'API_STREAM_CHUNK_SIZE', 500)))
+        if stream == 'jsonl':
+            for objects in chunks:
+                yield ''.join(to_json(data) + '\n' for data in objects)
+        else:
+            yield '['
+            separator = ''
+            for objects in chunks:
+                yield separator + ','.join(to_json(data) for data in objects)
+                separator = ','
+            yield ']'
+
+
+class ConditionalGetMixin(object):
+    """
+    Conditional GET for ModelResources whose model has an `updated` (auto_now) field.
+
+    List and detail responses get an ETag and a Last-Modified header computed with one aggregate query over the
+    objects the request returns (all the pages of a list): max(updated) and count, and the same for the nested
+    objects that are serialized too (nested_validator_aggregates). A request with that ETag in If-None-Match gets
+    a 304 without any object being loaded or serialized. If-Modified-Since alone is only trusted for details
+    without nested objects: a deletion doesn't change a max(updated).
+    Writes that don't set `updated` (QuerySet.update() and such) are not noticed.
+    """
+
+    def nested_validator_aggregates(self, request, for_list):
+        """
+        Aggregates (name: expression) over the nested objects serialized with the response. The max_* ones are
+        datetimes and count for Last-Modified.
+        """
+        return {}
+
+    def check_validators(self, request, objects, for_list):
+        """
+        Returns (a 304 response if the client has the current representation or None, the validator headers).
+        """
+        nested = self.nested_validator_aggregates(request, for_list)
+        values = objects.order_by().aggregate(max_updated=Max('updated'), count=Count('id', distinct=True), **nested)
+        if not for_list and not values['count']:
+            # not found, or not allowed: up to get_detail()
+            return None, {}
+        modified = [value for name, value in values.items() if name.startswith('max_') and value is not None]
+        last_modified = timegm(max(modified).utctimetuple()) if modified else None
+        # the representation also depends on the query string (page, fields...) and the format
+        etag = hashlib.md5(repr([request.get_full_path(), self.determine_format(request)] +
+                                sorted(values.items()))).hexdigest()
+
+        headers = {'ETag': quote_etag(etag)}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+        if if_none_match:
+            not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+        else:
+            not_modified = (if_modified_since is not None and last_modified is not None and not for_list and
+                            not nested and last_modified <= if_modified_since)
+        return HttpNotModified() if not_modified else None, headers
+
+    def get_list(self, request, **kwargs):
+        bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=bundle, **self.remove_api_resource_names(kwargs))
+        not_modified, headers = self.check_validators(request, objects, for_list=True)
+        response = not_modified or super(ConditionalGetMixin, self).get_list(request, **kwargs)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def get_detail(self, request, **kwargs):
+        bundle = self.build_bundle(request=request)
+        try:
+            objects = self.authorized_read_list(
+                self.get_object_list(request).filter(**self.remove_api_resource_names(kwargs)), bundle)
+            not_modified, headers = self.check_validators(request, objects, for_list=False)
+        except ValueError:
+            not_modified, headers = None, {}
+        response = not_modified or super(ConditionalGetMixin, self).get_detail(request, **kwargs)
+        if response.status_code == 200 or response is not_modified:
+            for name, value in headers.items():
+                response[name] = value
+        return response
+
+
+class CachedDetailMixin(object):
+    """
+    Serve detail GETs from the response cache (cedar_fe.response_cache), keyed by the resource, the object id,
+    the format, the query string and the authorization scope of the user (account.auth.authorization_scope).
+    Hits cost no query at all, and answer If-None-Match with the ETag of the cached response.
+    The objects must drop their entries when they change, see ResponseCache.invalidate(). Responses read from a
+    replica (cedar_fe.db_router) aren't cached: it can lag behind the invalidations.
+    """
+    cached_headers = ['ETag', 'Last-Modified']
+
+    def get_detail(self, request, **kwargs):
+        id = kwargs.get(self._meta.detail_uri_name)
+        # If-Modified-Since alone is left to ConditionalGetMixin
+        if_modified_since = 'HTTP_IF_MODIFIED_SINCE' in request.META and 'HTTP_IF_NONE_MATCH' not in request.META
+        if not response_cache.enabled or id is None or not request.user.is_authenticated() or if_modified_since:
+            return super(CachedDetailMixin, self).get_detail(request, **kwargs)
+        variant = (self.determine_format(request), request.get_full_path(), auth.authorization_scope(request.user))
+        version, entry = response_cache.get(self._meta.resource_name, id, variant)
+        if entry is not None:
+            content, content_type, headers = entry
+            if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+            if if_none_match and 'ETag' in headers and headers['ETag'].strip('"') in parse_etags(if_none_match):
+                response = HttpNotModified()
+            else:
+                response = HttpResponse(content, content_type=content_type)
+            for name, value in headers.items():
+                response[name] = value
+            return response
+
+        response = super(CachedDetailMixin, self).get_detail(request, **kwargs)
+        if response.status_code == 200 and not reading_from_replica():
+            headers = dict((name, response[name]) for name in self.cached_headers if response.has_header(name))
+            response_cache.set(self._meta.resource_name, id, variant, version,
+                               (response.content, response['Content-Type'], headers))
+        return response
+
+
 class ApiResourceTestCaseMixin(ResourceTestCaseMixin):
     """
     API tests should extend this because ResourceTestCaseMixin does not have a method for creating a OAuth2 client.
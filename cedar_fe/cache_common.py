@@ -0,0 +1,24 @@
+import logging
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger('log_file')
+
+# (alias, setting) already warned about
+_local_warned = set()
+
+
+def shared_cache(alias, setting):
+    """
+    The cache `alias`, which should be seen by all the processes (e.g. memcached) since what the `setting` cache
+    holds is written by one process and read by the others. A LocMemCache only does for a single process: it is
+    used, with a warning.
+    """
+    cache = caches[alias]
+    if isinstance(cache, LocMemCache) and (alias, setting) not in _local_warned:
+        _local_warned.add((alias, setting))
+        logger.warning("%s: the %r cache is local to each process, the other processes won't see what this one "
+                       "writes there: use one shared by all the processes (e.g. memcached) unless there is only "
+                       "one.", setting, alias)
+    return cache
@@ -0,0 +1,99 @@
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField, Case, When, Value
+
+
+def bulk_update(model, objs, fields):
+    """
+    Update `fields` of all `objs` (saved instances of `model`) with a single UPDATE ... SET f = CASE id ... END.
+
+    Like QuerySet.update() this doesn't call save() or send any signals.
+    Returns the number of updated rows.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    if len(objs) == 1:
+        attnames = [model._meta.get_field(f).attname for f in fields]
+        return model.objects.filter(pk=objs[0].pk).update(**dict((a, getattr(objs[0], a)) for a in attnames))
+
+    values = {}
+    for field_name in fields:
+        field = model._meta.get_field(field_name)
+        values[field.attname] = Case(*[When(pk=obj.pk, then=Value(getattr(obj, field.attname))) for obj in objs],
+                                     output_field=field)
+    return model.objects.filter(pk__in=[obj.pk for obj in objs]).update(**values)
+
+
+def bulk_create_with_ids(model, objs):
+    """
+    Insert all `objs` and set their primary keys, which QuerySet.bulk_create() doesn't do.
+
+    On PostgreSQL the ids are reserved from the table's sequence with one query and the rows are written with a
+    single bulk INSERT. On sqlite (development) a multi-row INSERT gets consecutive ids, so they are worked out
+    from last_insert_rowid() after each batch. Other backends insert row by row.
+    Like bulk_create() this doesn't call save() or send any signals.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)",
+                       [model._meta.db_table, model._meta.pk.column, len(objs)])
+        for obj, (pk,) in zip(objs, cursor.fetchall()):
+            obj.pk = pk
+        model.objects.using(connection.alias).bulk_create(objs)
+    elif connection.vendor == 'sqlite':
+        fields = [f for f in model._meta.local_concrete_fields if not isinstance(f, AutoField)]
+        batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+        cursor = connection.cursor()
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            model.objects.using(connection.alias).bulk_create(batch)
+            cursor.execute("SELECT last_insert_rowid()")
+            last_id = cursor.fetchone()[0]
+            for pk, obj in enumerate(batch, last_id - len(batch) + 1):
+                obj.pk = pk
+    else:
+        fields = [f for f in model._meta.local_concrete_fields if not isinstance(f, AutoField)]
+        for obj in objs:
+            obj.pk = model._base_manager._insert([obj], fields=fields, return_id=True, using=connection.alias)
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = connection.alias
+    return objs
+
+
+def on_commit(func, using=None):
+    """
+    Call func() once the transaction in progress on `using` is committed, right away if there is none; it is
+    dropped if the transaction is rolled back (Django 1.9 has transaction.on_commit()).
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        func()
+        return
+    if '_commit_callbacks' not in connection.__dict__:
+        _hook_commit(connection)
+    connection._commit_callbacks.append(func)
+
+
+def _hook_commit(connection):
+    # Atomic.__exit__ of the outermost block ends with connection.commit() or connection.rollback()
+    commit, rollback = connection.commit, connection.rollback
+    connection._commit_callbacks = []
+
+    def commit_and_call():
+        commit()
+        callbacks, connection._commit_callbacks = connection._commit_callbacks, []
+        for func in callbacks:
+            func()
+
+    def rollback_and_drop():
+        connection._commit_callbacks = []
+        rollback()
+
+    connection.commit = commit_and_call
+    connection.rollback = rollback_and_drop
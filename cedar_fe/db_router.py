@@ -0,0 +1,147 @@
+"""
+Routing of the API reads to the database replicas.
+
+DATABASE_REPLICAS lists the DATABASES aliases that replicate 'default'. The reads of an API request with a safe
+method (GET, HEAD, OPTIONS) go to one of them, picked for the whole request, from the view on: the OAuth token
+verification, its AuthLog and everything outside of a request (commands, the background writers) stay on the
+primary, as do all the writes and the reads of any other request or inside a transaction of the primary.
+
+Replicas lag behind: a client that sent a write (an API request with an unsafe method) is pinned to the primary
+for DATABASE_PRIMARY_PIN_SECONDS, so its next reads see its writes. Pins are kept in one of the CACHES
+(DATABASE_PRIMARY_PIN_CACHE), keyed by user, which must be shared by the API processes when there are several. Detail responses read
+from a replica are not stored in the response cache (see api_common.CachedDetailMixin).
+
+    DATABASE_ROUTERS = ['cedar_fe.db_router.ReplicaRouter']
+    DATABASE_REPLICAS = ['replica']
+    MIDDLEWARE_CLASSES / API_MIDDLEWARE_CLASSES: 'cedar_fe.db_router.ReplicaMiddleware' after the authentication
+"""
+
+import random
+import threading
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from cedar_fe.cache_common import shared_cache
+
+PIN_KEY = 'db_primary_pin:%s'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaState(threading.local):
+    # alias of the replica the reads of the current thread go to, None: the primary
+    alias = None
+
+
+_state = ReplicaState()
+
+
+def replica_aliases():
+    return tuple(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def reading_from_replica():
+    """
+    Whether the reads of the current request go to a replica, which may lag behind the primary.
+    """
+    return _state.alias is not None
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if _state.alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _state.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = (DEFAULT_DB_ALIAS,) + replica_aliases()
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model=None, **hints):
+        # the replicas get their schema from the primary
+        return False if db in replica_aliases() else None
+
+
+class PrimaryPins(object):
+    """
+    Clients that read from the primary for `seconds` after they wrote.
+    """
+
+    def __init__(self, alias='default', seconds=5):
+        self.alias = alias
+        self.seconds = seconds
+
+    @property
+    def cache(self):
+        return shared_cache(self.alias, 'DATABASE_PRIMARY_PIN_CACHE')
+
+    def pin(self, client):
+        if self.seconds > 0:
+            self.cache.set(PIN_KEY % client, True, self.seconds)
+
+    def pinned(self, client):
+        return self.seconds > 0 and self.cache.get(PIN_KEY % client) is not None
+
+
+primary_pins = PrimaryPins(alias=getattr(settings, 'DATABASE_PRIMARY_PIN_CACHE', 'default'),
+                           seconds=getattr(settings, 'DATABASE_PRIMARY_PIN_SECONDS', 5))
+
+
+def _client(request):
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated() else None
+
+
+def _read_from(alias, iterable):
+    # the reads of a streamed response happen while it is sent, after process_response
+    iterator = iter(iterable)
+    while True:
+        _state.alias = alias
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.alias = None
+        yield chunk
+
+
+class ReplicaMiddleware(object):
+    """
+    Sends the reads of the API requests with a safe method to a replica, unless their client is pinned to the
+    primary; pins the clients of the other API requests.
+    """
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+        if not self.replicas:
+            raise MiddlewareNotUsed
+        # a pin must be seen by the process that serves the client's next request: warns now about a local cache
+        if primary_pins.seconds > 0:
+            shared_cache(primary_pins.alias, 'DATABASE_PRIMARY_PIN_CACHE')
+        self.api_prefixes = tuple(getattr(settings, 'API_URL_PREFIXES', ('/api/',)))
+
+    def process_view(self, request, view, *args, **kwargs):
+        _state.alias = None
+        if not request.path_info.startswith(self.api_prefixes):
+            return
+        client = _client(request)
+        if request.method not in SAFE_METHODS:
+            request._primary_pin = client
+        elif client is None or not primary_pins.pinned(client):
+            _state.alias = random.choice(self.replicas)
+
+    def process_response(self, request, response):
+        alias, _state.alias = _state.alias, None
+        if getattr(request, '_primary_pin', None) is not None:
+            primary_pins.pin(request._primary_pin)
+        if alias is not None and response.streaming:
+            response.streaming_content = _read_from(alias, response.streaming_content)
+        return response
@@ -0,0 +1,80 @@
+"""
+WSGI handler with a lean middleware pipeline for the API.
+
+The API is authenticated with OAuth access tokens (account.middleware.ApiAuthenticationMiddleware), so requests
+under one of the API_URL_PREFIXES need none of the session, CSRF, messages and clickjacking work of the site
+pages. PrefixDispatchWSGIHandler hands them to a handler that loads API_MIDDLEWARE_CLASSES instead of
+MIDDLEWARE_CLASSES: no session is loaded or saved and no cookie is set. The choice is one str.startswith() on the
+path, before any middleware runs.
+
+MIDDLEWARE_CLASSES stays the complete list (the site pages, the test client and Django's own checks use it), so
+an API request served by another handler still goes through LoginRequiredMiddleware's OAuth authentication.
+"""
+
+import logging
+
+import django
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.wsgi import WSGIHandler
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('django.request')
+
+
+class MiddlewareStackMixin(object):
+    """
+    Loads the middleware listed in the `middleware_setting` setting instead of MIDDLEWARE_CLASSES.
+    """
+    middleware_setting = 'MIDDLEWARE_CLASSES'
+
+    def load_middleware(self):
+        # same as BaseHandler.load_middleware
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._response_middleware = []
+        self._exception_middleware = []
+
+        request_middleware = []
+        for middleware_path in getattr(settings, self.middleware_setting):
+            try:
+                middleware = import_string(middleware_path)()
+            except MiddlewareNotUsed:
+                logger.debug('MiddlewareNotUsed: %r', middleware_path)
+                continue
+            if hasattr(middleware, 'process_request'):
+                request_middleware.append(middleware.process_request)
+            if hasattr(middleware, 'process_view'):
+                self._view_middleware.append(middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self._template_response_middleware.insert(0, middleware.process_template_response)
+            if hasattr(middleware, 'process_response'):
+                self._response_middleware.insert(0, middleware.process_response)
+            if hasattr(middleware, 'process_exception'):
+                self._exception_middleware.insert(0, middleware.process_exception)
+        self._request_middleware = request_middleware
+
+
+class ApiWSGIHandler(MiddlewareStackMixin, WSGIHandler):
+    middleware_setting = 'API_MIDDLEWARE_CLASSES'
+
+
+class PrefixDispatchWSGIHandler(WSGIHandler):
+
+    def __init__(self):
+        super(PrefixDispatchWSGIHandler, self).__init__()
+        self.api_handler = ApiWSGIHandler()
+        self.api_prefixes = tuple(getattr(settings, 'API_URL_PREFIXES', ('/api/',)))
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.api_prefixes):
+            return self.api_handler(environ, start_response)
+        return super(PrefixDispatchWSGIHandler, self).__call__(environ, start_response)
+
+
+def get_wsgi_application():
+    """
+    Like django.core.wsgi.get_wsgi_application, with the API requests dispatched to their own middleware.
+    """
+    django.setup()
+    return PrefixDispatchWSGIHandler()
@@ -0,0 +1,102 @@
+"""
+Cache of serialized API detail responses (see api_common.CachedDetailMixin).
+
+Entries are stored in one of the CACHES (API_RESPONSE_CACHE), which must be shared by all the API processes (e.g. a
+memcached) when there are several, so an invalidation reaches all of them. They are keyed by resource, object id and a variant: format,
+query string and authorization scope of the request. Every object has a version key in the same cache,
+and an entry is only served while the version it was stored with is the current one - invalidating an object
+is replacing its version, which drops all its entries at once whatever their variant. Objects that aren't
+invalidated expire after API_RESPONSE_CACHE_TTL.
+
+Invalidations happen in the transaction of the write (see campaign.models.OutboxEntry.record), and again once it
+is committed: a read racing the write can cache the old body under the new version until then.
+"""
+
+import uuid
+import hashlib
+import threading
+
+from django.conf import settings
+
+from cedar_fe.cache_common import shared_cache
+
+VERSION_KEY = 'api_response_version:%s:%s'
+ENTRY_KEY = 'api_response:%s:%s:%s'
+
+
+class ResponseCache(object):
+
+    def __init__(self, alias='default', ttl=60):
+        self.alias = alias
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    @property
+    def cache(self):
+        return shared_cache(self.alias, 'API_RESPONSE_CACHE')
+
+    @staticmethod
+    def _keys(resource_name, id, variant):
+        return (VERSION_KEY % (resource_name, id),
+                ENTRY_KEY % (resource_name, id, hashlib.md5(repr(variant)).hexdigest()))
+
+    def get(self, resource_name, id, variant):
+        """
+        Returns (version, value): the cached value or None, and the version to pass to set() on a miss.
+        """
+        version_key, key = self._keys(resource_name, id, variant)
+        values = self.cache.get_many([version_key, key])
+        version, entry = values.get(version_key), values.get(key)
+        if version is not None and entry is not None and entry[0] == version:
+            with self._lock:
+                self.hits += 1
+            return version, entry[1]
+        with self._lock:
+            self.misses += 1
+        if version is None:
+            self.cache.add(version_key, uuid.uuid4().hex, None)
+            version = self.cache.get(version_key)
+        return version, None
+
+    def set(self, resource_name, id, variant, version, value):
+        """
+        Store a value built after get() returned `version`; it's never served if the object changed meanwhile.
+        """
+        if version is None:
+            return
+        version_key, key = self._keys(resource_name, id, variant)
+        self.cache.set(key, (version, value), self.ttl)
+
+    def invalidate(self, objects):
+        """
+        Drop the entries of the (resource_name, id) `objects`.
+        """
+        objects = set(objects)
+        if not objects or not self.enabled:
+            return
+        self.cache.set_many(dict((VERSION_KEY % obj, uuid.uuid4().hex) for obj in objects), None)
+        with self._lock:
+            self.invalidations += len(objects)
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations,
+                    'hit_ratio': float(self.hits) / requests if requests else 0.0}
+
+
+response_cache = ResponseCache(alias=getattr(settings, 'API_RESPONSE_CACHE', 'default'),
+                               ttl=getattr(settings, 'API_RESPONSE_CACHE_TTL', 60))
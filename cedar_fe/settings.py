@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -64,11 +65,22 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'account.middleware.LoginRequiredMiddleware',
+    'cedar_fe.db_router.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
 )
 
+# Requests under API_URL_PREFIXES are served with the API_MIDDLEWARE_CLASSES instead (see cedar_fe.handlers): they
+# are authenticated with OAuth access tokens only, without session, CSRF, messages or clickjacking middleware.
+API_URL_PREFIXES = ('/api/',)
+API_MIDDLEWARE_CLASSES = (
+    'django.middleware.common.CommonMiddleware',
+    'account.middleware.ApiAuthenticationMiddleware',
+    'cedar_fe.db_router.ReplicaMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+)
+
 ROOT_URLCONF = 'cedar_fe.urls'
 
 TEMPLATES = [
@@ -105,6 +117,34 @@ DATABASES = {
     }
 }
 
+# The reads of the API requests with a safe method go to one of these DATABASES aliases, replicas of 'default'
+# (see cedar_fe.db_router); the writes go to 'default'. A client that writes reads from 'default' for
+# DATABASE_PRIMARY_PIN_SECONDS afterwards, so it sees its own writes. Its pin is kept in the
+# DATABASE_PRIMARY_PIN_CACHE, which must be shared by the API processes. No replicas: everything on 'default'.
+DATABASE_ROUTERS = ['cedar_fe.db_router.ReplicaRouter']
+DATABASE_REPLICAS = []
+DATABASE_PRIMARY_PIN_CACHE = 'shared'
+DATABASE_PRIMARY_PIN_SECONDS = 5
+
+
+# Caches
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # what a process writes there must be seen by the others: the API response cache, the replica pins, the
+    # account reps' advertisers. A LocMemCache only does for a single process (e.g. runserver); in production use
+    # one shared by all the processes:
+    #   'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+    #   'LOCATION': '127.0.0.1:11211',
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shared',
+    },
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.8/topics/i18n/
@@ -141,3 +181,48 @@ LOGIN_EXEMPT_URLS = (
     '/test_api'
 )
 
+# Verified OAuth access tokens are cached per process (see account.token_cache).
+# Set either value to 0 to disable the cache.
+OAUTH_TOKEN_CACHE_SIZE = 1024
+OAUTH_TOKEN_CACHE_TTL = 60  # seconds
+
+# The advertiser ids of each account rep are cached in this cache (see account.models.AccountRepAdvertiser), which
+# must be shared by the API processes so a removed assignment stops granting access in all of them.
+ACCOUNT_REP_CACHE = 'shared'
+
+# API authentication attempts are logged through a buffered writer (see account.authlog).
+# Tests write AuthLog rows synchronously so they can be asserted on right away.
+AUTHLOG_ASYNC = 'test' not in sys.argv
+AUTHLOG_BATCH_SIZE = 500
+AUTHLOG_FLUSH_INTERVAL = 2.0  # seconds
+AUTHLOG_QUEUE_SIZE = 10000
+
+# Seconds between the checks of the category hierarchy version in the database, after which the in-memory
+# copies (see config.categories) reload: a category change made by another process shows within that time.
+CATEGORY_TREE_CHECK_INTERVAL = 5
+
+# Delta bidder snapshots also take the rows stamped this many seconds before their `since`, for the transactions
+# that committed after the previous snapshot was generated (see campaign.snapshot).
+SNAPSHOT_DELTA_MARGIN = 60  # seconds
+
+# Campaign spend is counted in memory and written to the ledger every SPEND_FLUSH_INTERVAL seconds
+# (see campaign.spend).
+SPEND_FLUSH_INTERVAL = 10.0  # seconds
+
+# Campaign and nativead detail responses are cached in this cache (see cedar_fe.response_cache), which must be
+# shared by the API processes. Set the TTL to 0 to disable the cache.
+API_RESPONSE_CACHE = 'shared'
+API_RESPONSE_CACHE_TTL = 60  # seconds
+
+# Prefix of the image asset filenames in the OpenRTB native payloads (see campaign.openrtb): the http(s) URL the
+# asset files are served from, the system checks warn while it isn't set. Run the compile_native_payloads command
+# after changing it.
+NATIVE_IMAGE_BASE_URL = ''
+
+# API list responses are built from QuerySet.values() rows rather than model instances (see
+# cedar_fe.api_common.ValuesListMixin); False builds them through tastypie's bundles.
+API_VALUES_LISTS = True
+
+# Streamed API lists (?stream=jsonl or json, see cedar_fe.api_common.StreamingListMixin) are read, serialized and
+# sent this many objects at a time.
+API_STREAM_CHUNK_SIZE = 500
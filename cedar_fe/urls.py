@@ -20,7 +20,7 @@ from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from tastypie.api import Api
 
 from test_api import urls as test_api_urls
-from campaign.api import CampaignResource, NativeAdResource
+from campaign.api import CampaignResource, NativeAdResource, EffectiveBidResource
 
 admin.autodiscover()
 
@@ -39,7 +39,10 @@ urlpatterns += staticfiles_urlpatterns()
 v1_api = Api(api_name='v1')
 v1_api.register(CampaignResource())
 v1_api.register(NativeAdResource())
+v1_api.register(EffectiveBidResource())
 
 urlpatterns += [
+    # under /api/ so the bidder authenticates with OAuth like the other API clients
+    url(r'^api/bidder/', include('campaign.urls', namespace = 'bidder')),
     url(r'^api/', include(v1_api.urls)),
 ]
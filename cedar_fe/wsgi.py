@@ -9,8 +9,9 @@ https://docs.djangoproject.com/en/1.8/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cedar_fe.settings")
 
+# the API requests skip the session middleware, see cedar_fe.handlers
+from cedar_fe.handlers import get_wsgi_application
+
 application = get_wsgi_application()
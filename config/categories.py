@@ -0,0 +1,83 @@
+"""
+In-memory copy of the category hierarchy, for lookups on the hot path without any query:
+
+    tree = category_tree()
+    tree.subtree(category_id)     # sorted ids of the category and all its descendants
+    tree.ancestors(category_id)   # ids from the top level category down to category_id
+
+The tree is loaded from CategoryClosure (two queries) and reloaded after any category change. category_tree()
+compares the version of the categories in the database (Category.tree_version(), one query) with the one it loaded
+at most every CATEGORY_TREE_CHECK_INTERVAL seconds, so the changes made by another process show within that
+time; the changes made by this process are seen on the next call.
+"""
+
+import time
+import threading
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from config.models import Category, CategoryClosure
+
+
+class CategoryTree(object):
+
+    def __init__(self, categories, links):
+        """
+        @param categories: (id, code) pairs
+        @param links: (ancestor_id, descendant_id, depth) closure rows
+        """
+        self.ids_by_code = dict((code, id) for id, code in categories)
+        self.codes = dict((id, code) for id, code in categories)
+        descendants, ancestors = {}, {}
+        for ancestor_id, descendant_id, depth in links:
+            descendants.setdefault(ancestor_id, []).append(descendant_id)
+            ancestors.setdefault(descendant_id, []).append((depth, ancestor_id))
+        self._descendants = dict((id, tuple(sorted(ids))) for id, ids in descendants.items())
+        self._ancestors = dict((id, tuple(a for d, a in sorted(pairs, reverse=True))) for id, pairs in ancestors.items())
+
+    @classmethod
+    def load(cls):
+        return cls(Category.objects.values_list('id', 'code'),
+                   CategoryClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+
+    def subtree(self, category_id):
+        return self._descendants.get(category_id, ())
+
+    def ancestors(self, category_id):
+        return self._ancestors.get(category_id, ())
+
+    def subtree_by_code(self, code):
+        return self.subtree(self.ids_by_code.get(code))
+
+
+_tree = None
+_version = None
+# time.time() of the last version check, None: check on the next call
+_checked = None
+_lock = threading.Lock()
+
+
+def category_tree():
+    """
+    The current CategoryTree, reloaded if the categories changed since it was loaded.
+    """
+    global _tree, _version, _checked
+    now = time.time()
+    if _tree is not None and _checked is not None and \
+            now - _checked < getattr(settings, 'CATEGORY_TREE_CHECK_INTERVAL', 5):
+        return _tree
+    with _lock:
+        # the version is read before loading: a change made meanwhile triggers another reload
+        version = Category.tree_version()
+        if _tree is None or version != _version:
+            _tree, _version = CategoryTree.load(), version
+        _checked = now
+    return _tree
+
+
+@receiver([post_save, post_delete], sender=Category, dispatch_uid='category_tree_version')
+def expire_category_tree(sender, **kwargs):
+    global _checked
+    _checked = None
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RenameModel(
+            old_name='IABCategory',
+            new_name='Category',
+        ),
+        migrations.RenameModel(
+            old_name='Platform',
+            new_name='Device',
+        ),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def build_closure(apps, schema_editor):
+    Category = apps.get_model('config', 'Category')
+    CategoryClosure = apps.get_model('config', 'CategoryClosure')
+    # top level categories used to point to themselves
+    Category.objects.filter(parent_id=models.F('id')).update(parent=None)
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    links = []
+    for category_id in parents:
+        ancestor_id, depth = category_id, 0
+        while ancestor_id is not None:
+            links.append(CategoryClosure(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            ancestor_id, depth = parents[ancestor_id], depth + 1
+    CategoryClosure.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryClosure',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('depth', models.IntegerField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(related_name='children', blank=True, to='config.Category', null=True),
+        ),
+        migrations.AddField(
+            model_name='categoryclosure',
+            name='ancestor',
+            field=models.ForeignKey(related_name='descendant_links', to='config.Category'),
+        ),
+        migrations.AddField(
+            model_name='categoryclosure',
+            name='descendant',
+            field=models.ForeignKey(related_name='ancestor_links', to='config.Category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='categoryclosure',
+            index_together=set([('descendant', 'depth')]),
+        ),
+        migrations.RunPython(build_closure, migrations.RunPython.noop),
+    ]
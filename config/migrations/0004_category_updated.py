@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('config', '0003_categoryclosure'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now, auto_now=True),
+            preserve_default=False,
+        ),
+    ]
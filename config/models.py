@@ -1,5 +1,6 @@
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Max
 
 
 class Geo(models.Model):
@@ -14,15 +15,82 @@ class Device(models.Model):
 class Category(models.Model):
     """
     Defines all the IAB codes and their names + GS categories and names
+
+    The hierarchy (`parent`, null for the top level categories) is also stored in CategoryClosure, kept in
+    sync by save(), so a subtree or an ancestor chain is a single query (see also config.categories).
     """
     
     code = models.CharField(max_length=16, unique=True)
     name = models.CharField(max_length=128)
-    parent = models.ForeignKey("self", related_name="children")
+    parent = models.ForeignKey("self", related_name="children", null=True, blank=True)
+    # with the number of categories, tells in-memory copies of the hierarchy (config.categories) to reload
+    updated = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def tree_version(cls):
+        """
+        Changes whenever a category is created, saved (its hierarchy included) or deleted.
+        """
+        version = cls.objects.aggregate(count=Count('id'), updated=Max('updated'))
+        return version['count'], version['updated']
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            creating = self.pk is None
+            super(Category, self).save(*args, **kwargs)
+            CategoryClosure.link(self, creating)
+
+    def descendants(self):
+        """
+        This category and all the categories below it.
+        """
+        return Category.objects.filter(ancestor_links__ancestor=self)
 
+    def ancestors(self):
+        """
+        The categories from the top level down to this one (included).
+        """
+        return Category.objects.filter(descendant_links__descendant=self).order_by('-descendant_links__depth')
+
+
+class CategoryClosure(models.Model):
+    """
+    Closure table of the category hierarchy: one row for every category and each of its ancestors, itself
+    included (depth 0).
+    """
 
+    ancestor = models.ForeignKey(Category, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, related_name='ancestor_links')
+    depth = models.IntegerField()
 
+    class Meta:
+        unique_together = [('ancestor', 'descendant')]
+        index_together = [('descendant', 'depth')]
 
+    @classmethod
+    def link(cls, category, creating=False):
+        """
+        Add the rows of a new category, or move the subtree of `category` below its (new) parent.
+        """
+        if not creating:
+            current_parent = cls.objects.filter(descendant=category, depth=1).values_list('ancestor_id', flat=True)
+            if list(current_parent) == ([category.parent_id] if category.parent_id else []):
+                return
+        parent_links = list(cls.objects.filter(descendant_id=category.parent_id)) if category.parent_id else []
 
+        if creating:
+            cls.objects.bulk_create([cls(ancestor_id=category.id, descendant_id=category.id, depth=0)] +
+                                    [cls(ancestor_id=link.ancestor_id, descendant_id=category.id, depth=link.depth + 1)
+                                     for link in parent_links])
+            return
 
+        subtree = list(cls.objects.filter(ancestor=category))
+        subtree_ids = [link.descendant_id for link in subtree]
+        if category.parent_id in subtree_ids:
+            raise Exception("Category %s can't be moved below its own descendant %s" % (category.id, category.parent_id))
+        # detach the subtree from its old ancestors, then attach it below the new parent
+        cls.objects.filter(descendant__in=subtree_ids).exclude(ancestor__in=subtree_ids).delete()
+        cls.objects.bulk_create([cls(ancestor_id=link.ancestor_id, descendant_id=node.descendant_id,
+                                     depth=link.depth + node.depth + 1)
+                                 for link in parent_links for node in subtree])
 
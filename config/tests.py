@@ -1,3 +1,73 @@
 from django.test import TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from config.models import Category, CategoryClosure
+from config.categories import category_tree
+
+
+class CategoryClosureTest(TestCase):
+
+    def setUp(self):
+        super(CategoryClosureTest, self).setUp()
+        self.iab1 = Category.objects.create(code='IAB1', name='Arts & Entertainment')
+        self.iab1_1 = Category.objects.create(code='IAB1-1', name='Books & Literature', parent=self.iab1)
+        self.iab1_1_x = Category.objects.create(code='IAB1-1-x', name='Poetry', parent=self.iab1_1)
+        self.iab2 = Category.objects.create(code='IAB2', name='Automotive')
+
+    def ids(self, categories):
+        return [c.id for c in categories]
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(self.ids(self.iab1.descendants())),
+                             [self.iab1.id, self.iab1_1.id, self.iab1_1_x.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.ids(self.iab1_1_x.ancestors()), [self.iab1.id, self.iab1_1.id, self.iab1_1_x.id])
+
+    def test_move(self):
+        self.iab1_1.parent = self.iab2
+        self.iab1_1.save()
+        self.assertEqual(sorted(self.ids(self.iab2.descendants())), [self.iab1_1.id, self.iab1_1_x.id, self.iab2.id])
+        self.assertEqual(self.ids(self.iab1.descendants()), [self.iab1.id])
+        self.assertEqual(self.ids(self.iab1_1_x.ancestors()), [self.iab2.id, self.iab1_1.id, self.iab1_1_x.id])
+        self.assertEqual(CategoryClosure.objects.get(ancestor=self.iab2, descendant=self.iab1_1_x).depth, 2)
+
+        # to the top level
+        self.iab1_1.parent = None
+        self.iab1_1.save()
+        self.assertEqual(self.ids(self.iab1_1_x.ancestors()), [self.iab1_1.id, self.iab1_1_x.id])
+        self.assertEqual(CategoryClosure.objects.count(), 5)
+
+    def test_no_cycles(self):
+        self.iab1.parent = self.iab1_1_x
+        self.assertRaises(Exception, self.iab1.save)
+        self.assertEqual(self.ids(self.iab1_1_x.ancestors()), [self.iab1.id, self.iab1_1.id, self.iab1_1_x.id])
+
+    def test_unchanged_parent(self):
+        self.iab1_1.name = 'Books'
+        with self.assertNumQueries(4):
+            # savepoint, update, current parent, release
+            self.iab1_1.save()
+
+    def test_tree(self):
+        tree = category_tree()
+        with self.assertNumQueries(0):
+            self.assertEqual(category_tree().subtree_by_code('IAB1'), (self.iab1.id, self.iab1_1.id, self.iab1_1_x.id))
+            self.assertEqual(tree.ancestors(self.iab1_1_x.id), (self.iab1.id, self.iab1_1.id, self.iab1_1_x.id))
+            self.assertEqual(tree.subtree(0), ())
+
+        self.iab1_1_x.delete()
+        self.assertEqual(category_tree().subtree(self.iab1.id), (self.iab1.id, self.iab1_1.id))
+        Category.objects.create(code='IAB1-2', name='Celebrity Fan/Gossip', parent=self.iab1)
+        self.assertEqual(len(category_tree().subtree_by_code('IAB1')), 3)
+
+    def test_tree_sees_other_processes_changes(self):
+        category_tree()
+        # no signal in this process, like a change made by another one
+        Category.objects.filter(id=self.iab1_1.id).update(code='IAB1-9', updated=timezone.now())
+        with self.assertNumQueries(0):
+            self.assertEqual(category_tree().codes[self.iab1_1.id], 'IAB1-1')
+        with self.settings(CATEGORY_TREE_CHECK_INTERVAL=0):
+            self.assertEqual(category_tree().codes[self.iab1_1.id], 'IAB1-9')
+            with self.assertNumQueries(1):
+                category_tree()